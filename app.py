@@ -1,27 +1,32 @@
 import os
-import time
 import threading
 import logging
-from flask import Flask, render_template, request, redirect, url_for, flash
+from functools import wraps
+from flask import Flask, render_template, request, redirect, url_for, flash, session
 from flask_socketio import SocketIO, emit
 
-try:
-    import RPi.GPIO as GPIO
-except ImportError:
-    GPIO = None
-
 from config import Config
 from utils import (
-    load_hose_assignments, save_hose_assignments, load_pump_calibrations, save_pump_calibration,
+    load_hose_assignments, save_hose_assignments, load_pump_calibrations,
     load_hose_statuses, save_hose_statuses, load_bottle_volumes, save_bottle_volumes,
-    update_remaining_volume, load_all_recipes, save_all_recipes, get_recipe_by_id,
-    get_available_drinks, get_density, add_density, suggest_substitutes, is_ingredient_available,
-    get_all_ingredients, load_json, DENSITY_FILE
+    load_all_recipes, save_recipe, delete_recipe as delete_saved_recipe,
+    next_drink_id, get_recipe_by_id,
+    get_available_drinks, add_density, suggest_substitutes, is_ingredient_available,
+    get_all_ingredients, load_json, DATA_DIR, DENSITY_FILE, pump_startup_snapshot
 )
+from dispense_plan import batch_volume, compile_plan, dry_run, plan_cache_stats
+from pump_client import get_engine
+from live_state import read_live_state
+from hose_priming import hose_priming
+from calibration_history import calibration_history
+from pump_driver import PUMP_GPIO_PINS
+from order_queue import OrderQueue, DeferShortOrdersPolicy, make_policy
+from volume_forecast import forecast_queue
 
 app = Flask(__name__)
 app.config.from_object(Config)
 socketio = SocketIO(app)
+engine = get_engine()
 
 # Static list of available ingredients for recipes (no longer used)
 # AVAILABLE_INGREDIENTS = [
@@ -33,27 +38,48 @@ socketio = SocketIO(app)
 #    "Vermouth", "Elderflower Liqueur", "Sake"
 # ]
 
-# GPIO Setup
-PUMP_GPIO_PINS = {1: 17, 2: 18, 3: 27, 4: 22, 5: 23, 6: 24, 7: 25, 8: 5}
-if GPIO:
-    GPIO.setmode(GPIO.BCM)
-    for pin in PUMP_GPIO_PINS.values():
-        GPIO.setup(pin, GPIO.OUT)
-        GPIO.output(pin, GPIO.LOW)
-
-# Mixing lock and state (for drink mixing, unchanged)
+# Mixing lock and state
 mixing_lock = threading.Lock()
 is_mixing = False
-mixing_progress = 0.0
+# (order_id, Future) of the drink on the pumps, so it can be cancelled
+current_pour = None
+# Orders cancelled after the dispatcher took them but before their pour was submitted
+cancelled_before_pour = set()
+# Orders this browser placed, the most recent few, so a guest can cancel their own drinks only
+SESSION_ORDERS = 20
+
+def estimate_mix_time(drink_id, total_volume):
+    """Predicted pour time in seconds: the makespan of the drink's cached dispense plan"""
+    compiled = compile_plan(drink_id, total_volume)
+    return compiled.makespan if compiled is not None else 0.0
+
+# Orders are queued and poured one after another by a single dispatcher thread
+ORDER_QUEUE_FILE = os.path.join(DATA_DIR, 'order_queue.json')
+order_policy = make_policy(Config.ORDER_SCHEDULING)
+if Config.DEFER_SHORT_ORDERS:
+    order_policy = DeferShortOrdersPolicy(order_policy, lambda pending: forecast_queue(pending).pourable_now)
+order_queue = OrderQueue(ORDER_QUEUE_FILE, estimate_duration=lambda order: estimate_mix_time(order.drink_id, order.total_volume),
+                         policy=order_policy)
+dispatcher_lock = threading.Lock()
+dispatcher_thread = None
 
 # Calibration data for calibration (press-and-hold)
-CALIBRATION_DATA = {i: {"start_time": None, "last_run_time": 0.0} for i in range(1, 9)}
+CALIBRATION_DATA = {i: {"start_time": None, "last_run_time": 0.0} for i in PUMP_GPIO_PINS}
 # Separate data for priming so they dont interfere
-PRIME_DATA = {i: {"start_time": None, "last_run_time": 0.0} for i in range(1, 9)}
+PRIME_DATA = {i: {"start_time": None, "last_run_time": 0.0} for i in PUMP_GPIO_PINS}
 
 # PIN for settings access
 CORRECT_PIN = "1234"
 
+def staff_only(view):
+    """Maintenance actions: allowed once this browser entered the settings PIN, or with the PIN posted along"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not session.get('staff') and request.form.get('pin') != CORRECT_PIN:
+            return "Staff PIN required", 403
+        return view(*args, **kwargs)
+    return wrapped
+
 # Logging setup
 os.makedirs("logs", exist_ok=True)
 logging.basicConfig(
@@ -64,6 +90,9 @@ logging.basicConfig(
 
 @app.route('/')
 def main():
+    if len(order_queue):
+        # Resume orders restored from disk after a restart
+        ensure_dispatcher()
     drinks = get_available_drinks()
     statuses = load_hose_statuses()
     volumes = load_bottle_volumes()
@@ -87,15 +116,19 @@ def main():
             'percent': percent, 
             'ingredient': assigned_liquid
         }
-    return render_template('main.html', drinks=drinks, hose_status=hose_status, is_mixing=is_mixing)
+    return render_template('main.html', drinks=drinks, hose_status=hose_status, is_mixing=is_mixing,
+                           queue_length=len(order_queue))
 
 @app.route('/mix/<int:drink_id>', methods=['POST'])
 def mix_drink_route(drink_id):
-    global is_mixing, mixing_progress
-    if is_mixing:
-        flash("A drink is already being dispensed")
-        return redirect(url_for('main'))
     total_volume = float(request.form.get('size', 375))
+    servings = request.form.get('servings', 1, type=int)
+    try:
+        # A pitcher or round is one order: every pump runs once for all the servings
+        batch_volume(total_volume, servings)
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('main'))
     recipe = get_recipe_by_id(drink_id)
     if not recipe:
         flash("Recipe not found")
@@ -107,89 +140,192 @@ def mix_drink_route(drink_id):
         return render_template('main.html', drinks=get_available_drinks(),
                                hose_status=load_hose_statuses(), substitutes=substitutes,
                                drink_id=drink_id, size=total_volume)
-    with mixing_lock:
-        is_mixing = True
-        mixing_progress = 0.0
-    threading.Thread(target=mix_drink_thread, args=(drink_id, total_volume)).start()
-    return redirect(url_for('mix_progress'))
-    
+    order = order_queue.submit(drink_id, total_volume, recipe['drink_name'], servings=servings)
+    session['orders'] = (session.get('orders', []) + [order.order_id])[-SESSION_ORDERS:]
+    ensure_dispatcher()
+    broadcast_queue()
+    return redirect(url_for('mix_progress', order_id=order.order_id))
+
+@app.route('/mix/<int:drink_id>/plan')
+def plan_drink(drink_id):
+    """Dry run of an order: which pumps would run, for how long, and whether the bottles suffice"""
+    try:
+        result = dry_run(drink_id, request.args.get('size', 375, type=float), request.args.get('servings', 1, type=int))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    if result is None:
+        return {'error': 'Recipe not found'}, 404
+    result['cache'] = plan_cache_stats()
+    return result
+
 @app.route('/mix_progress')
 def mix_progress():
-    if not is_mixing:
+    order_id = request.args.get('order_id', type=int)
+    orders = order_queue.snapshot()
+    ticket = next((entry for entry in orders if entry['order_id'] == order_id), None)
+    if ticket is None:
+        # Finished or unknown order: the page only ever follows its own order's events
         return redirect(url_for('main'))
-    return render_template('mixing_progress_full.html')
-
-def mix_drink_thread(drink_id, total_volume):
-    global is_mixing, mixing_progress
+    short = queue_shortages(orders)
+    return render_template('mixing_progress_full.html', ticket=ticket,
+                           short_ingredients=shortage_warning(short, ticket))
+
+@app.route('/queue')
+def queue_status():
+    orders = order_queue.snapshot()
+    return {'orders': orders, 'shortages': queue_shortages(orders), 'metrics': order_queue.metrics(),
+            'engine': engine.stop_stats(), 'swaps': engine.swap_stats()}
+
+@app.route('/live_state')
+def live_state():
+    """Pump activity and bottle levels from the shared live state segment, cheap enough to poll every frame"""
+    state = read_live_state()
+    if state is None:
+        return {'error': 'No live state published yet'}, 503
+    return state
+
+@app.route('/hose_priming')
+def hose_priming_state():
+    """Learned tubing dead volume and drain-back per hose, and the fill each would get if poured now"""
+    return {str(hose_id): hose for hose_id, hose in hose_priming.snapshot().items()}
+
+@app.route('/queue/<int:order_id>/cancel', methods=['POST'])
+def cancel_order(order_id):
+    """Guests may cancel the orders they placed; staff may cancel any"""
+    if not session.get('staff') and order_id not in session.get('orders', []):
+        return "Not your order", 403
+    if order_queue.cancel(order_id):
+        socketio.emit('mixing_cancelled', {'order_id': order_id, 'dispensed': {}})
+        broadcast_queue()
+        return {'orders': order_queue.snapshot()}
+    with mixing_lock:
+        pour = current_pour if current_pour and current_pour[0] == order_id else None
+        current = order_queue.current()
+        if pour is None and current is not None and current.order_id == order_id:
+            # Taken off the queue but not on the pumps yet: the dispatcher skips it
+            cancelled_before_pour.add(order_id)
+            return {'orders': order_queue.snapshot()}
+    if pour is None or not engine.cancel(pour[1].command_id):
+        return "Order is not waiting or pouring", 404
+    return {'orders': order_queue.snapshot()}
+
+@app.route('/emergency_stop', methods=['POST'])
+def emergency_stop():
+    engine.emergency_stop()
+    return engine.stop_stats()
+
+@app.route('/resume', methods=['POST'])
+@staff_only
+def resume_dispensing():
+    engine.resume()
+    ensure_dispatcher()
+    return engine.stop_stats()
+
+@app.route('/bottle_swap/<int:hose_id>', methods=['POST'])
+@staff_only
+def confirm_bottle_swap(hose_id):
+    """Staff have put a full bottle on hose_id; a pour parked on it carries on.
+
+    An optional volume_ml form field gives the new bottle's size.
+    """
+    volume_ml = request.form.get('volume_ml', type=float)
+    if volume_ml is not None and volume_ml <= 0:
+        return "Invalid bottle volume", 400
+    waiting = engine.confirm_swap(hose_id, volume_ml)
+    return {'hose_id': hose_id, 'resumed_pour': waiting, 'swaps': engine.swap_stats()}
+
+@app.route('/queue/<int:order_id>/priority', methods=['POST'])
+@staff_only
+def set_order_priority(order_id):
     try:
-        recipe = get_recipe_by_id(drink_id)
-        if recipe is None:
-            socketio.emit('mixing_error', {'error': 'Recipe not found'})
-            return
-
-        hose_assignments = load_hose_assignments()
-        calibrations = load_pump_calibrations()
-        bottle_volumes = load_bottle_volumes()
-
-        total_ingredients = len(recipe['ingredients'])
-        completed = 0
-        socketio.emit('mixing_start', {'drink_name': recipe['drink_name']})
-        # Convert percentage to volume for each ingredient
-        for ingredient, percentage in recipe['ingredients'].items():
-            pump_id = next((hid for hid, bev in hose_assignments.items() if bev.lower() == ingredient.lower()), None)
-            if not pump_id:
-                logging.error(f"Ingredient {ingredient} not assigned")
-                continue
-            required_volume = total_volume * (percentage / 100.0)
-            flow_rate = calibrations.get(pump_id, 10.0)
-            remaining = bottle_volumes.get(pump_id, {}).get('remaining_volume_ml', 0)
-            if remaining < required_volume:
-                socketio.emit('mixing_error', {'error': f"Insufficient volume for {ingredient}. Please refill hose {pump_id}."})
-                break
-            dispense_time = required_volume / flow_rate
-            activate_pump(pump_id, dispense_time)
-            update_remaining_volume(pump_id, required_volume)
-            completed += 1
-            mixing_progress = completed / total_ingredients
-            socketio.emit('mixing_progress', {'progress': mixing_progress})
-            time.sleep(1)
-        socketio.emit('mixing_complete')
-    except Exception as e:
-        logging.error(f"Error mixing drink {drink_id}: {e}")
-        socketio.emit('mixing_error', {'error': "An error occurred while mixing the drink"})
-    finally:
+        priority = int(request.form.get('priority', 0))
+    except ValueError:
+        return "Invalid priority", 400
+    if not order_queue.set_priority(order_id, priority):
+        return "Order is not waiting", 404
+    broadcast_queue()
+    return {'orders': order_queue.snapshot()}
+
+def queue_shortages(orders):
+    """For each bottle the queue would run dry, the first order that needs more than is left.
+
+    The order being poured counts too: its consumption is only booked once it finishes.
+    """
+    return forecast_queue(orders).exhaustions
+
+def shortage_warning(shortages, ticket):
+    """Ingredients expected to run out before ticket's drink is poured"""
+    if ticket is None or ticket['position'] == 0:
+        return []
+    return sorted({e['ingredient'] for e in shortages if e['position'] <= ticket['position']})
+
+def broadcast_queue():
+    orders = order_queue.snapshot()
+    socketio.emit('queue_update', {'orders': orders, 'shortages': queue_shortages(orders)})
+
+def ensure_dispatcher():
+    """Starts the order dispatcher thread unless it is already running"""
+    global dispatcher_thread
+    with dispatcher_lock:
+        if dispatcher_thread is None or not dispatcher_thread.is_alive():
+            dispatcher_thread = threading.Thread(target=dispatch_orders, daemon=True)
+            dispatcher_thread.start()
+
+def dispatch_orders():
+    """Drains the order queue into the pumps, one drink at a time"""
+    global is_mixing
+    while True:
+        # Orders stay queued while the emergency stop is latched
+        engine.wait_ready()
+        order = order_queue.get()
         with mixing_lock:
-            is_mixing = False
-            mixing_progress = 0.0
-
-def activate_pump(pump_id, duration):
-    if not GPIO:
-        logging.warning(f"Simulating pump {pump_id} for {duration}s")
-        time.sleep(duration)
+            is_mixing = True
+        broadcast_queue()
+        try:
+            mix_drink_thread(order.drink_id, order.size, order.order_id, order.servings)
+        finally:
+            order_queue.done(order)
+            broadcast_queue()
+
+# Browsers listen for the mixing_* events; the dispense engine publishes pour_*
+SOCKETIO_EVENTS = {'pour_start': 'mixing_start', 'pour_progress': 'mixing_progress',
+                   'pour_complete': 'mixing_complete', 'pour_error': 'mixing_error',
+                   'pour_cancelled': 'mixing_cancelled', 'emergency_stop': 'emergency_stop',
+                   'resumed': 'resumed', 'bottle_swap': 'bottle_swap', 'bottle_swapped': 'bottle_swapped',
+                   'bottle_swap_timeout': 'bottle_swap_timeout'}
+
+def forward_engine_event(event, data):
+    """Socket.IO adapter for the dispense engine"""
+    name = SOCKETIO_EVENTS.get(event)
+    if name is None:
         return
-    pin = PUMP_GPIO_PINS.get(pump_id)
-    if not pin:
-        logging.error(f"No GPIO pin for pump {pump_id}")
+    if event.startswith('pour_') and data.get('order_id') is None:
+        # A pour started at the kiosk, reported by the shared pump daemon
         return
-    try:
-        GPIO.output(pin, GPIO.HIGH)
-        time.sleep(duration)
-        GPIO.output(pin, GPIO.LOW)
-    except Exception as e:
-        logging.error(f"GPIO error for pump {pump_id}: {e}")
+    socketio.emit(name, data)
 
-def activate_pump_raw(pump_id, on=True):
-    if not GPIO:
-        logging.warning(f"Simulating pump {pump_id} -> {'ON' if on else 'OFF'}")
-        return
-    pin = PUMP_GPIO_PINS.get(pump_id)
-    if not pin:
-        logging.error(f"No GPIO pin for pump {pump_id}")
-        return
+engine.subscribe(forward_engine_event)
+
+def mix_drink_thread(drink_id, total_volume, order_id=None, servings=1):
+    """Pours one order (servings x total_volume ml in a single pass) on the dispense engine and waits for it"""
+    global is_mixing, current_pour
     try:
-        GPIO.output(pin, GPIO.HIGH if on else GPIO.LOW)
+        with mixing_lock:
+            if order_id in cancelled_before_pour:
+                cancelled_before_pour.discard(order_id)
+                logging.info(f"Order {order_id} was cancelled before it reached the pumps")
+                socketio.emit('mixing_cancelled', {'order_id': order_id, 'dispensed': {}})
+                return
+            # A short bottle parks its pump until staff confirm the swap at /bottle_swap/<hose_id>
+            future = engine.pour(drink_id, total_volume, order_id=order_id, allow_swap=True, servings=servings)
+            current_pour = (order_id, future)
+        future.result()
     except Exception as e:
-        logging.error(f"GPIO error for pump {pump_id}: {e}")
+        logging.error(f"Error mixing drink {drink_id}: {e}")
+    finally:
+        with mixing_lock:
+            is_mixing = False
+            current_pour = None
 
 # Recipe Management Routes
 @app.route('/recipes')
@@ -201,8 +337,7 @@ def recipes():
 @app.route('/recipes/add', methods=['GET', 'POST'])
 def add_recipe():
     if request.method == 'POST':
-        recipes = load_all_recipes()
-        drink_id = max([r['drink_id'] for r in recipes] + [0]) + 1
+        drink_id = next_drink_id()
         drink_name = request.form.get('drink_name')
         ingredients = {}
         for i in range(1, 6):
@@ -215,22 +350,19 @@ def add_recipe():
                     continue
                 ingredients[ing] = perc_val
         notes = request.form.get('notes', '')
-        new_recipe = {'drink_id': drink_id, 'drink_name': drink_name, 'ingredients': ingredients, 'notes': notes}
-        recipes.append(new_recipe)
-        save_all_recipes(recipes)
+        save_recipe(drink_id, drink_name, ingredients, notes)
         flash("Recipe added successfully")
         return redirect(url_for('recipes'))
     return render_template('recipe_form.html', action='Add', recipe={'ingredients': {}}, available_ingredients=get_all_ingredients())
 
 @app.route('/recipes/edit/<int:drink_id>', methods=['GET', 'POST'])
 def edit_recipe(drink_id):
-    recipes = load_all_recipes()
-    recipe = next((r for r in recipes if r['drink_id'] == drink_id), None)
+    recipe = get_recipe_by_id(drink_id)
     if not recipe:
         flash("Recipe not found")
         return redirect(url_for('recipes'))
     if request.method == 'POST':
-        recipe['drink_name'] = request.form.get('drink_name')
+        drink_name = request.form.get('drink_name')
         new_ingredients = {}
         for i in range(1, 6):
             ing = request.form.get(f'ingredient_{i}')
@@ -241,18 +373,14 @@ def edit_recipe(drink_id):
                 except ValueError:
                     continue
                 new_ingredients[ing] = perc_val
-        recipe['ingredients'] = new_ingredients
-        recipe['notes'] = request.form.get('notes', '')
-        save_all_recipes(recipes)
+        save_recipe(drink_id, drink_name, new_ingredients, request.form.get('notes', ''))
         flash("Recipe updated successfully")
         return redirect(url_for('recipes'))
     return render_template('recipe_form.html', action='Edit', recipe=recipe, available_ingredients=get_all_ingredients())
 
 @app.route('/recipes/delete/<int:drink_id>', methods=['POST'])
 def delete_recipe(drink_id):
-    recipes = load_all_recipes()
-    recipes = [r for r in recipes if r['drink_id'] != drink_id]
-    save_all_recipes(recipes)
+    delete_saved_recipe(drink_id)
     flash("Recipe deleted successfully")
     return redirect(url_for('recipes'))
 
@@ -262,6 +390,7 @@ def pin_entry():
     if request.method == 'POST':
         pin = request.form.get('pin')
         if pin == CORRECT_PIN:
+            session['staff'] = True
             return redirect(url_for('settings'))
         flash("Incorrect PIN")
     return render_template('pin_entry.html')
@@ -310,7 +439,7 @@ def bottle_volumes():
             remaining = request.form.get(f'remaining_{i}')
             try:
                 total = int(total)
-                remaining = int(remaining)
+                remaining = float(remaining)
             except:
                 total = 0
                 remaining = 0
@@ -344,15 +473,14 @@ def add_ingredient():
         return redirect(url_for('list_ingredients'))
     return render_template('add_ingredient.html')
 
-# Calibration and Priming Routes (unchanged)
+# Calibration and Priming Routes
 @app.route('/calibration')
 def calibration():
     return render_template('calibration.html')
 
 @app.route('/start_pump/<int:pump_id>', methods=['POST'])
 def start_pump(pump_id):
-    CALIBRATION_DATA[pump_id]["start_time"] = time.time()
-    activate_pump_raw(pump_id, on=True)
+    CALIBRATION_DATA[pump_id]["start_time"] = engine.switch(pump_id, True).result()
     return "Pump started"
 
 @app.route('/stop_pump/<int:pump_id>', methods=['POST'])
@@ -360,10 +488,9 @@ def stop_pump(pump_id):
     start_t = CALIBRATION_DATA[pump_id].get("start_time")
     if start_t is None:
         return "Pump was not started", 400
-    duration = time.time() - start_t
+    duration = engine.switch(pump_id, False).result() - start_t
     CALIBRATION_DATA[pump_id]["last_run_time"] = duration
     CALIBRATION_DATA[pump_id]["start_time"] = None
-    activate_pump_raw(pump_id, on=False)
     return f"{duration:.2f}"
 
 @app.route('/calibrate_pump', methods=['POST'])
@@ -374,16 +501,30 @@ def calibrate_pump():
     if duration <= 0:
         flash("No valid pump run time recorded.")
         return redirect(url_for('calibration'))
-    flow_rate = dispensed_volume / duration
-    save_pump_calibration(pump_id, flow_rate)
     CALIBRATION_DATA[pump_id]["last_run_time"] = 0
-    flash(f"Pump {pump_id} calibrated to {flow_rate:.2f} ml/s")
+    try:
+        # Fitted over every run so far, so one badly timed press-and-hold no longer sets the rate
+        model = calibration_history.record(pump_id, duration, dispensed_volume)
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('calibration'))
+    message = (f"Pump {pump_id} calibrated to {model.flow_rate:.2f} ml/s after {model.startup_s:.2f} s start-up "
+               f"({model.runs_used} runs")
+    if model.rate_stderr is not None:
+        message += f", ±{model.rate_stderr:.2f} ml/s"
+    if model.rejected:
+        message += f", {len(model.rejected)} outliers ignored"
+    flash(message + ")")
     return redirect(url_for('calibration'))
 
+@app.route('/calibration_history')
+def calibration_history_state():
+    """Fitted flow model per pump: rate, start-up time, residuals and rejected runs"""
+    return {str(pump_id): model.as_dict() for pump_id, model in calibration_history.models().items()}
+
 @app.route('/start_prime/<int:pump_id>', methods=['POST'])
 def start_prime(pump_id):
-    PRIME_DATA[pump_id]["start_time"] = time.time()
-    activate_pump_raw(pump_id, on=True)
+    PRIME_DATA[pump_id]["start_time"] = engine.switch(pump_id, True).result()
     return "Prime started"
 
 @app.route('/stop_prime/<int:pump_id>', methods=['POST'])
@@ -391,10 +532,9 @@ def stop_prime(pump_id):
     start_t = PRIME_DATA[pump_id].get("start_time")
     if start_t is None:
         return "Prime was not started", 400
-    duration = time.time() - start_t
+    duration = engine.switch(pump_id, False).result() - start_t
     PRIME_DATA[pump_id]["last_run_time"] = duration
     PRIME_DATA[pump_id]["start_time"] = None
-    activate_pump_raw(pump_id, on=False)
     return f"{duration:.2f}"
 
 @app.route('/prime_hose', methods=['POST'])
@@ -402,21 +542,14 @@ def prime_hose():
     pump_id = int(request.form.get("pump_id"))
     duration = PRIME_DATA[pump_id]["last_run_time"]
     PRIME_DATA[pump_id]["last_run_time"] = 0
-    flash(f"Hose {pump_id} primed for {duration:.2f} seconds")
+    # The press-and-hold time is how long the tubing took to fill: learn dead volume and drain-back from it
+    filled = hose_priming.record_prime(pump_id, duration, load_pump_calibrations().get(pump_id, 0),
+                                       pump_startup_snapshot().get(pump_id, 0.0))
+    if filled:
+        flash(f"Hose {pump_id} primed for {duration:.2f} seconds ({filled:.1f} ml of tubing)")
+    else:
+        flash(f"Hose {pump_id} primed for {duration:.2f} seconds")
     return redirect(url_for('calibration'))
 
-def activate_pump_raw(pump_id, on=True):
-    if not GPIO:
-        logging.warning(f"Simulating pump {pump_id} -> {'ON' if on else 'OFF'}")
-        return
-    pin = PUMP_GPIO_PINS.get(pump_id)
-    if not pin:
-        logging.error(f"No GPIO pin for pump {pump_id}")
-        return
-    try:
-        GPIO.output(pin, GPIO.HIGH if on else GPIO.LOW)
-    except Exception as e:
-        logging.error(f"GPIO error for pump {pump_id}: {e}")
-
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
@@ -1,27 +1,197 @@
 # availability_checker.py
-from config_manager import load_hose_assignments, load_hose_statuses
-from recipe_manager import load_all_recipes
+from threading import Lock
+from config_manager import (
+    hose_assignments_snapshot, hose_statuses_snapshot, bottle_volumes_snapshot,
+    find_hoses, normalize_ingredient
+)
+from recipe_manager import recipes_snapshot
 import logging
 
+class AvailabilityEngine:
+    """Tracks which recipes can be poured using integer bitmasks.
+
+    Every canonical ingredient gets one bit. A recipe's mask is the OR of its
+    ingredient bits, and the engine keeps a mask of ingredients that have at
+    least one usable hose (assigned, not marked empty, bottle not dry), so a
+    recipe is available when mask & ~usable == 0. When a hose or recipe
+    changes, only the recipes that use the affected ingredients are
+    re-evaluated.
+    """
+    def __init__(self, low_threshold=0.1):
+        self.low_threshold = low_threshold
+        self._lock = Lock()
+        self._bits = {}              # ingredient -> bit
+        self._names = {}             # bit -> ingredient
+        self._recipe_masks = {}      # drink_id -> mask
+        self._recipes_by_bit = {}    # bit -> set of drink_ids using it
+        self._hoses = {}             # hose_id -> (ingredient, usable, low)
+        self._hoses_by_bit = {}      # bit -> set of hose_ids holding it
+        self._usable = 0             # ingredients with a usable hose
+        self._healthy = 0            # ingredients with a usable hose above the low threshold
+        self._available = set()
+        self._missing_one = {}       # drink_id -> missing ingredient
+        self._low_volume = set()
+
+    def _bit(self, ingredient):
+        bit = self._bits.get(ingredient)
+        if bit is None:
+            bit = 1 << len(self._bits)
+            self._bits[ingredient] = bit
+            self._names[bit] = ingredient
+        return bit
+
+    def _evaluate(self, drink_id):
+        mask = self._recipe_masks.get(drink_id)
+        self._available.discard(drink_id)
+        self._missing_one.pop(drink_id, None)
+        self._low_volume.discard(drink_id)
+        if mask is None:
+            return
+        missing = mask & ~self._usable
+        if not missing:
+            self._available.add(drink_id)
+            if mask & ~self._healthy:
+                self._low_volume.add(drink_id)
+        elif not missing & (missing - 1):
+            # Exactly one bit set
+            self._missing_one[drink_id] = self._names[missing]
+
+    def _refresh_ingredient(self, bit):
+        """Recomputes one ingredient's usable/healthy bits and re-evaluates its recipes if they changed"""
+        states = [self._hoses[h] for h in self._hoses_by_bit.get(bit, ())]
+        usable = any(s[1] for s in states)
+        healthy = any(s[1] and not s[2] for s in states)
+        old_usable, old_healthy = self._usable, self._healthy
+        self._usable = self._usable | bit if usable else self._usable & ~bit
+        self._healthy = self._healthy | bit if healthy else self._healthy & ~bit
+        if (old_usable, old_healthy) != (self._usable, self._healthy):
+            for drink_id in self._recipes_by_bit.get(bit, ()):
+                self._evaluate(drink_id)
+
+    def set_hose(self, hose_id, ingredient, is_empty, remaining_ml=None, total_ml=None):
+        """Updates one hose; only recipes using its old or new ingredient are recomputed"""
+        ingredient = normalize_ingredient(ingredient or '')
+        usable = bool(ingredient) and not is_empty and (remaining_ml is None or remaining_ml > 0)
+        low = usable and bool(total_ml) and remaining_ml is not None and remaining_ml / total_ml <= self.low_threshold
+        with self._lock:
+            old = self._hoses.get(hose_id)
+            if old == (ingredient, usable, low):
+                return
+            affected = set()
+            if old and old[0]:
+                old_bit = self._bits[old[0]]
+                self._hoses_by_bit[old_bit].discard(hose_id)
+                affected.add(old_bit)
+            self._hoses[hose_id] = (ingredient, usable, low)
+            if ingredient:
+                bit = self._bit(ingredient)
+                self._hoses_by_bit.setdefault(bit, set()).add(hose_id)
+                affected.add(bit)
+            for bit in affected:
+                self._refresh_ingredient(bit)
+
+    def set_recipe(self, drink_id, ingredients):
+        """Adds or replaces a recipe given its ingredient names"""
+        with self._lock:
+            self._drop_recipe(drink_id)
+            mask = 0
+            for ingredient in ingredients:
+                mask |= self._bit(normalize_ingredient(ingredient))
+            self._recipe_masks[drink_id] = mask
+            bit = mask
+            while bit:
+                low_bit = bit & -bit
+                self._recipes_by_bit.setdefault(low_bit, set()).add(drink_id)
+                bit ^= low_bit
+            self._evaluate(drink_id)
+
+    def remove_recipe(self, drink_id):
+        with self._lock:
+            self._drop_recipe(drink_id)
+            self._evaluate(drink_id)
+
+    def _drop_recipe(self, drink_id):
+        mask = self._recipe_masks.pop(drink_id, 0)
+        while mask:
+            low_bit = mask & -mask
+            self._recipes_by_bit.get(low_bit, set()).discard(drink_id)
+            mask ^= low_bit
+
+    def available(self):
+        """Set of drink_ids whose ingredients all have a usable hose"""
+        with self._lock:
+            return set(self._available)
+
+    def missing_one(self):
+        """{drink_id: ingredient} for drinks that lack exactly one ingredient"""
+        with self._lock:
+            return dict(self._missing_one)
+
+    def low_volume(self):
+        """Available drink_ids that depend on an ingredient whose only usable hoses are running low"""
+        with self._lock:
+            return set(self._low_volume)
+
+class _StoreSync:
+    """Feeds the engine from the state store snapshots, pushing only what changed"""
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = Lock()
+        self._seen = (None, None, None, None)
+        self._recipes = {}   # drink_id -> ingredient name tuple
+        self._hoses = {}     # hose_id -> (ingredient, is_empty, remaining, total)
+
+    def sync(self):
+        recipes = recipes_snapshot()
+        assignments = hose_assignments_snapshot()
+        statuses = hose_statuses_snapshot()
+        volumes = bottle_volumes_snapshot()
+        with self._lock:
+            if all(a is b for a, b in zip(self._seen, (recipes, assignments, statuses, volumes))):
+                return
+            self._seen = (recipes, assignments, statuses, volumes)
+            current = {r['drink_id']: tuple(r['ingredients']) for r in recipes}
+            for drink_id in set(self._recipes) - set(current):
+                self.engine.remove_recipe(drink_id)
+            for drink_id, ingredients in current.items():
+                if self._recipes.get(drink_id) != ingredients:
+                    self.engine.set_recipe(drink_id, ingredients)
+            self._recipes = current
+            for hose_id in set(assignments) | set(statuses) | set(volumes) | set(self._hoses):
+                bottle = volumes.get(hose_id)
+                state = (
+                    assignments.get(hose_id, ''),
+                    statuses.get(hose_id, True),
+                    bottle['remaining_volume_ml'] if bottle else None,
+                    bottle['total_volume_ml'] if bottle else None
+                )
+                if self._hoses.get(hose_id) != state:
+                    self.engine.set_hose(hose_id, *state)
+                    self._hoses[hose_id] = state
+
+availability_engine = AvailabilityEngine()
+_store_sync = _StoreSync(availability_engine)
+
 def get_available_drinks():
     """Returns a list of drink dictionaries that can be made with current hoses and statuses"""
-    hose_assignments = load_hose_assignments()
-    hose_statuses = load_hose_statuses()
-    recipes = load_all_recipes()
-    available_drinks = []
-    for recipe in recipes:
-        if is_drink_available(recipe, hose_assignments, hose_statuses):
-            available_drinks.append(recipe)
-    return available_drinks
-
-def is_drink_available(drink, hose_assignments, hose_statuses):
-    """Check if all ingredients are assigned to non-empty hoses"""
+    _store_sync.sync()
+    available = availability_engine.available()
+    return [dict(recipe, ingredients=dict(recipe['ingredients']))
+            for recipe in recipes_snapshot() if recipe['drink_id'] in available]
+
+def get_drinks_missing_one():
+    """Returns {drink_id: ingredient} for drinks that are one ingredient short"""
+    _store_sync.sync()
+    return availability_engine.missing_one()
+
+def get_low_volume_drinks():
+    """Returns the ids of available drinks that will soon be blocked by a low bottle"""
+    _store_sync.sync()
+    return availability_engine.low_volume()
+
+def is_drink_available(drink, ingredient_index, hose_statuses):
+    """Check if every ingredient is assigned to at least one non-empty hose"""
     for ingredient in drink['ingredients'].keys():
-        matched_hose = None
-        for hose_id, beverage_name in hose_assignments.items():
-            if beverage_name.lower() == ingredient.lower():
-                matched_hose = hose_id
-                break
-        if matched_hose is None or hose_statuses.get(matched_hose, True):
+        if all(hose_statuses.get(hose_id, True) for hose_id in find_hoses(ingredient, ingredient_index)):
             return False
     return True
@@ -0,0 +1,304 @@
+# benchmark.py
+"""Replays an evening of service against the simulated pump driver.
+
+Pours run on a VirtualClock, so hours of orders finish in seconds. The run
+uses a scratch copy of data/ with every bottle topped up, and it prints a
+single JSON document (throughput, order latency percentiles, per-pump duty
+cycle and lock waits) that can be diffed between commits.
+
+    python benchmark.py --orders 300 --rate 90 --target both --output bench.json
+    python benchmark.py --mix "Moscow Mule=3,Margarita=1" --sizes 200,375
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+from urllib.parse import urlparse, parse_qs
+
+SOURCE_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+TOP_UP_ML = 10 ** 9
+
+def percentile(values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q / 100.0 * len(values)) - 1)]
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    return {'mean': round(sum(values) / len(values), 3),
+            'p50': round(percentile(values, 50), 3),
+            'p95': round(percentile(values, 95), 3),
+            'p99': round(percentile(values, 99), 3),
+            'max': round(values[-1], 3)}
+
+class TimedLock:
+    """Wraps a Lock or RLock and records how long each acquire waited (wall-clock)"""
+    def __init__(self, lock):
+        self.lock = lock
+        self.waits = []
+
+    def acquire(self, blocking=True, timeout=-1):
+        started = time.perf_counter()
+        acquired = self.lock.acquire(blocking, timeout)
+        self.waits.append(time.perf_counter() - started)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def stats(self):
+        waits = list(self.waits)
+        return {'acquisitions': len(waits),
+                'total_ms': round(sum(waits) * 1000, 3),
+                'max_ms': round(max(waits, default=0.0) * 1000, 3)}
+
+class Order:
+    def __init__(self, index, arrival, drink_id, size):
+        self.index = index
+        self.arrival = arrival
+        self.drink_id = drink_id
+        self.size = size
+
+def prepare_data(workdir):
+    """Copies data/ into workdir and points the app at it before any project module is imported"""
+    data_dir = os.path.join(workdir, 'data')
+    # Runtime state of the live machine stays behind, so every run starts from the same tubing and queue
+    ignore = shutil.ignore_patterns('order_queue.json', 'pump_daemon.sock', '.state.lock', 'live_state.bin',
+                                    'hose_priming.json', 'hose_usage.log')
+    shutil.copytree(SOURCE_DATA_DIR, data_dir, ignore=ignore)
+    os.environ['DRINKMIXER_DATA_DIR'] = data_dir
+    return data_dir
+
+def top_up_bottles():
+    from config_manager import load_hose_assignments, save_bottle_volumes
+    save_bottle_volumes({hose_id: {'total_volume_ml': TOP_UP_ML, 'remaining_volume_ml': TOP_UP_ML}
+                         for hose_id in load_hose_assignments()})
+
+def parse_mix(spec):
+    """'Moscow Mule=3,Margarita=1' -> [(drink_id, weight), ...]; empty spec means every available drink"""
+    from utils import get_available_drinks
+    from recipe_manager import get_recipe_by_name
+    if not spec:
+        return [(drink['drink_id'], 1.0) for drink in get_available_drinks()]
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        recipe = get_recipe_by_name(name.strip())
+        if recipe is None:
+            raise SystemExit(f"Unknown drink '{name.strip()}' in --mix")
+        mix.append((recipe['drink_id'], float(weight or 1)))
+    return mix
+
+def build_orders(count, rate_per_hour, mix, sizes, seed):
+    """Poisson arrivals at rate_per_hour, drinks and sizes drawn from the mix"""
+    if not mix:
+        raise SystemExit("No drinks can be made with the current hose assignments")
+    rng = random.Random(seed)
+    drink_ids = [drink_id for drink_id, _ in mix]
+    weights = [weight for _, weight in mix]
+    orders = []
+    arrival = 0.0
+    for index in range(count):
+        orders.append(Order(index, arrival, rng.choices(drink_ids, weights)[0], rng.choice(sizes)))
+        arrival += rng.expovariate(rate_per_hour / 3600.0)
+    return orders
+
+def install_simulator(dead_volume_ml):
+    from config_manager import pump_calibrations_snapshot
+    from pump_driver import SimulatedPumpDriver, VirtualClock, set_pump_driver
+    clock = VirtualClock()
+    driver = SimulatedPumpDriver(flow_rates=pump_calibrations_snapshot(), dead_volume_ml=dead_volume_ml, clock=clock)
+    set_pump_driver(driver)
+    return driver, clock
+
+def instrument_locks(targets):
+    """Swaps each (owner, attribute) lock for a TimedLock; returns {name: TimedLock} and an undo function"""
+    timed = {}
+    originals = []
+    for name, (owner, attribute) in targets.items():
+        original = getattr(owner, attribute)
+        originals.append((owner, attribute, original))
+        timed[name] = TimedLock(original)
+        setattr(owner, attribute, timed[name])
+
+    def restore():
+        for owner, attribute, original in originals:
+            setattr(owner, attribute, original)
+    return timed, restore
+
+def report(target, orders, results, driver, timed_locks, wall_time, rejected=0):
+    done = [r for r in results if r['ok']]
+    first = min((o.arrival for o in orders), default=0.0)
+    last = max((r['end'] for r in results), default=first)
+    makespan = last - first
+    return {
+        'target': target,
+        'orders': len(orders),
+        'completed': len(done),
+        'failed': len(results) - len(done),
+        'rejected': rejected,
+        'makespan_s': round(makespan, 3),
+        'throughput_per_hour': round(len(done) / makespan * 3600, 2) if makespan > 0 else 0.0,
+        'latency_s': summarize([r['end'] - r['arrival'] for r in done]),
+        'wait_s': summarize([r['start'] - r['arrival'] for r in done]),
+        'service_s': summarize([r['end'] - r['start'] for r in done]),
+        'duty_cycle': {str(p): v for p, v in driver.duty_cycle(first, last).items()},
+        'dispensed_ml': round(sum(driver.dispensed_ml.values()), 1),
+        'lock_wait': {name: lock.stats() for name, lock in timed_locks.items()},
+        'wall_time_s': round(wall_time, 3),
+    }
+
+def run_controller(orders, dead_volume_ml):
+    """Orders go straight to DrinkMixerController.mix_drink, one at a time, as from the touchscreen"""
+    from PyQt6.QtCore import QCoreApplication
+    from controller import DrinkMixerController
+    from config_manager import bottle_ledger
+    from recipe_manager import recipe_repository
+
+    qt_app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    driver, clock = install_simulator(dead_volume_ml)
+    timed_locks, restore = instrument_locks({'bottle_ledger': (bottle_ledger, '_lock'),
+                                             'recipe_repository': (recipe_repository, '_lock')})
+    controller = DrinkMixerController()
+    results = []
+    started = time.perf_counter()
+    try:
+        for order in orders:
+            # The mixer sits idle until the guest walks up
+            clock.sleep_until(order.arrival)
+            start = clock.monotonic()
+            outcome = []
+            worker = controller.mix_drink(order.drink_id, order.size, None, outcome.append)
+            if worker is not None:
+                worker.wait()
+                qt_app.processEvents()
+            results.append({'arrival': order.arrival, 'start': start, 'end': clock.monotonic(),
+                            'ok': bool(outcome and outcome[0])})
+    finally:
+        restore()
+    return report('controller', orders, results, driver, timed_locks, time.perf_counter() - started)
+
+def run_web(orders, dead_volume_ml):
+    """Orders are POSTed to mix_drink_route and poured by the app's queue dispatcher"""
+    import app as web
+    from config_manager import bottle_ledger
+    from recipe_manager import recipe_repository
+
+    driver, clock = install_simulator(dead_volume_ml)
+    timed_locks, restore = instrument_locks({'mixing_lock': (web, 'mixing_lock'),
+                                             'bottle_ledger': (bottle_ledger, '_lock'),
+                                             'recipe_repository': (recipe_repository, '_lock')})
+    timings = {}
+    errors = set()
+    mix_drink_thread = web.mix_drink_thread
+    emit = web.socketio.emit
+
+    def timed_mix(drink_id, total_volume, order_id=None, servings=1):
+        start = clock.monotonic()
+        mix_drink_thread(drink_id, total_volume, order_id, servings)
+        timings[order_id] = (start, clock.monotonic())
+
+    def recording_emit(event, data=None, *args, **kwargs):
+        if event == 'mixing_error' and data:
+            errors.add(data.get('order_id'))
+        return emit(event, data, *args, **kwargs)
+
+    def wait_idle():
+        while web.order_queue.snapshot():
+            time.sleep(0.0005)
+
+    web.mix_drink_thread = timed_mix
+    web.socketio.emit = recording_emit
+    client = web.app.test_client()
+    arrivals = {}
+    rejected = 0
+    started = time.perf_counter()
+    try:
+        i = 0
+        while i < len(orders):
+            wait_idle()
+            clock.sleep_until(orders[i].arrival)
+            now = clock.monotonic()
+            # Everyone who arrived while the last drinks were pouring joins the queue together,
+            # so the scheduling policy sees the same backlog it would in real service
+            with web.order_queue._cond:
+                while i < len(orders) and orders[i].arrival <= now:
+                    order = orders[i]
+                    response = client.post(f'/mix/{order.drink_id}', data={'size': order.size})
+                    location = response.headers.get('Location', '')
+                    order_id = parse_qs(urlparse(location).query).get('order_id')
+                    if response.status_code == 302 and order_id:
+                        arrivals[int(order_id[0])] = order
+                    else:
+                        rejected += 1
+                    i += 1
+        wait_idle()
+    finally:
+        web.mix_drink_thread = mix_drink_thread
+        web.socketio.emit = emit
+        restore()
+
+    results = []
+    for order_id, order in arrivals.items():
+        start, end = timings.get(order_id, (order.arrival, order.arrival))
+        results.append({'arrival': order.arrival, 'start': start, 'end': end,
+                        'ok': order_id in timings and order_id not in errors})
+    result = report('web', orders, results, driver, timed_locks, time.perf_counter() - started, rejected)
+    result['policy'] = web.order_queue.policy.name
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated drink mixer service benchmark")
+    parser.add_argument('--orders', type=int, default=200, help="number of orders to replay")
+    parser.add_argument('--rate', type=float, default=60.0, help="mean arrivals per hour")
+    parser.add_argument('--mix', default='', help="weighted drinks, e.g. 'Moscow Mule=3,Margarita=1'")
+    parser.add_argument('--sizes', default='375', help="comma separated drink sizes in ml")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--dead-volume', type=float, default=0.0, help="simulated hose dead volume in ml")
+    parser.add_argument('--target', choices=('controller', 'web', 'both'), default='both')
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix='drinkmixer-bench-')
+    try:
+        prepare_data(workdir)
+        top_up_bottles()
+        sizes = [float(size) for size in args.sizes.split(',')]
+        orders = build_orders(args.orders, args.rate, parse_mix(args.mix), sizes, args.seed)
+        runs = []
+        if args.target in ('controller', 'both'):
+            runs.append(run_controller(orders, args.dead_volume))
+        if args.target in ('web', 'both'):
+            runs.append(run_web(orders, args.dead_volume))
+        output = {'config': {'orders': args.orders, 'rate_per_hour': args.rate, 'mix': args.mix or 'all available',
+                             'sizes': sizes, 'seed': args.seed, 'dead_volume_ml': args.dead_volume},
+                  'runs': runs}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# calibration_history.py
+import os
+import time
+import math
+import logging
+import threading
+from statistics import median
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from config_manager import DATA_DIR, save_pump_calibration
+from state_store import file_lock, load_json, save_json
+
+CALIBRATION_HISTORY_FILE = os.path.join(DATA_DIR, 'calibration_history.json')
+# Runs kept per pump; older ones age out so a wearing pump tube is followed
+MAX_RUNS = 20
+# Fewer runs than this only fit a flow rate, with no start-up time
+MIN_FIT_RUNS = 3
+# A run further out than this many robust standard deviations is rejected as an outlier
+OUTLIER_SIGMA = 3.0
+# Reading a jug or scale is no better than this, so smaller residuals never make a run an outlier
+RESOLUTION_ML = 0.5
+
+class FlowModel:
+    """volume_ml = flow_rate * (elapsed_s - startup_s), fitted over a pump's calibration runs.
+
+    residuals holds measured minus fitted ml for every run, outliers
+    included; rejected lists the indexes of the runs the fit left out.
+    rate_stderr is the standard error of flow_rate (None with too few runs
+    to tell) and rmse the root mean square residual of the runs used.
+    """
+    def __init__(self, flow_rate, startup_s, residuals, rejected, rate_stderr, rmse):
+        self.flow_rate = flow_rate
+        self.startup_s = startup_s
+        self.residuals = residuals
+        self.rejected = rejected
+        self.rate_stderr = rate_stderr
+        self.rmse = rmse
+
+    @property
+    def runs_used(self):
+        return len(self.residuals) - len(self.rejected)
+
+    def as_dict(self):
+        return {'flow_rate': round(self.flow_rate, 3), 'startup_s': round(self.startup_s, 3),
+                'rate_stderr': round(self.rate_stderr, 3) if self.rate_stderr is not None else None,
+                'rmse_ml': round(self.rmse, 2), 'runs_used': self.runs_used, 'rejected': list(self.rejected),
+                'residuals_ml': [round(r, 2) for r in self.residuals]}
+
+def _fit_numpy(points, intercept):
+    elapsed = np.array([t for t, _ in points], dtype=float)
+    volume = np.array([v for _, v in points], dtype=float)
+    design = np.column_stack([elapsed, np.ones_like(elapsed)]) if intercept else elapsed[:, None]
+    coefficients, _, rank, _ = np.linalg.lstsq(design, volume, rcond=None)
+    if rank < design.shape[1]:
+        return None
+    sse = float(np.sum((volume - design @ coefficients) ** 2))
+    dof = len(points) - design.shape[1]
+    stderr = math.sqrt(sse / dof * np.linalg.inv(design.T @ design)[0, 0]) if dof > 0 else None
+    return float(coefficients[0]), float(coefficients[1]) if intercept else 0.0, stderr
+
+def _fit_python(points, intercept):
+    n = len(points)
+    if intercept:
+        mean_t = sum(t for t, _ in points) / n
+        mean_v = sum(v for _, v in points) / n
+        sxx = sum((t - mean_t) ** 2 for t, _ in points)
+        if sxx <= 0:
+            return None
+        rate = sum((t - mean_t) * (v - mean_v) for t, v in points) / sxx
+        offset = mean_v - rate * mean_t
+    else:
+        sxx = sum(t * t for t, _ in points)
+        rate = sum(t * v for t, v in points) / sxx
+        offset = 0.0
+    dof = n - (2 if intercept else 1)
+    sse = sum((v - rate * t - offset) ** 2 for t, v in points)
+    stderr = math.sqrt(sse / dof / sxx) if dof > 0 else None
+    return rate, offset, stderr
+
+def _fit(points):
+    """(rate, intercept, rate_stderr) of volume = rate * elapsed + intercept, or through the origin if it must be"""
+    solve = _fit_numpy if np is not None else _fit_python
+    fitted = solve(points, True) if len(points) >= MIN_FIT_RUNS else None
+    # A positive intercept would mean liquid before the pump started: fit the rate alone
+    if fitted is None or fitted[0] <= 0 or fitted[1] > 0:
+        fitted = solve(points, False)
+    return fitted
+
+def fit_flow_model(runs):
+    """FlowModel for runs [(elapsed_s, volume_ml), ...], or None if none of them is usable.
+
+    A least-squares line is fitted, then runs whose residual is more than
+    OUTLIER_SIGMA robust standard deviations (1.4826 x the median absolute
+    residual) away are dropped and the line refitted, until none is
+    dropped or only MIN_FIT_RUNS remain. Uses NumPy when it is installed
+    and plain Python otherwise. With a single run this is the old volume /
+    elapsed calibration.
+    """
+    points = [(float(t), float(v)) for t, v in runs]
+    keep = [i for i, (t, v) in enumerate(points) if t > 0 and v > 0]
+    if not keep:
+        return None
+    while True:
+        rate, offset, stderr = _fit([points[i] for i in keep])
+        residuals = [v - (rate * t + offset) for t, v in points]
+        if len(keep) <= MIN_FIT_RUNS:
+            break
+        scale = max(RESOLUTION_ML, 1.4826 * median(abs(residuals[i]) for i in keep))
+        inliers = [i for i in keep if abs(residuals[i]) <= OUTLIER_SIGMA * scale]
+        if len(inliers) == len(keep) or len(inliers) < MIN_FIT_RUNS:
+            break
+        keep = inliers
+    rmse = math.sqrt(sum(residuals[i] ** 2 for i in keep) / len(keep))
+    rejected = [i for i in range(len(points)) if i not in keep]
+    return FlowModel(rate, 0.0 - offset / rate, residuals, rejected, stderr, rmse)
+
+class CalibrationHistory:
+    """Every calibration run per pump, and the flow model fitted over them.
+
+    Calibrating used to overwrite a pump's flow rate with volume / elapsed
+    from a single press-and-hold run, timing noise and all. Now each run is
+    added to the pump's history (the last MAX_RUNS are kept) and the flow
+    rate and start-up time saved to the pump configuration come from
+    fit_flow_model over all of them.
+    """
+    def __init__(self, path=CALIBRATION_HISTORY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        data = load_json(self.path, {})
+        return {int(k): list(v) for k, v in data.items() if isinstance(v, list)}
+
+    def runs(self, pump_id):
+        """[{'elapsed_s', 'volume_ml', 'at'}, ...] for pump_id, oldest first"""
+        with self._lock:
+            return self._load().get(int(pump_id), [])
+
+    def record(self, pump_id, elapsed_s, volume_ml):
+        """Adds a run, refits the pump's flow model, saves the result as its calibration and returns the model"""
+        if elapsed_s <= 0 or volume_ml <= 0:
+            raise ValueError("A calibration run needs a positive run time and volume")
+        with self._lock, file_lock:
+            history = self._load()
+            runs = history.setdefault(int(pump_id), [])
+            runs.append({'elapsed_s': float(elapsed_s), 'volume_ml': float(volume_ml), 'at': time.time()})
+            del runs[:-MAX_RUNS]
+            model = fit_flow_model([(run['elapsed_s'], run['volume_ml']) for run in runs])
+            save_json({str(k): v for k, v in sorted(history.items())}, self.path)
+            save_pump_calibration(pump_id, model.flow_rate, model.startup_s)
+        if model.rejected:
+            logging.warning(f"Pump {pump_id} calibration ignores {len(model.rejected)} outlying runs")
+        logging.info(f"Pump {pump_id} flow model: {model.flow_rate:.2f} ml/s after {model.startup_s:.2f} s start-up, "
+                     f"rmse {model.rmse:.2f} ml over {model.runs_used} runs")
+        return model
+
+    def model(self, pump_id):
+        """FlowModel fitted over pump_id's history, or None if it has none"""
+        return fit_flow_model([(run['elapsed_s'], run['volume_ml']) for run in self.runs(pump_id)])
+
+    def models(self):
+        """{pump_id: FlowModel} for every pump with a history"""
+        with self._lock:
+            history = self._load()
+        models = {pump_id: fit_flow_model([(run['elapsed_s'], run['volume_ml']) for run in runs])
+                  for pump_id, runs in history.items()}
+        return {pump_id: model for pump_id, model in models.items() if model is not None}
+
+calibration_history = CalibrationHistory()
@@ -1,15 +1,14 @@
 # calibration_manager.py
-import time
 import logging
-try:
-    import RPi.GPIO as GPIO
-except ImportError:
-    GPIO = None
 
-from config_manager import save_pump_calibration
-from drink_mixer import PUMP_GPIO_PINS
+from config_manager import pump_calibrations_snapshot, pump_startup_snapshot
+from calibration_history import calibration_history
+from hose_priming import hose_priming
+from pump_client import get_engine
 from density_info import get_density
 
+engine = get_engine()
+
 CALIBRATION_SESSIONS = {}
 
 def start_calibration(pump_id):
@@ -17,13 +16,11 @@ def start_calibration(pump_id):
     if pump_id in CALIBRATION_SESSIONS:
         logging.warning(f"Pump {pump_id} is already in calibration mode!")
         return
-    CALIBRATION_SESSIONS[pump_id] = {'start_time': time.time()}
-    pin = PUMP_GPIO_PINS.get(pump_id)
-    if pin and GPIO:
-        try:
-            GPIO.output(pin, GPIO.HIGH)
-        except Exception as e:
-            logging.error(f"Error starting pump {pump_id}: {e}")
+    try:
+        CALIBRATION_SESSIONS[pump_id] = {'start_time': engine.switch(pump_id, True).result()}
+    except Exception as e:
+        logging.error(f"Error starting pump {pump_id}: {e}")
+        return
     logging.info(f"Calibration started for pump {pump_id}...")
 
 def stop_calibration(pump_id, dispensed_volume_ml):
@@ -31,35 +28,41 @@ def stop_calibration(pump_id, dispensed_volume_ml):
     if pump_id not in CALIBRATION_SESSIONS:
         logging.error(f"Pump {pump_id} was not in calibration mode!")
         return
-    pin = PUMP_GPIO_PINS.get(pump_id)
-    if pin and GPIO:
-        try:
-            GPIO.output(pin, GPIO.LOW)
-        except Exception as e:
-            logging.error(f"Error stopping pump {pump_id}: {e}")
     start_time = CALIBRATION_SESSIONS[pump_id]['start_time']
-    elapsed = time.time() - start_time
-    flow_rate = calculate_flow_rate(elapsed, dispensed_volume_ml)
-    save_pump_calibration(pump_id, flow_rate)
-    logging.info(f"Calibration complete for pump {pump_id}: Flow rate = {flow_rate:.2f} ml/s")
+    try:
+        elapsed = engine.switch(pump_id, False).result() - start_time
+    except Exception as e:
+        logging.error(f"Error stopping pump {pump_id}: {e}")
+        del CALIBRATION_SESSIONS[pump_id]
+        return
     del CALIBRATION_SESSIONS[pump_id]
+    try:
+        # The run joins the pump's history; the saved rate is fitted over all of its runs
+        model = calibration_history.record(pump_id, elapsed, dispensed_volume_ml)
+    except ValueError as e:
+        logging.error(f"Calibration run for pump {pump_id} not used: {e}")
+        return
+    logging.info(f"Calibration complete for pump {pump_id}: Flow rate = {model.flow_rate:.2f} ml/s")
+    return model
 
 def calculate_flow_rate(elapsed_time_s, dispensed_volume_ml):
     if elapsed_time_s <= 0 or dispensed_volume_ml < 0:
         return 0
     return dispensed_volume_ml / elapsed_time_s
 
-def prime_pump(pump_id, prime_duration=1.0):
-    """Activates the pump briefly to prime it"""
-    pin = PUMP_GPIO_PINS.get(pump_id)
-    if not pin or not GPIO:
-        logging.error(f"No GPIO pin assigned or GPIO unavailable for pump {pump_id}")
-        return
+# Prime time for a hose nothing has been learned about yet
+DEFAULT_PRIME_S = 1.0
+
+def prime_pump(pump_id, prime_duration=None):
+    """Activates the pump briefly to prime it, by default just long enough to refill its tubing"""
+    if prime_duration is None:
+        fill_ml = hose_priming.fill_ml(pump_id)
+        flow_rate = pump_calibrations_snapshot().get(pump_id, 0)
+        prime_duration = (pump_startup_snapshot().get(pump_id, 0.0) + fill_ml / flow_rate
+                          if fill_ml > 0 and flow_rate > 0 else DEFAULT_PRIME_S)
     logging.info(f"Priming pump {pump_id} for {prime_duration} seconds...")
     try:
-        GPIO.output(pin, GPIO.HIGH)
-        time.sleep(prime_duration)
-        GPIO.output(pin, GPIO.LOW)
+        engine.prime(pump_id, prime_duration).result()
         logging.info(f"Pump {pump_id} primed")
     except Exception as e:
         logging.error(f"Error priming pump {pump_id}: {e}")
@@ -3,3 +3,7 @@ import os
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key'
     DEBUG = True
+    # Order scheduling policy for the web queue: 'fifo', 'sjf' or 'priority'
+    ORDER_SCHEDULING = os.environ.get('ORDER_SCHEDULING', 'fifo')
+    # Pour orders the bottles can cover ahead of ones that would run a bottle dry
+    DEFER_SHORT_ORDERS = os.environ.get('DEFER_SHORT_ORDERS', '0') == '1'
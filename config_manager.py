@@ -1,100 +1,184 @@
 # config_manager.py
 import os
-import json
 import logging
-from threading import Lock
-
-DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
-os.makedirs(DATA_DIR, exist_ok=True)
+from types import MappingProxyType
+from state_store import DATA_DIR, file_lock, load_json, save_json, store
+from volume_ledger import VolumeLedger
 
 HOSE_ASSIGNMENTS_FILE = os.path.join(DATA_DIR, 'hose_assignments.json')
 PUMP_CALIBRATIONS_FILE = os.path.join(DATA_DIR, 'pump_calibrations.json')
+PUMP_STARTUP_FILE = os.path.join(DATA_DIR, 'pump_startup.json')
 HOSE_STATUSES_FILE = os.path.join(DATA_DIR, 'hose_statuses.json')
 BOTTLE_VOLUMES_FILE = os.path.join(DATA_DIR, 'bottle_volumes.json')
+BOTTLE_LEDGER_FILE = os.path.join(DATA_DIR, 'bottle_ledger.log')
+PUMP_POWER_FILE = os.path.join(DATA_DIR, 'pump_power.json')
+# Size booked for a swapped bottle on a hose that has no bottle record, as the settings screens default to
+DEFAULT_BOTTLE_ML = 1000
+
+bottle_ledger = VolumeLedger(BOTTLE_VOLUMES_FILE, BOTTLE_LEDGER_FILE)
+
+# Parsers turn raw JSON into the read-only snapshots held by the state store
+
+def _parse_hose_assignments(data):
+    return MappingProxyType({int(k): str(v) for k, v in data.items() if isinstance(k, (int, str)) and isinstance(v, str)})
+
+def normalize_ingredient(name):
+    """Canonical, case-folded form of an ingredient name used for all matching"""
+    return ' '.join(str(name).split()).casefold()
+
+def _build_ingredient_index(data):
+    index = {}
+    for hose_id, beverage in sorted(_parse_hose_assignments(data).items()):
+        key = normalize_ingredient(beverage)
+        if key:
+            index.setdefault(key, []).append(hose_id)
+    return MappingProxyType({k: tuple(v) for k, v in index.items()})
+
+def _parse_pump_calibrations(data):
+    return MappingProxyType({int(k): float(v) for k, v in data.items() if isinstance(k, (int, str)) and isinstance(v, (int, float))})
+
+def _parse_hose_statuses(data):
+    return MappingProxyType({int(k): bool(v) for k, v in data.items() if isinstance(k, (int, str))})
+
+def _parse_pump_power(data):
+    max_concurrent = data.get('max_concurrent_pumps')
+    max_current = data.get('max_total_current_a')
+    return MappingProxyType({
+        'max_concurrent_pumps': int(max_concurrent) if max_concurrent else None,
+        'max_total_current_a': float(max_current) if max_current else None,
+        'default_current_a': float(data.get('default_current_a', 1.0)),
+        'pump_current_a': MappingProxyType({int(k): float(v) for k, v in data.get('pump_current_a', {}).items()
+                                            if isinstance(v, (int, float))})
+    })
+
+def hose_assignments_snapshot():
+    """Read-only {hose_id: beverage_name} view, shared between callers"""
+    return store.get(HOSE_ASSIGNMENTS_FILE, {}, _parse_hose_assignments)
+
+def ingredient_index_snapshot():
+    """Read-only {ingredient: (hose_id, ...)} reverse index, rebuilt only when assignments change"""
+    return store.get(HOSE_ASSIGNMENTS_FILE, {}, _build_ingredient_index)
+
+def find_hoses(ingredient, index=None):
+    """Returns the ids of all hoses holding ingredient, in hose order"""
+    if index is None:
+        index = ingredient_index_snapshot()
+    return index.get(normalize_ingredient(ingredient), ())
 
-file_lock = Lock()
-
-def load_json(file_path, default):
-    with file_lock:
-        if not os.path.exists(file_path):
-            return default
-        try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-            return data
-        except Exception as e:
-            logging.error(f"Error loading {file_path}: {e}")
-            return default
-
-def save_json(data, file_path):
-    with file_lock:
-        try:
-            with open(file_path, 'w') as f:
-                json.dump(data, f, indent=4)
-        except Exception as e:
-            logging.error(f"Error saving {file_path}: {e}")
+def find_hose(ingredient, hose_statuses=None):
+    """Returns the hose to pour ingredient from, preferring one not marked empty, or None"""
+    hoses = find_hoses(ingredient)
+    if not hoses:
+        return None
+    if hose_statuses is None:
+        hose_statuses = hose_statuses_snapshot()
+    return next((hose_id for hose_id in hoses if not hose_statuses.get(hose_id, True)), hoses[0])
+
+def usable_hoses(ingredient, hose_statuses=None):
+    """Returns every hose holding ingredient that is not marked empty, or just the first one if all are"""
+    hoses = find_hoses(ingredient)
+    if hose_statuses is None:
+        hose_statuses = hose_statuses_snapshot()
+    usable = tuple(hose_id for hose_id in hoses if not hose_statuses.get(hose_id, True))
+    return usable or hoses[:1]
+
+def pump_calibrations_snapshot():
+    """Read-only {pump_id: flow_rate_ml_per_sec} view, shared between callers"""
+    return store.get(PUMP_CALIBRATIONS_FILE, {}, _parse_pump_calibrations)
+
+def pump_startup_snapshot():
+    """Read-only {pump_id: seconds} a pump runs before liquid flows at its calibrated rate"""
+    return store.get(PUMP_STARTUP_FILE, {}, _parse_pump_calibrations)
+
+def hose_statuses_snapshot():
+    """Read-only {hose_id: is_empty} view, shared between callers"""
+    return store.get(HOSE_STATUSES_FILE, {}, _parse_hose_statuses)
+
+def pump_power_snapshot():
+    """Read-only supply limits: max_concurrent_pumps, max_total_current_a and per-pump pump_current_a"""
+    return store.get(PUMP_POWER_FILE, {}, _parse_pump_power)
+
+def config_generation():
+    """Goes up whenever hose assignments, hose statuses, calibrations or power limits change"""
+    ingredient_index_snapshot()
+    hose_statuses_snapshot()
+    pump_calibrations_snapshot()
+    pump_startup_snapshot()
+    pump_power_snapshot()
+    return store.generation
+
+def bottle_volumes_snapshot():
+    """Read-only {hose_id: {'total_volume_ml', 'remaining_volume_ml'}} view, including unflushed pours"""
+    return bottle_ledger.snapshot()
 
 def load_hose_assignments():
     """Returns a dict {hose_id (int): beverage_name (str)}"""
-    data = load_json(HOSE_ASSIGNMENTS_FILE, {})
-    return {int(k): str(v) for k, v in data.items() if isinstance(k, (int, str)) and isinstance(v, str)}
+    return dict(hose_assignments_snapshot())
 
 def save_hose_assignments(assignments):
     save_json({str(k): v for k, v in assignments.items()}, HOSE_ASSIGNMENTS_FILE)
 
 def load_pump_calibrations():
     """Returns a dict {pump_id (int): flow_rate_ml_per_sec (float)}"""
-    data = load_json(PUMP_CALIBRATIONS_FILE, {})
-    return {int(k): float(v) for k, v in data.items() if isinstance(k, (int, str)) and isinstance(v, (int, float))}
+    return dict(pump_calibrations_snapshot())
 
-def save_pump_calibration(pump_id, flow_rate):
-    if not isinstance(flow_rate, (int, float)) or flow_rate < 0:
-        raise ValueError("Flow rate must be a non-negative number")
+def save_pump_calibration(pump_id, flow_rate, startup_s=None):
+    """Saves pump_id's flow rate and, if given, its start-up time (see calibration_history)"""
+    if not isinstance(flow_rate, (int, float)) or flow_rate <= 0:
+        raise ValueError("Flow rate must be a positive number")
     calibrations = load_pump_calibrations()
     calibrations[int(pump_id)] = float(flow_rate)
     save_json(calibrations, PUMP_CALIBRATIONS_FILE)
+    if startup_s is not None:
+        startup = dict(pump_startup_snapshot())
+        startup[int(pump_id)] = max(0.0, float(startup_s))
+        save_json(startup, PUMP_STARTUP_FILE)
 
 def load_hose_statuses():
     """Returns a dict {hose_id (int): is_empty (bool)}"""
-    data = load_json(HOSE_STATUSES_FILE, {})
-    return {int(k): bool(v) for k, v in data.items() if isinstance(k, (int, str))}
+    return dict(hose_statuses_snapshot())
 
 def save_hose_statuses(statuses):
     save_json({str(k): v for k, v in statuses.items()}, HOSE_STATUSES_FILE)
 
 def load_bottle_volumes():
-    """Returns a dict {hose_id (int): {'total_volume_ml': int, 'remaining_volume_ml': int}}"""
-    data = load_json(BOTTLE_VOLUMES_FILE, {})
-    volumes = {}
-    for k, v in data.items():
-        try:
-            hose_id = int(k)
-            volumes[hose_id] = {
-                'total_volume_ml': int(v.get('total_volume_ml', 0)),
-                'remaining_volume_ml': int(v.get('remaining_volume_ml', 0))
-            }
-        except Exception as e:
-            logging.error(f"Error processing bottle volume for hose {k}: {e}")
-    return volumes
+    """Returns a dict {hose_id (int): {'total_volume_ml': int, 'remaining_volume_ml': float}}"""
+    return {hose_id: dict(vol) for hose_id, vol in bottle_volumes_snapshot().items()}
 
 def save_bottle_volumes(volumes):
-    data = {str(k): v for k, v in volumes.items()}
-    save_json(data, BOTTLE_VOLUMES_FILE)
+    """Replaces all bottle levels and folds the consumption ledger into the snapshot"""
+    bottle_ledger.reset(volumes)
+
+def refill_bottle(hose_id, volume_ml=None):
+    """Books a full bottle on hose_id without rewriting the other hoses' levels; returns its volume.
+
+    volume_ml defaults to the size of the bottle it replaces, or
+    DEFAULT_BOTTLE_ML if the hose has no bottle record yet.
+    """
+    if volume_ml is None:
+        bottle = bottle_volumes_snapshot().get(hose_id)
+        volume_ml = bottle['total_volume_ml'] if bottle is not None and bottle['total_volume_ml'] > 0 else None
+    if volume_ml is None:
+        logging.warning(f"Hose {hose_id} has no bottle record; booking a {DEFAULT_BOTTLE_ML} ml bottle")
+        volume_ml = DEFAULT_BOTTLE_ML
+    bottle_ledger.refill(hose_id, volume_ml)
+    return volume_ml
 
 def update_remaining_volume(hose_id, dispensed_volume):
     """Subtract dispensed_volume (ml) from the hose_id's remaining_volume_ml"""
-    if not isinstance(dispensed_volume, (int, float)) or dispensed_volume < 0:
-        raise ValueError("Dispensed volume must be a non-negative number")
-    volumes = load_bottle_volumes()
-    if hose_id in volumes:
-        volumes[hose_id]['remaining_volume_ml'] = max(
-            0, volumes[hose_id]['remaining_volume_ml'] - dispensed_volume
-        )
-    save_bottle_volumes(volumes)
+    bottle_ledger.consume(hose_id, dispensed_volume)
+
+def update_remaining_volumes(dispensed):
+    """Subtracts {hose_id: ml} from the bottles in one ledger write"""
+    bottle_ledger.consume_many(dispensed)
+
+def get_remaining_volume(hose_id):
+    """Returns the remaining volume (ml) for hose_id without copying the other hoses"""
+    return bottle_ledger.remaining(hose_id)
 
 def get_low_volume_hoses(threshold=0.1):  # 10% threshold
     """Returns dict of hoses with low volume {hose_id: remaining_fraction}"""
-    volumes = load_bottle_volumes()
+    volumes = bottle_volumes_snapshot()
     return {
         hose_id: vol['remaining_volume_ml'] / vol['total_volume_ml']
         for hose_id, vol in volumes.items()
@@ -1,11 +1,12 @@
 # controller.py
 import logging
-from drink_mixer import mix_drink, clean_pumps
+from drink_mixer import mix_drink, clean_pumps, emergency_stop, resume
 from recipe_manager import load_all_recipes, get_recipe_by_id, save_recipe, delete_recipe
 from config_manager import (
     load_hose_assignments, load_hose_statuses, load_bottle_volumes, get_low_volume_hoses,
-    save_hose_assignments, save_hose_statuses, save_bottle_volumes
+    save_hose_assignments, save_hose_statuses, save_bottle_volumes, ingredient_index_snapshot
 )
+from dispense_plan import dry_run
 from calibration_manager import start_calibration, stop_calibration, prime_pump, check_density
 
 class DrinkMixerController:
@@ -35,19 +36,26 @@ class DrinkMixerController:
             logging.error("Error in get_recipe_by_id: %s", e)
             return None
 
-    def mix_drink(self, drink_id, size, progress_callback, finished_callback):
-        logging.debug("Mixing drink: drink_id=%s, size=%s", drink_id, size)
+    def mix_drink(self, drink_id, size, progress_callback, finished_callback, servings=1):
+        """Pours servings drinks of size ml together, e.g. a pitcher: each pump runs once for the lot"""
+        logging.debug("Mixing drink: drink_id=%s, size=%s, servings=%s", drink_id, size, servings)
         try:
-            recipe = self.get_recipe_by_id(drink_id)
-            if not recipe:
+            if not self.get_recipe_by_id(drink_id):
                 return None
-            base_total = sum(recipe['ingredients'].values())
-            scaling_factor = size / base_total
-            return mix_drink(drink_id, scaling_factor, progress_callback, finished_callback)
+            return mix_drink(drink_id, size, progress_callback, finished_callback, servings)
         except Exception as e:
             logging.error("Error in mix_drink: %s", e)
             return None
 
+    def plan_drink(self, drink_id, size, servings=1):
+        """Dry run: the pumps, volumes, timings and bottle shortfalls for a drink, without pouring it"""
+        logging.debug("Planning drink: drink_id=%s, size=%s, servings=%s", drink_id, size, servings)
+        try:
+            return dry_run(drink_id, size, servings)
+        except Exception as e:
+            logging.error("Error in plan_drink: %s", e)
+            return None
+
     def clean_pumps(self, progress_callback, finished_callback):
         logging.debug("Cleaning pumps")
         try:
@@ -56,6 +64,29 @@ class DrinkMixerController:
             logging.error("Error in clean_pumps: %s", e)
             return None
 
+    def cancel(self, task):
+        logging.debug("Cancelling engine task")
+        try:
+            return task.cancel()
+        except Exception as e:
+            logging.error("Error in cancel: %s", e)
+            return False
+
+    def emergency_stop(self):
+        logging.debug("Emergency stop")
+        try:
+            return emergency_stop()
+        except Exception as e:
+            logging.error("Error in emergency_stop: %s", e)
+            return None
+
+    def resume(self):
+        logging.debug("Resuming after emergency stop")
+        try:
+            resume()
+        except Exception as e:
+            logging.error("Error in resume: %s", e)
+
     def save_recipe(self, drink_id, name, ingredients, notes):
         logging.debug("Saving recipe: drink_id=%s", drink_id)
         try:
@@ -102,6 +133,14 @@ class DrinkMixerController:
             logging.error("Error in get_hose_assignments: %s", e)
             return {}
 
+    def get_ingredient_index(self):
+        logging.debug("Getting ingredient index")
+        try:
+            return ingredient_index_snapshot()
+        except Exception as e:
+            logging.error("Error in get_ingredient_index: %s", e)
+            return {}
+
     def update_hose_assignments(self, assignments):
         logging.debug("Updating hose assignments")
         try:
@@ -0,0 +1,625 @@
+# dispense_engine.py
+import os
+import time
+import queue
+import logging
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+from pump_timing import prepare_thread, record_activation, run_pump
+from pump_driver import get_pump_driver
+from live_state import LiveState
+from power_budget import PowerBudget, critical_path_order, plan, released
+from config_manager import (
+    bottle_volumes_snapshot, refill_bottle, update_remaining_volumes, pump_power_snapshot
+)
+from dispense_plan import PumpJob, batch_volume, compile_plan
+from hose_priming import hose_priming
+
+# Upper bound on progress events per running command; DRINKMIXER_PROGRESS_HZ=0 reports only as pumps stop
+PROGRESS_HZ = float(os.environ.get('DRINKMIXER_PROGRESS_HZ', 10))
+# How often a pour with a parked pump checks whether it may start
+PARK_POLL = 0.1
+# A pour parked on a bottle swap nobody confirms is given up after this many seconds, freeing the engine
+SWAP_TIMEOUT_S = float(os.environ.get('DRINKMIXER_SWAP_TIMEOUT_S', 600))
+
+class PourProgress:
+    """Fraction poured and seconds left at any moment of a pour.
+
+    The fraction follows the jobs themselves, by volume (by time for jobs
+    without a volume, such as cleaning): finished jobs count in full and
+    running ones pro rata, so it moves smoothly instead of in
+    whole-ingredient steps and holds still while a pump is parked. The ETA
+    is the planned makespan, stretched while a parked job still has its
+    whole run ahead of it.
+    """
+    def __init__(self, jobs, makespan, started_at=0.0):
+        self.jobs = list(jobs)
+        self.makespan = makespan
+        self.started_at = started_at
+        self.by_volume = sum(job.volume_ml for job in self.jobs) > 0
+        self.total = sum(self._weight(job) for job in self.jobs)
+
+    def _weight(self, job):
+        return job.volume_ml if self.by_volume else job.duration
+
+    def at(self, now):
+        """Returns (fraction, eta_s) at driver time now"""
+        poured = 0.0
+        left = [max(0.0, self.makespan - (now - self.started_at))]
+        for job in self.jobs:
+            if job.duration <= 0:
+                continue
+            if job.started_at is None:
+                left.append(job.duration)
+                continue
+            end = job.stopped_at if job.stopped_at is not None else now
+            poured += self._weight(job) * min(1.0, max(0.0, (end - job.started_at) / job.duration))
+            if job.stopped_at is None:
+                left.append(max(0.0, job.started_at + job.duration - now))
+        return (poured / self.total if self.total > 0 else 1.0), max(left)
+
+def _stop_all(running, driver):
+    """Switches off every running job as fast as possible and returns them"""
+    for job in running:
+        try:
+            driver.set_pump(job.pump_id, False)
+        except Exception as e:
+            logging.error(f"Error stopping pump {job.pump_id}: {e}")
+        job.stopped_at = driver.monotonic()
+    stopped = list(running)
+    del running[:]
+    return stopped
+
+def dispense_concurrently(jobs, driver, on_pump_done=None, cancel=None, budget=None, on_pump_start=None,
+                          on_tick=None, tick_interval=0.0, ready=None, ordered=False):
+    """Runs jobs side by side within the power budget, switching each pump off at its own deadline.
+
+    driver is a pump_driver.PumpDriver, whose clock also times the pour;
+    budget is a power_budget.PowerBudget (default: no limit). Jobs start
+    longest chain first, or in the order given if ordered (a DispensePlan's
+    start order), and whenever a pump stops, every waiting job that now
+    fits the budget and whose job.after have all stopped starts.
+    on_pump_start(job) and on_pump_done(job) are called as each pump starts
+    and stops; with a tick_interval (seconds), on_tick(now) is also called
+    that often in between. A job for which
+    ready(job) is false is parked: the other jobs go ahead, and it starts
+    once ready(job) turns true (checked every PARK_POLL seconds, in real
+    time once nothing else is running).
+    Setting cancel (a threading.Event) switches every running pump off at
+    once; the interrupted jobs are still passed to on_pump_done, with
+    dispensed_ml covering what actually reached the glass. Returns the jobs
+    in the order they stopped.
+    """
+    budget = budget or PowerBudget()
+    pending = [job for job in jobs if job.duration > 0]
+    if not ordered:
+        pending = critical_path_order(pending)
+    running = []
+    completed = []
+    finished = set()
+    peak = 0
+    next_tick = driver.monotonic() + tick_interval
+    prepare_thread()
+    try:
+        while pending or running:
+            for job in list(pending):
+                if cancel is not None and cancel.is_set():
+                    break
+                if not released(job, finished):
+                    continue
+                if ready is not None and not ready(job):
+                    continue
+                if budget.fits([j.pump_id for j in running], job.pump_id):
+                    driver.set_pump(job.pump_id, True)
+                    job.started_at = driver.monotonic()
+                    running.append(job)
+                    pending.remove(job)
+                    if on_pump_start:
+                        on_pump_start(job)
+            peak = max(peak, len(running))
+            parked = ready is not None and any(not ready(j) for j in pending)
+            if cancel is not None and cancel.is_set() or not running and not parked:
+                break
+            if not running:
+                # Only a person can unpark it now: wait in real time so a virtual clock does not run ahead meanwhile
+                if (cancel or threading.Event()).wait(PARK_POLL):
+                    break
+                continue
+            deadline = wake = None
+            if running:
+                job = min(running, key=lambda j: j.started_at + j.duration)
+                deadline = wake = job.started_at + job.duration
+            if on_tick and tick_interval > 0 and (wake is None or next_tick < wake):
+                wake = next_tick
+            if parked and driver.monotonic() + PARK_POLL < wake:
+                wake = driver.monotonic() + PARK_POLL
+            if wake != deadline:
+                if not driver.sleep_until(wake, cancel):
+                    break
+                now = driver.monotonic()
+                if on_tick and tick_interval > 0 and now >= next_tick:
+                    on_tick(now)
+                    while next_tick <= now:
+                        next_tick += tick_interval
+                continue
+            if not driver.sleep_until(deadline, cancel):
+                break
+            driver.set_pump(job.pump_id, False)
+            job.stopped_at = driver.monotonic()
+            running.remove(job)
+            completed.append(job)
+            finished.add(id(job))
+            record_activation(job.pump_id, job.duration, job.actual_duration)
+            if on_pump_done:
+                on_pump_done(job)
+        interrupted = _stop_all(running, driver)
+    finally:
+        # Never leave a pump running if a callback or the hardware raised
+        _stop_all(running, driver)
+    logging.info(f"Dispensed {len(completed)} jobs with up to {peak} pumps at once")
+    if interrupted:
+        logging.warning(f"Pour interrupted with {len(interrupted)} pumps still running")
+    for job in interrupted:
+        completed.append(job)
+        if on_pump_done:
+            on_pump_done(job)
+    return completed
+
+class EngineHalted(RuntimeError):
+    """Raised for commands refused while the emergency stop is latched"""
+
+class DispenseEngine:
+    """The single owner of the pumps.
+
+    Pour, prime, switch (press-and-hold calibration) and clean commands are
+    queued from any thread and run one at a time on a long-lived engine
+    thread. Each submit method returns a concurrent.futures.Future carrying
+    a command_id. Progress is published as (event, data) to every
+    subscriber, on the engine thread, and data always includes the
+    command_id.
+
+    cancel() stops one command, queued or running. emergency_stop() drives
+    every pump low from the calling thread and latches the engine: queued
+    commands wait, and prime or switch-on requests are refused, until
+    resume(). Both paths record the time from request to pumps off.
+    pour_progress carries the fraction poured by volume and an eta_s, at
+    most progress_hz times a second.
+
+    Pump activity, bottle levels and the running command are mirrored into
+    a live_state.LiveState segment for readers in other processes.
+    """
+    def __init__(self, driver=None, progress_hz=PROGRESS_HZ, swap_timeout=SWAP_TIMEOUT_S):
+        self._driver = driver
+        self.progress_hz = progress_hz
+        self.swap_timeout = swap_timeout
+        self._commands = queue.Queue()
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._command_ids = itertools.count(1)
+        self._state_lock = threading.Lock()
+        self._futures = {}
+        self._current = None
+        self._stop = threading.Event()
+        self._stop_requested_at = None
+        self._ready = threading.Event()
+        self._ready.set()
+        self._stop_latencies = deque(maxlen=200)
+        self._swaps = {}
+        self._swap_expired = None
+        self._swap_waits = deque(maxlen=200)
+        self.live = LiveState()
+
+    @property
+    def driver(self):
+        return self._driver or get_pump_driver()
+
+    @property
+    def halted(self):
+        return not self._ready.is_set()
+
+    def subscribe(self, callback):
+        """Calls callback(event, data) for every engine event; returns callback"""
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._subscribers_lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, event, **data):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event, data)
+            except Exception as e:
+                logging.error(f"Dispense engine subscriber failed on {event}: {e}")
+
+    def start(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self.live.open_writer(self.driver.pump_ids):
+                    self.live.set_bottles(bottle_volumes_snapshot())
+                    self.live.set_halted(self.halted)
+                self._thread = threading.Thread(target=self._run, name='dispense-engine', daemon=True)
+                self._thread.start()
+
+    def _submit(self, kind, refuse_when_halted=False, **params):
+        future = Future()
+        future.command_id = next(self._command_ids)
+        if refuse_when_halted and self.halted:
+            error = EngineHalted("Dispensing is halted by the emergency stop")
+            self.publish(f'{kind}_error', command_id=future.command_id, order_id=params.get('order_id'),
+                         error=str(error))
+            future.set_exception(error)
+            return future
+        with self._state_lock:
+            self._futures[future.command_id] = (future, kind, params)
+        self._commands.put((future, kind, params))
+        self.start()
+        return future
+
+    def pour(self, drink_id, size_ml, order_id=None, allow_swap=False, servings=1):
+        """Pours servings drinks of size_ml each of drink_id, following its cached dispense_plan.DispensePlan.
+
+        A batch (pitcher or round) is a single pass: each pump runs once for
+        the combined volume, bottles are checked once and the consumption is
+        booked in one ledger write.
+
+        With allow_swap, a short bottle publishes bottle_swap and parks its
+        pump until confirm_swap(hose_id) while the other pumps carry on;
+        otherwise the pour is refused. A swap not confirmed within
+        swap_timeout seconds publishes bottle_swap_timeout and abandons the
+        pour, so the queue behind it moves on. Resolves to True once the
+        drink is poured and False if it was refused, cancelled or abandoned.
+        """
+        return self._submit('pour', drink_id=drink_id, size_ml=size_ml, order_id=order_id, allow_swap=allow_swap,
+                            servings=servings)
+
+    def prime(self, pump_id, duration):
+        """Runs one pump for duration seconds; resolves to the achieved on-time"""
+        return self._submit('prime', refuse_when_halted=True, pump_id=pump_id, duration=duration)
+
+    def switch(self, pump_id, on):
+        """Turns a pump on or off until told otherwise; resolves to the driver time of the switch"""
+        if not on and self.halted:
+            # The emergency stop already switched everything off, so don't queue behind the latch
+            future = Future()
+            future.command_id = next(self._command_ids)
+            future.set_result(self.driver.monotonic())
+            return future
+        return self._submit('switch', refuse_when_halted=on, pump_id=pump_id, on=on)
+
+    def clean(self, duration=30.0):
+        """Flushes every pump for duration seconds, as many at a time as the power budget allows"""
+        return self._submit('clean', duration=duration)
+
+    def confirm_swap(self, hose_id, volume_ml=None):
+        """Books a full bottle of volume_ml on hose_id and lets a pour parked on it carry on.
+
+        volume_ml defaults to the size of the bottle it replaces (see
+        config_manager.refill_bottle). Returns True if a pour was waiting for
+        this swap. The time from the swap request to this call is recorded
+        for swap_stats().
+        """
+        refill_bottle(hose_id, volume_ml)
+        hose_priming.swapped(hose_id)
+        with self._state_lock:
+            entry = self._swaps.pop(hose_id, None)
+        if entry is None:
+            return False
+        command_id, requested_at, _ = entry
+        wait = max(0.0, self.driver.monotonic() - requested_at)
+        self._swap_waits.append(wait)
+        logging.info(f"Bottle on hose {hose_id} swapped after {wait:.1f}s")
+        self.publish('bottle_swapped', command_id=command_id, hose_id=hose_id, wait_s=round(wait, 1))
+        return True
+
+    def swap_stats(self):
+        """Bottle swaps waited on recently (request to confirmation, in seconds) and those still pending"""
+        with self._state_lock:
+            pending = sorted(self._swaps)
+        waits = list(self._swap_waits)
+        return {'swaps': len(waits), 'pending': pending,
+                'mean_wait_s': round(sum(waits) / len(waits), 1) if waits else 0.0,
+                'max_wait_s': round(max(waits, default=0.0), 1)}
+
+    def cancel(self, command_id):
+        """Stops a running command or drops a queued one; returns False if it already finished"""
+        with self._state_lock:
+            entry = self._futures.get(command_id)
+            if entry is None:
+                return False
+            future, kind, params = entry
+            if self._current is future:
+                self._stop_requested_at = self.driver.monotonic()
+                self._stop.set()
+                logging.info(f"Cancelling running {kind} command {command_id}")
+                return True
+            if not future.cancel():
+                return False
+            del self._futures[command_id]
+        logging.info(f"Cancelled queued {kind} command {command_id}")
+        self.publish(f'{kind}_cancelled', command_id=command_id, order_id=params.get('order_id'), dispensed={})
+        return True
+
+    def emergency_stop(self):
+        """Drives every pump low now, aborts the running command and holds the queue until resume()"""
+        driver = self.driver
+        with self._state_lock:
+            self._ready.clear()
+            self._stop_requested_at = driver.monotonic()
+            self._stop.set()
+        driver.all_off()
+        latency = self._record_stop()
+        self.live.all_off()
+        self.live.set_halted(True)
+        logging.warning(f"Emergency stop: all pumps off in {latency * 1000:.2f} ms")
+        self.publish('emergency_stop', latency_ms=round(latency * 1000, 3))
+        return latency
+
+    def resume(self):
+        """Releases the emergency stop latch"""
+        if self.halted:
+            logging.info("Dispense engine resumed after emergency stop")
+            self._ready.set()
+            self.live.set_halted(False)
+            self.publish('resumed')
+
+    def wait_ready(self, timeout=None):
+        """Blocks while the emergency stop is latched; returns False on timeout"""
+        return self._ready.wait(timeout)
+
+    def _record_stop(self, stopped_at=None):
+        """Books the time from the last stop request to stopped_at (default: now); returns it in seconds"""
+        if stopped_at is None:
+            stopped_at = self.driver.monotonic()
+        latency = max(0.0, stopped_at - self._stop_requested_at)
+        self._stop_latencies.append(latency)
+        return latency
+
+    def cleanup(self):
+        """Releases the pump hardware; call once when the process exits"""
+        self.driver.cleanup()
+
+    def stop_stats(self):
+        """Recent stop latencies (request to last pump off) in milliseconds"""
+        latencies = [latency * 1000 for latency in self._stop_latencies]
+        if not latencies:
+            return {'stops': 0, 'last_ms': 0.0, 'mean_ms': 0.0, 'max_ms': 0.0, 'halted': self.halted}
+        return {'stops': len(latencies), 'last_ms': round(latencies[-1], 3),
+                'mean_ms': round(sum(latencies) / len(latencies), 3),
+                'max_ms': round(max(latencies), 3), 'halted': self.halted}
+
+    def _cancelled(self):
+        """True if the running command was cancelled, as opposed to halted by the emergency stop"""
+        return self._stop.is_set() and not self.halted
+
+    def _run(self):
+        handlers = {'pour': self._pour, 'prime': self._prime, 'switch': self._switch, 'clean': self._clean}
+        prepare_thread()
+        while True:
+            future, kind, params = self._commands.get()
+            # Queued work waits here while the emergency stop is latched
+            self._ready.wait()
+            with self._state_lock:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._current = future
+                self._stop.clear()
+            self.live.set_command(future.command_id)
+            try:
+                future.set_result(handlers[kind](future.command_id, **params))
+            except Exception as e:
+                logging.error(f"Dispense engine {kind} command failed: {e}")
+                self.publish(f'{kind}_error', command_id=future.command_id, order_id=params.get('order_id'),
+                             error=str(e))
+                future.set_exception(e)
+            finally:
+                with self._state_lock:
+                    self._current = None
+                    self._futures.pop(future.command_id, None)
+                self.live.all_off()
+                self.live.set_command(0)
+                self.live.set_bottles(bottle_volumes_snapshot())
+
+    def _tick_interval(self):
+        return 1.0 / self.progress_hz if self.progress_hz > 0 else 0.0
+
+    def _progress_reporter(self, command_id, order_id, progress):
+        """Returns report(now), which publishes pour_progress unless one went out less than a tick ago"""
+        interval = self._tick_interval()
+        last = None
+
+        def report(now):
+            nonlocal last
+            # Ticks arrive every interval give or take clock jitter, so only drop clearly early reports
+            if last is not None and now - last < interval * 0.9:
+                return
+            last = now
+            fraction, eta = progress.at(now)
+            self.live.set_command(command_id, fraction)
+            self.publish('pour_progress', command_id=command_id, order_id=order_id,
+                         progress=round(fraction, 4), eta_s=round(eta, 1))
+        return report
+
+    def _book(self, jobs):
+        """Books what the jobs poured, one ledger write for the whole pour, and which tubes are now full"""
+        dispensed = {}
+        for job in jobs:
+            if job.stopped_at is not None:
+                # Liquid left in the tubing came out of the bottle too
+                dispensed[job.pump_id] = dispensed.get(job.pump_id, 0.0) + job.dispensed_ml + job.filled_ml
+        update_remaining_volumes(dispensed)
+        hose_priming.used(job.pump_id for job in jobs
+                          if job.stopped_at is not None and job.actual_duration >= job.lead_s)
+        self.live.set_bottles(bottle_volumes_snapshot())
+
+    def _request_swap(self, command_id, order_id, hose_id, ingredient):
+        with self._state_lock:
+            # The timeout is a person's deadline, so it runs on real time even under a virtual clock
+            self._swaps[hose_id] = (command_id, self.driver.monotonic(), time.monotonic())
+        logging.info(f"Waiting for the {ingredient} bottle on hose {hose_id} to be swapped")
+        self.publish('bottle_swap', command_id=command_id, order_id=order_id, hose_id=hose_id, ingredient=ingredient)
+
+    def _swap_done(self, job):
+        with self._state_lock:
+            entry = self._swaps.get(job.pump_id)
+            if entry is None:
+                return True
+            if time.monotonic() - entry[2] >= self.swap_timeout and not self._stop.is_set():
+                # Abandons the pour through the same stop as a cancel
+                self._swap_expired = (job.pump_id, job.ingredient)
+                self._stop.set()
+            return False
+
+    def _drop_swaps(self, command_id):
+        """Forgets swaps nobody confirmed before command_id ended"""
+        with self._state_lock:
+            for hose_id in [h for h, (c, _, _) in self._swaps.items() if c == command_id]:
+                del self._swaps[hose_id]
+
+    def _pump_started(self, job):
+        self.live.pump_on(job.pump_id, job.duration)
+
+    def _interrupted(self, command_id, kind, stopped_at, order_id=None, dispensed=None):
+        """Books the stop latency of a cancelled command and tells subscribers"""
+        if self._cancelled():
+            latency = self._record_stop(stopped_at)
+            logging.info(f"{kind} command {command_id} stopped {latency * 1000:.2f} ms after cancel")
+        self.publish(f'{kind}_cancelled', command_id=command_id, order_id=order_id, dispensed=dispensed or {})
+        return False
+
+    def _pour(self, command_id, drink_id, size_ml, order_id, allow_swap, servings=1):
+        try:
+            total_ml = batch_volume(size_ml, servings)
+        except ValueError as e:
+            self.publish('pour_error', command_id=command_id, order_id=order_id, error=str(e))
+            return False
+        compiled = compile_plan(drink_id, total_ml)
+        if compiled is None:
+            self.publish('pour_error', command_id=command_id, order_id=order_id, error='Recipe not found')
+            return False
+
+        bottle_volumes = bottle_volumes_snapshot()
+        self._swap_expired = None
+        self.publish('pour_start', command_id=command_id, order_id=order_id,
+                     drink_id=drink_id, drink_name=compiled.drink_name, servings=servings)
+        for ingredient in compiled.unassigned:
+            logging.error(f"Ingredient {ingredient} not assigned to any hose")
+        # A bottle too low for its share hands the rest to hoses carrying the same ingredient
+        rebalanced = compiled.with_failover(bottle_volumes)
+        if rebalanced is not compiled:
+            # Short hoses with no sibling to take over are left to the swap or refusal below
+            moved = compiled.failed_over(rebalanced)
+            if moved:
+                logging.info(f"Hoses {moved} are running low; pouring from sibling hoses instead")
+                self.publish('hose_failover', command_id=command_id, order_id=order_id, hoses=moved)
+            compiled = rebalanced
+        shortfalls = compiled.shortfalls(bottle_volumes)
+        if shortfalls and not allow_swap:
+            pour = shortfalls[0][0]
+            self.publish('pour_error', command_id=command_id, order_id=order_id,
+                         error=f"Insufficient volume for {pour.ingredient}. Please refill hose {pour.pump_id}.")
+            return False
+        for pour, remaining in shortfalls:
+            self._request_swap(command_id, order_id, pour.pump_id, pour.ingredient)
+        # Tubing that drained back while idle, or is about to get a new bottle, is refilled ahead of the pour
+        fill = hose_priming.fill_volumes([pour.pump_id for pour in compiled.pours],
+                                         {pour.pump_id for pour, _ in shortfalls})
+        if fill:
+            refills = ', '.join(f"hose {hose_id} {ml:.1f} ml" for hose_id, ml in sorted(fill.items()))
+            logging.info(f"Refilling tubing first: {refills}")
+            compiled = compiled.with_fill(fill)
+
+        # Pumps run side by side as far as the power supply allows; a pump waiting for a swap is parked
+        jobs = compiled.jobs()
+        driver = self.driver
+        progress = PourProgress(jobs, compiled.makespan, driver.monotonic())
+        report_progress = self._progress_reporter(command_id, order_id, progress)
+
+        def on_pump_done(job):
+            self.live.pump_off(job.pump_id, job.actual_duration)
+            report_progress(job.stopped_at)
+
+        try:
+            done = dispense_concurrently(jobs, driver, on_pump_done, self._stop, compiled.budget, self._pump_started,
+                                         report_progress, self._tick_interval(), self._swap_done, ordered=True)
+        finally:
+            self._drop_swaps(command_id)
+            self._book(jobs)
+        if self._swap_expired is not None:
+            hose_id, ingredient = self._swap_expired
+            logging.error(f"No {ingredient} bottle swap on hose {hose_id} within {self.swap_timeout:.0f} s; "
+                          f"abandoning {compiled.drink_name}")
+            self.publish('bottle_swap_timeout', command_id=command_id, order_id=order_id,
+                         hose_id=hose_id, ingredient=ingredient)
+            self.publish('pour_error', command_id=command_id, order_id=order_id,
+                         error=f"The {ingredient} bottle on hose {hose_id} was not swapped in time.")
+            return False
+        if self._stop.is_set():
+            stopped_at = max((job.stopped_at for job in done), default=None)
+            dispensed = {}
+            for job in done:
+                dispensed[job.ingredient] = dispensed.get(job.ingredient, 0.0) + job.dispensed_ml
+            dispensed = {ingredient: round(ml, 1) for ingredient, ml in dispensed.items()}
+            return self._interrupted(command_id, 'pour', stopped_at, order_id, dispensed)
+        logging.info(f"Poured {compiled.drink_name}")
+        self.publish('pour_complete', command_id=command_id, order_id=order_id, drink_id=drink_id)
+        return True
+
+    def _prime(self, command_id, pump_id, duration):
+        driver = self.driver
+        if pump_id not in driver.pump_ids:
+            raise ValueError(f"No GPIO pin assigned for pump {pump_id}")
+        self.live.pump_on(pump_id, duration)
+        actual = run_pump(driver, pump_id, duration, self._stop)
+        self.live.pump_off(pump_id, actual)
+        if self._stop.is_set():
+            self._interrupted(command_id, 'prime', driver.monotonic())
+            return actual
+        hose_priming.used([pump_id])
+        self.publish('prime_complete', command_id=command_id, pump_id=pump_id, duration=actual)
+        return actual
+
+    def _switch(self, command_id, pump_id, on):
+        driver = self.driver
+        driver.set_pump(pump_id, on)
+        if on:
+            self.live.pump_on(pump_id)
+        else:
+            self.live.pump_off(pump_id)
+        return driver.monotonic()
+
+    def _clean(self, command_id, duration):
+        driver = self.driver
+        budget = PowerBudget.from_config(pump_power_snapshot())
+        jobs = [PumpJob(pump_id, duration) for pump_id in driver.pump_ids]
+        _, makespan = plan(jobs, budget)
+        self.publish('clean_progress', command_id=command_id, pump_id=None,
+                     message=f"Cleaning {len(jobs)} pumps (about {makespan:.0f} s)", progress=0.0)
+        finished = 0
+
+        def on_pump_done(job):
+            nonlocal finished
+            finished += 1
+            self.live.pump_off(job.pump_id, job.actual_duration)
+            self.live.set_command(command_id, finished / len(jobs))
+            self.publish('clean_progress', command_id=command_id, pump_id=job.pump_id,
+                         message=f"Finished cleaning Pump {job.pump_id}", progress=finished / len(jobs))
+
+        logging.info(f"Cleaning {len(jobs)} pumps for {duration} seconds each, planned makespan {makespan:.1f}s")
+        dispense_concurrently(jobs, driver, on_pump_done, self._stop, budget, self._pump_started)
+        if self._stop.is_set():
+            return self._interrupted(command_id, 'clean', driver.monotonic())
+        logging.info("Cleaning sequence complete")
+        self.publish('clean_complete', command_id=command_id)
+        return True
+
+engine = DispenseEngine()
@@ -0,0 +1,294 @@
+# dispense_plan.py
+import os
+from functools import lru_cache
+from config_manager import (
+    usable_hoses, pump_calibrations_snapshot, pump_startup_snapshot, pump_power_snapshot, bottle_volumes_snapshot,
+    config_generation
+)
+from hose_priming import hose_priming
+from power_budget import PowerBudget, plan
+from recipe_manager import get_recipe_by_id, pour_precedence, recipe_repository
+
+DEFAULT_FLOW_RATE = 10.0
+PLAN_CACHE_SIZE = 256
+# Largest total a single pass may pour, e.g. a pitcher; DRINKMIXER_MAX_VESSEL_ML overrides it
+MAX_VESSEL_ML = float(os.environ.get('DRINKMIXER_MAX_VESSEL_ML', 2000))
+
+class PumpJob:
+    """One pump run within a drink: which pump, how long it runs and what it pours.
+
+    The first startup_s seconds of duration spin the pump up and the next
+    fill_s refill the hose's tubing; only what follows reaches the glass.
+    """
+    def __init__(self, pump_id, duration, volume_ml=0.0, ingredient=None, after=(), fill_s=0.0, startup_s=0.0):
+        self.pump_id = pump_id
+        self.duration = float(duration)
+        self.volume_ml = float(volume_ml)
+        self.ingredient = ingredient
+        # Jobs that must have stopped before this one starts, e.g. the base under a float
+        self.after = tuple(after)
+        self.fill_s = float(fill_s)
+        self.startup_s = float(startup_s)
+        self.started_at = None
+        self.stopped_at = None
+
+    @property
+    def actual_duration(self):
+        if self.started_at is None or self.stopped_at is None:
+            return 0.0
+        return self.stopped_at - self.started_at
+
+    @property
+    def lead_s(self):
+        """Seconds from switching the pump on to liquid reaching the glass"""
+        return self.startup_s + self.fill_s
+
+    @property
+    def dispensed_ml(self):
+        """Volume actually poured, pro rata if the pump was stopped early"""
+        pour_s = self.duration - self.lead_s
+        if pour_s <= 0:
+            return 0.0
+        return self.volume_ml * min(1.0, max(0.0, self.actual_duration - self.lead_s) / pour_s)
+
+    @property
+    def filled_ml(self):
+        """Volume that went into the tubing rather than the glass"""
+        pour_s = self.duration - self.lead_s
+        if self.fill_s <= 0 or pour_s <= 0:
+            return 0.0
+        return self.volume_ml / pour_s * min(max(0.0, self.actual_duration - self.startup_s), self.fill_s)
+
+    def __repr__(self):
+        return f"PumpJob(pump_id={self.pump_id}, duration={self.duration:.2f}, volume_ml={self.volume_ml:.1f})"
+
+class PlannedPour:
+    """One ingredient of a plan: the pump, its volume and on-time, and when it starts within the pour.
+
+    after holds the indexes, within the plan's pours, of the pours that must
+    finish first. duration starts with startup_s of pump spin-up and fill_s
+    of refilling the tubing.
+    """
+    def __init__(self, pump_id, ingredient, volume_ml, duration, start_s, after=(), fill_s=0.0, startup_s=0.0):
+        self.pump_id = pump_id
+        self.ingredient = ingredient
+        self.volume_ml = volume_ml
+        self.duration = duration
+        self.start_s = start_s
+        self.after = after
+        self.fill_s = fill_s
+        self.startup_s = startup_s
+
+    def as_dict(self):
+        return {'pump_id': self.pump_id, 'ingredient': self.ingredient, 'volume_ml': round(self.volume_ml, 1),
+                'duration_s': round(self.duration, 3), 'start_s': round(self.start_s, 3), 'after': list(self.after),
+                'fill_s': round(self.fill_s, 3), 'startup_s': round(self.startup_s, 3)}
+
+def split_volume(volume_ml, hoses, caps=None):
+    """Shares volume_ml between hoses [(pump_id, flow_rate), ...] so they all finish together.
+
+    With caps ({pump_id: ml}), a hose is given at most its cap and the rest
+    goes to its siblings, still in proportion to flow rate. If the hoses
+    cannot cover volume_ml between them the caps are ignored, leaving the
+    shortfall for the bottle swap prompt. Returns [(pump_id, ml), ...].
+    """
+    if caps is not None and sum(max(0.0, caps.get(pump_id, 0.0)) for pump_id, _ in hoses) < volume_ml:
+        caps = None
+    shares = {}
+    open_hoses = list(hoses)
+    left = volume_ml
+    while open_hoses:
+        total_rate = sum(rate for _, rate in open_hoses)
+        full = [(pump_id, rate) for pump_id, rate in open_hoses
+                if caps is not None and left * rate / total_rate > caps.get(pump_id, 0.0)]
+        if not full:
+            for pump_id, rate in open_hoses:
+                shares[pump_id] = left * rate / total_rate
+            break
+        for pump_id, rate in full:
+            shares[pump_id] = max(0.0, caps.get(pump_id, 0.0))
+            left -= shares[pump_id]
+            open_hoses.remove((pump_id, rate))
+    return [(pump_id, shares.get(pump_id, 0.0)) for pump_id, _ in hoses]
+
+class DispensePlan:
+    """Everything needed to pour one drink at one size, worked out before any pump runs.
+
+    demands is [(ingredient, volume_ml, ((pump_id, flow_rate), ...)), ...]:
+    an ingredient loaded on several hoses is split across all of them so
+    they pour in parallel. precedence ({ingredient: (ingredients it pours
+    after, ...)}, see recipe_manager.pour_precedence) keeps layered drinks
+    layered; everything else overlaps as far as the power budget allows.
+    pours are in start order, which is also the priority the engine starts
+    them in. fill ({pump_id: ml}) lengthens a pump's run by the time it
+    takes to refill tubing that drained while idle or after a bottle swap
+    (see hose_priming), and every run includes the pump's fitted start-up
+    time (startup, {pump_id: s}, see calibration_history). Plans are shared through the cache, so treat them as
+    read-only; jobs() hands out fresh PumpJobs for the engine. Bottle
+    levels change with every pour, so they are checked against the plan
+    when it is used (shortfalls, with_failover) rather than baked in.
+    """
+    def __init__(self, drink_id, drink_name, size_ml, demands, unassigned, budget, generation, caps=None,
+                 precedence=None, fill=None, startup=None):
+        self.drink_id = drink_id
+        self.drink_name = drink_name
+        self.size_ml = size_ml
+        self.demands = demands
+        self.unassigned = unassigned
+        self.budget = budget
+        self.generation = generation
+        self.caps = caps
+        self.precedence = precedence or {}
+        self.fill = fill or {}
+        self.startup = startup or {}
+        jobs = []
+        for ingredient, volume_ml, hoses in demands:
+            rates = dict(hoses)
+            for pump_id, share in split_volume(volume_ml, hoses, caps):
+                if share > 0:
+                    fill_s = self.fill.get(pump_id, 0.0) / rates[pump_id]
+                    startup_s = self.startup.get(pump_id, 0.0)
+                    jobs.append(PumpJob(pump_id, share / rates[pump_id] + fill_s + startup_s, share, ingredient,
+                                        fill_s=fill_s, startup_s=startup_s))
+        by_ingredient = {}
+        for job in jobs:
+            by_ingredient.setdefault(job.ingredient, []).append(job)
+        for job in jobs:
+            job.after = tuple(before for ingredient in self.precedence.get(job.ingredient, ())
+                              for before in by_ingredient.get(ingredient, ()))
+        starts, self.makespan = plan(jobs, budget)
+        index = {id(job): i for i, (_, job) in enumerate(starts)}
+        self.pours = tuple(PlannedPour(job.pump_id, job.ingredient, job.volume_ml, job.duration, offset,
+                                       tuple(index[id(before)] for before in job.after if id(before) in index),
+                                       job.fill_s, job.startup_s)
+                           for offset, job in starts)
+
+    def jobs(self):
+        """Fresh PumpJobs in start order, with their pour order constraints wired up"""
+        jobs = []
+        for pour in self.pours:
+            jobs.append(PumpJob(pour.pump_id, pour.duration, pour.volume_ml, pour.ingredient,
+                                [jobs[i] for i in pour.after], pour.fill_s, pour.startup_s))
+        return jobs
+
+    def shortfalls(self, bottle_volumes=None):
+        """[(pour, remaining_ml), ...] for every pour its bottle cannot cover, in recipe order"""
+        if bottle_volumes is None:
+            bottle_volumes = bottle_volumes_snapshot()
+        short = []
+        for pour in self.pours:
+            remaining = bottle_volumes.get(pour.pump_id, {}).get('remaining_volume_ml', 0)
+            if remaining < pour.volume_ml:
+                short.append((pour, remaining))
+        return short
+
+    def with_failover(self, bottle_volumes=None):
+        """This plan, or one that moves volume off bottles too low to cover their share onto sibling hoses"""
+        if bottle_volumes is None:
+            bottle_volumes = bottle_volumes_snapshot()
+        short = {pour.ingredient for pour, _ in self.shortfalls(bottle_volumes)}
+        if not any(ingredient in short and len(hoses) > 1 for ingredient, _, hoses in self.demands):
+            return self
+        caps = {pump_id: bottle.get('remaining_volume_ml', 0) for pump_id, bottle in bottle_volumes.items()}
+        return DispensePlan(self.drink_id, self.drink_name, self.size_ml, self.demands, self.unassigned,
+                            self.budget, self.generation, caps, self.precedence, self.fill, self.startup)
+
+    def volumes(self):
+        """{pump_id: ml} this plan pours from each hose"""
+        volumes = {}
+        for pour in self.pours:
+            volumes[pour.pump_id] = volumes.get(pour.pump_id, 0.0) + pour.volume_ml
+        return volumes
+
+    def failed_over(self, rebalanced):
+        """Hoses whose volume rebalanced (this plan's with_failover) moved onto a sibling hose, sorted"""
+        after = rebalanced.volumes()
+        return sorted(pump_id for pump_id, ml in self.volumes().items() if after.get(pump_id, 0.0) < ml - 1e-6)
+
+    def with_fill(self, fill):
+        """This plan with each pump in fill ({pump_id: ml}) first refilling that much empty tubing"""
+        if not fill:
+            return self
+        return DispensePlan(self.drink_id, self.drink_name, self.size_ml, self.demands, self.unassigned,
+                            self.budget, self.generation, self.caps, self.precedence, fill, self.startup)
+
+    def prepared(self, bottle_volumes=None):
+        """The plan to pour right now: with_failover for low bottles, then with_fill for drained tubing.
+
+        A hose still short after failover waits for a bottle swap, so its
+        whole tube counts as empty.
+        """
+        if bottle_volumes is None:
+            bottle_volumes = bottle_volumes_snapshot()
+        compiled = self.with_failover(bottle_volumes)
+        swapped = {pour.pump_id for pour, _ in compiled.shortfalls(bottle_volumes)}
+        return compiled.with_fill(hose_priming.fill_volumes([pour.pump_id for pour in compiled.pours], swapped))
+
+    def as_dict(self, bottle_volumes=None):
+        shortfalls = self.shortfalls(bottle_volumes)
+        return {'drink_id': self.drink_id, 'drink_name': self.drink_name, 'size_ml': self.size_ml,
+                'makespan_s': round(self.makespan, 3), 'pours': [p.as_dict() for p in self.pours],
+                'unassigned': list(self.unassigned),
+                'shortfalls': [{'pump_id': p.pump_id, 'ingredient': p.ingredient, 'needed_ml': round(p.volume_ml, 1),
+                                'remaining_ml': round(remaining, 1)} for p, remaining in shortfalls],
+                'ready': not shortfalls and not self.unassigned}
+
+def batch_volume(size_ml, servings=1):
+    """Total ml for servings drinks of size_ml poured in one pass; ValueError if it cannot be poured"""
+    servings = int(servings)
+    if servings < 1:
+        raise ValueError("Servings must be at least 1")
+    total = float(size_ml) * servings
+    if total <= 0:
+        raise ValueError("Drink size must be positive")
+    if total > MAX_VESSEL_ML:
+        raise ValueError(f"{servings} x {float(size_ml):g} ml is more than the {MAX_VESSEL_ML:g} ml vessel holds")
+    return total
+
+def flow_rate(calibrations, pump_id):
+    """pump_id's calibrated ml/s, or DEFAULT_FLOW_RATE if it has none or a zero one saved before those were refused"""
+    rate = calibrations.get(pump_id, 0.0)
+    return rate if rate > 0 else DEFAULT_FLOW_RATE
+
+def compile_plan(drink_id, size_ml):
+    """The DispensePlan for drink_id poured at size_ml, or None if there is no such recipe.
+
+    Recipe parts are relative, so the drink is scaled to size_ml whatever
+    they add up to. Plans are cached by (drink_id, size, configuration
+    generation): a repeat order costs a few stat() calls until a recipe,
+    hose assignment, hose status, calibration or power limit changes.
+    """
+    return _compile(drink_id, float(size_ml), config_generation(), recipe_repository.generation)
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _compile(drink_id, size_ml, generation, recipe_generation):
+    recipe = get_recipe_by_id(drink_id)
+    if recipe is None:
+        return None
+    base_total = sum(recipe['ingredients'].values())
+    scale = size_ml / base_total if base_total > 0 else 0.0
+    calibrations = pump_calibrations_snapshot()
+    demands = []
+    unassigned = []
+    for ingredient, part in recipe['ingredients'].items():
+        hoses = usable_hoses(ingredient)
+        if not hoses:
+            unassigned.append(ingredient)
+            continue
+        rates = tuple((pump_id, flow_rate(calibrations, pump_id)) for pump_id in hoses)
+        demands.append((ingredient, part * scale, rates))
+    return DispensePlan(drink_id, recipe['drink_name'], size_ml, tuple(demands), tuple(unassigned),
+                        PowerBudget.from_config(pump_power_snapshot()), (generation, recipe_generation),
+                        precedence=pour_precedence(recipe), startup=pump_startup_snapshot())
+
+def dry_run(drink_id, size_ml, servings=1):
+    """What pouring servings x size_ml of drink_id would do, without touching a pump; None for unknown drinks"""
+    compiled = compile_plan(drink_id, batch_volume(size_ml, servings))
+    if compiled is None:
+        return None
+    bottle_volumes = bottle_volumes_snapshot()
+    return compiled.prepared(bottle_volumes).as_dict(bottle_volumes)
+
+def plan_cache_stats():
+    info = _compile.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
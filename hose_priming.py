@@ -0,0 +1,192 @@
+# hose_priming.py
+import os
+import time
+import logging
+import threading
+from state_store import DATA_DIR, AppendLog, file_lock, file_signature, load_json, save_json
+
+HOSE_PRIMING_FILE = os.path.join(DATA_DIR, 'hose_priming.json')
+HOSE_USAGE_FILE = os.path.join(DATA_DIR, 'hose_usage.log')
+# Weight of a new prime measurement against what was learned before
+LEARNING_RATE = 0.3
+# A shorter press is a tap on the button, not a measurement
+MIN_PRIME_S = 0.05
+# Right after a pour the tube is still full; a prime then says nothing about drain-back
+MIN_IDLE_S = 60.0
+
+def _learn(old, sample):
+    return sample if old <= 0 else old + LEARNING_RATE * (sample - old)
+
+class HosePriming:
+    """How much of each hose's tubing is empty, and so how long its pump runs before liquid reaches the glass.
+
+    Each hose has two learned parameters: dead_volume_ml, the tubing between
+    bottle and nozzle, and drain_ml_per_h, how fast liquid drains back into
+    the bottle while the pump is idle. Press-and-hold primes measure them:
+    priming a hose whose bottle was just swapped fills the whole tube,
+    priming one that sat idle refills what drained back. Together with when
+    each pump last stopped and whether its bottle was swapped since, they
+    give the fill volume to add in front of the next pour. Hoses nothing
+    has been learned for get no fill.
+
+    The parameters live in a small JSON file, rewritten only when a prime
+    teaches something. Pump stops and bottle swaps happen on every pour, so
+    like the bottle ledger they are appended to a log of "hose_id event
+    time" lines, replayed incrementally and compacted to one line per hose
+    once compact_every entries have piled up.
+    """
+    def __init__(self, path=HOSE_PRIMING_FILE, usage_file=HOSE_USAGE_FILE, compact_every=500):
+        self.path = path
+        self.usage_file = usage_file
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._signature = None
+        self._params = {}
+        self._usage = {}
+        self._log = AppendLog(usage_file)
+        self._entries = 0
+
+    def _load(self):
+        """Brings parameters and usage up to date with the files. Caller holds self._lock"""
+        signature = file_signature(self.path)
+        if signature != self._signature:
+            data = load_json(self.path, {})
+            self._params = {int(k): {'dead_volume_ml': float(v.get('dead_volume_ml', 0.0)),
+                                     'drain_ml_per_h': float(v.get('drain_ml_per_h', 0.0))}
+                            for k, v in data.items() if isinstance(v, dict)}
+            self._signature = signature
+        restarted, lines = self._log.read()
+        if restarted:
+            # New or compacted log, possibly by another process
+            self._usage = {}
+            self._entries = 0
+        for line in lines:
+            self._apply(line)
+
+    def _apply(self, line):
+        try:
+            hose_id, event, at = line.split()
+            hose_id, at = int(hose_id), float(at)
+        except ValueError:
+            logging.error(f"Skipping malformed hose usage entry {line!r}")
+            return
+        usage = self._usage.setdefault(hose_id, {'last_stopped': None, 'swapped': False})
+        if event == 'used':
+            usage['last_stopped'] = at
+            usage['swapped'] = False
+        elif event == 'swapped':
+            usage['swapped'] = True
+        self._entries += 1
+
+    def _append(self, events):
+        """Logs [(hose_id, event), ...] in one write. Caller holds self._lock"""
+        now = time.time()
+        # file_lock keeps the append and a compaction by another process apart
+        with file_lock:
+            self._load()
+            self._log.append(f"{int(hose_id)} {event} {now:.3f}\n" for hose_id, event in events)
+            self._load()
+            if self._entries >= self.compact_every:
+                self._compact()
+
+    def _compact(self):
+        """Rewrites the log as one line per hose. Caller holds self._lock and file_lock"""
+        lines = []
+        for hose_id, usage in sorted(self._usage.items()):
+            if usage['last_stopped'] is not None:
+                lines.append(f"{hose_id} used {usage['last_stopped']:.3f}\n")
+            if usage['swapped']:
+                lines.append(f"{hose_id} swapped {time.time():.3f}\n")
+        self._log.rewrite(lines)
+        self._load()
+
+    def _hose(self, hose_id):
+        """Parameters and usage of hose_id in one dict, or None if nothing has been learned for it"""
+        params = self._params.get(int(hose_id))
+        if params is None:
+            return None
+        return dict(params, **self._usage.get(int(hose_id), {'last_stopped': None, 'swapped': False}))
+
+    @staticmethod
+    def _fill(hose, now, swapped):
+        dead = hose.get('dead_volume_ml', 0.0)
+        if swapped or hose.get('swapped'):
+            return dead
+        last = hose.get('last_stopped')
+        if last is None:
+            return 0.0
+        drained = hose.get('drain_ml_per_h', 0.0) * max(0.0, now - last) / 3600
+        return min(dead, drained) if dead > 0 else drained
+
+    def fill_ml(self, hose_id, swapped=False):
+        """Volume hose_id's pump has to push before liquid reaches the glass"""
+        return self.fill_volumes([hose_id], [hose_id] if swapped else ()).get(hose_id, 0.0)
+
+    def fill_volumes(self, hose_ids, swapped=()):
+        """{hose_id: fill ml} for the hoses about to pour, leaving out those that need none.
+
+        Hoses in swapped are about to get a new bottle, so their tube starts empty.
+        """
+        now = time.time()
+        with self._lock:
+            self._load()
+            hoses = {hose_id: self._hose(hose_id) for hose_id in hose_ids}
+        fills = {hose_id: self._fill(hose, now, hose_id in swapped) for hose_id, hose in hoses.items()
+                 if hose is not None}
+        return {hose_id: ml for hose_id, ml in fills.items() if ml > 0}
+
+    def used(self, hose_ids):
+        """Marks the tubes of hose_ids as full as of now, e.g. after a pour; one log append for all of them"""
+        events = [(hose_id, 'used') for hose_id in hose_ids]
+        if events:
+            with self._lock:
+                self._append(events)
+
+    def swapped(self, hose_id):
+        """Marks hose_id's tube as empty: its bottle was just changed"""
+        with self._lock:
+            self._append([(hose_id, 'swapped')])
+
+    def record_prime(self, hose_id, duration_s, flow_rate, startup_s=0.0):
+        """Learns from a press-and-hold prime that ran duration_s until liquid reached the nozzle.
+
+        The first startup_s seconds (the pump's fitted start-up time, see
+        calibration_history) move no liquid and every pour adds them
+        separately, so they are not part of the fill. Returns the volume it
+        took in ml, or 0.0 if the prime could not be used as a measurement.
+        """
+        duration_s = max(0.0, duration_s - startup_s)
+        if duration_s < MIN_PRIME_S or not flow_rate or flow_rate <= 0:
+            return 0.0
+        filled = duration_s * flow_rate
+        now = time.time()
+        with self._lock, file_lock:
+            self._load()
+            hose_id = int(hose_id)
+            params = self._params.setdefault(hose_id, {'dead_volume_ml': 0.0, 'drain_ml_per_h': 0.0})
+            usage = self._usage.get(hose_id, {'last_stopped': None, 'swapped': False})
+            learned = False
+            if usage['swapped'] or usage['last_stopped'] is None:
+                params['dead_volume_ml'] = _learn(params['dead_volume_ml'], filled)
+                logging.info(f"Hose {hose_id} dead volume is now {params['dead_volume_ml']:.1f} ml")
+                learned = True
+            elif now - usage['last_stopped'] >= MIN_IDLE_S:
+                drained = filled * 3600 / (now - usage['last_stopped'])
+                params['drain_ml_per_h'] = _learn(params['drain_ml_per_h'], drained)
+                logging.info(f"Hose {hose_id} drains back {params['drain_ml_per_h']:.1f} ml/h")
+                learned = True
+            if learned:
+                save_json({str(k): v for k, v in sorted(self._params.items())}, self.path)
+                self._signature = file_signature(self.path)
+            self._append([(hose_id, 'used')])
+        return filled
+
+    def snapshot(self):
+        """{hose_id: {'dead_volume_ml', 'drain_ml_per_h', 'last_stopped', 'swapped', 'fill_ml'}} for display"""
+        now = time.time()
+        with self._lock:
+            self._load()
+            hoses = {hose_id: self._hose(hose_id) for hose_id in self._params}
+        return {hose_id: dict(hose, fill_ml=round(self._fill(hose, now, False), 1)) for hose_id, hose in hoses.items()}
+
+hose_priming = HosePriming()
@@ -0,0 +1,204 @@
+# live_state.py
+import os
+import mmap
+import time
+import struct
+import logging
+import threading
+from contextlib import contextmanager
+from config_manager import DATA_DIR
+
+LIVE_STATE_FILE = os.environ.get('DRINKMIXER_LIVE_STATE') or os.path.join(DATA_DIR, 'live_state.bin')
+MAGIC = b'DMLS'
+VERSION = 1
+MAX_PUMPS = 16
+
+# magic, version, slot count, generation, updated (wall clock), command id, pour progress, halted
+HEADER = struct.Struct('<4sHHQdqdB7x')
+# pump id, on, target s, elapsed s, on since (wall clock), bottle remaining ml, bottle total ml
+SLOT = struct.Struct('<HB5xddddd')
+GENERATION_OFFSET = 8
+SIZE = HEADER.size + MAX_PUMPS * SLOT.size
+
+class LiveState:
+    """Fixed-layout, memory-mapped view of what the pumps are doing right now.
+
+    The process that owns the pumps writes it; the kiosk, the web app and
+    any dashboard on the machine read it straight from the page cache, with
+    no locks, JSON or sockets. Writes follow a seqlock: the generation
+    counter is odd while a write is in progress and moves to the next even
+    value when it is done, so a reader that sees the same even generation
+    before and after unpacking has a consistent copy, and a reader that only
+    wants to know whether anything changed compares one integer.
+    """
+    def __init__(self, path=LIVE_STATE_FILE):
+        self.path = path
+        self._mm = None
+        self._writable = False
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    def open_writer(self, pump_ids):
+        """Creates (or takes over) the segment with one slot per pump; returns False if it cannot"""
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.ftruncate(fd, SIZE)
+                self._mm = mmap.mmap(fd, SIZE)
+            finally:
+                os.close(fd)
+        except (OSError, ValueError) as e:
+            logging.error(f"Live state segment unavailable at {self.path}: {e}")
+            return False
+        pump_ids = sorted(pump_ids)[:MAX_PUMPS]
+        self._writable = True
+        self._slots = {pump_id: index for index, pump_id in enumerate(pump_ids)}
+        # Odd while the layout is rewritten
+        generation = self._generation() | 1 if self._valid() else 1
+        HEADER.pack_into(self._mm, 0, MAGIC, VERSION, len(pump_ids), generation, time.time(), 0, 0.0, 0)
+        for pump_id, index in self._slots.items():
+            SLOT.pack_into(self._mm, HEADER.size + index * SLOT.size, pump_id, 0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        struct.pack_into('<Q', self._mm, GENERATION_OFFSET, generation + 1)
+        return True
+
+    def open_reader(self):
+        """Maps an existing segment read-only; returns False if no writer has created it yet"""
+        try:
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), SIZE, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        return self._valid()
+
+    def _valid(self):
+        return self._mm is not None and self._mm[:4] == MAGIC and struct.unpack_from('<H', self._mm, 4)[0] == VERSION
+
+    def _generation(self):
+        return struct.unpack_from('<Q', self._mm, GENERATION_OFFSET)[0]
+
+    def generation(self):
+        """Changes every time the state changes; 0 if the segment is not mapped"""
+        return self._generation() if self._mm is not None else 0
+
+    @contextmanager
+    def _write(self):
+        with self._lock:
+            if not self._writable:
+                yield False
+                return
+            generation = self._generation()
+            struct.pack_into('<Q', self._mm, GENERATION_OFFSET, generation + 1)
+            try:
+                yield True
+            finally:
+                struct.pack_into('<d', self._mm, 16, time.time())
+                struct.pack_into('<Q', self._mm, GENERATION_OFFSET, generation + 2)
+
+    def _slot_offset(self, pump_id):
+        index = self._slots.get(pump_id)
+        return None if index is None else HEADER.size + index * SLOT.size
+
+    def _update_slot(self, pump_id, on=None, target=None, elapsed=None, since=None):
+        offset = self._slot_offset(pump_id)
+        if offset is None:
+            return
+        fields = list(SLOT.unpack_from(self._mm, offset))
+        for position, value in ((1, on), (2, target), (3, elapsed), (4, since)):
+            if value is not None:
+                fields[position] = value
+        SLOT.pack_into(self._mm, offset, *fields)
+
+    def pump_on(self, pump_id, target_s=0.0):
+        with self._write() as writing:
+            if writing:
+                self._update_slot(pump_id, on=1, target=float(target_s), elapsed=0.0, since=time.time())
+
+    def pump_off(self, pump_id, elapsed_s=None):
+        with self._write() as writing:
+            if writing:
+                offset = self._slot_offset(pump_id)
+                if offset is None:
+                    return
+                _, on, _, elapsed, since, _, _ = SLOT.unpack_from(self._mm, offset)
+                if elapsed_s is None:
+                    elapsed_s = time.time() - since if on else elapsed
+                self._update_slot(pump_id, on=0, elapsed=float(elapsed_s))
+
+    def all_off(self):
+        with self._write() as writing:
+            if writing:
+                now = time.time()
+                for pump_id in self._slots:
+                    _, on, _, elapsed, since, _, _ = SLOT.unpack_from(self._mm, self._slot_offset(pump_id))
+                    if on:
+                        self._update_slot(pump_id, on=0, elapsed=now - since)
+
+    def set_bottles(self, volumes):
+        """volumes is {hose_id: {'total_volume_ml', 'remaining_volume_ml'}}; hose n feeds pump n"""
+        with self._write() as writing:
+            if writing:
+                for pump_id in self._slots:
+                    offset = self._slot_offset(pump_id)
+                    bottle = volumes.get(pump_id) or {}
+                    struct.pack_into('<dd', self._mm, offset + 32, float(bottle.get('remaining_volume_ml', 0.0)),
+                                     float(bottle.get('total_volume_ml', 0.0)))
+
+    def set_command(self, command_id, progress=0.0):
+        """Marks command_id as the running command (0 for none) and its progress from 0 to 1"""
+        with self._write() as writing:
+            if writing:
+                struct.pack_into('<qd', self._mm, 24, int(command_id or 0), float(progress))
+
+    def set_halted(self, halted):
+        with self._write() as writing:
+            if writing:
+                struct.pack_into('<B', self._mm, 40, 1 if halted else 0)
+
+    def read(self, retries=100):
+        """Returns a consistent dict copy of the segment, or None if it is not mapped or stays busy"""
+        if self._mm is None and not self.open_reader():
+            return None
+        for _ in range(retries):
+            before = self._generation()
+            if before % 2:
+                time.sleep(0)
+                continue
+            magic, version, count, _, updated, command_id, progress, halted = HEADER.unpack_from(self._mm, 0)
+            slots = [SLOT.unpack_from(self._mm, HEADER.size + i * SLOT.size) for i in range(min(count, MAX_PUMPS))]
+            if self._generation() != before:
+                continue
+            if magic != MAGIC or version != VERSION:
+                return None
+            now = time.time()
+            pumps = {}
+            for pump_id, on, target, elapsed, since, remaining, total in slots:
+                if on:
+                    # Still running: the writer only stamps the start
+                    elapsed = now - since if target <= 0 else min(target, now - since)
+                pumps[pump_id] = {'on': bool(on), 'target_s': round(target, 3), 'elapsed_s': round(elapsed, 3),
+                                  'remaining_ml': round(remaining, 1), 'total_ml': round(total, 1)}
+            return {'generation': before, 'updated': updated, 'command_id': command_id or None,
+                    'progress': progress, 'halted': bool(halted), 'pumps': pumps}
+        return None
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            self._writable = False
+
+_reader = None
+_reader_lock = threading.Lock()
+
+def read_live_state():
+    """The pump owner's live state as a dict, or None if no engine has published one"""
+    global _reader
+    with _reader_lock:
+        if _reader is None or not _reader._valid():
+            reader = LiveState()
+            if not reader.open_reader():
+                return None
+            _reader = reader
+        reader = _reader
+    return reader.read()
@@ -0,0 +1,241 @@
+# order_queue.py
+import time
+import math
+import logging
+from collections import deque
+from threading import Condition
+from config_manager import load_json, save_json
+
+class Order:
+    """A guest's ticket: servings drinks of a given size, poured together, waiting for the pumps"""
+    def __init__(self, order_id, drink_id, size, drink_name='', created_at=None, priority=0, servings=1):
+        self.order_id = order_id
+        self.drink_id = drink_id
+        self.size = float(size)
+        self.servings = int(servings)
+        self.drink_name = drink_name
+        self.created_at = created_at if created_at is not None else time.time()
+        self.priority = int(priority)
+        self.started_at = None
+        self.estimate = 0.0
+
+    def to_dict(self):
+        return {'order_id': self.order_id, 'drink_id': self.drink_id, 'size': self.size,
+                'drink_name': self.drink_name, 'created_at': self.created_at, 'priority': self.priority,
+                'servings': self.servings}
+
+    @property
+    def total_volume(self):
+        return self.size * self.servings
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(int(data['order_id']), int(data['drink_id']), float(data['size']),
+                   str(data.get('drink_name', '')), float(data.get('created_at', time.time())),
+                   int(data.get('priority', 0)), int(data.get('servings', 1)))
+
+# Scheduling policies pick the index of the next order to pour from the pending list
+
+class FifoPolicy:
+    """First come, first served"""
+    name = 'fifo'
+
+    def select(self, pending, now):
+        return 0
+
+class ShortestJobFirstPolicy:
+    """Pours the order with the shortest predicted pour time first.
+
+    Any order that has waited max_wait seconds or more is served ahead of
+    shorter ones (oldest first), so a long drink cannot starve behind a
+    steady stream of shots.
+    """
+    name = 'sjf'
+
+    def __init__(self, max_wait=120.0):
+        self.max_wait = max_wait
+
+    def select(self, pending, now):
+        overdue = [i for i, order in enumerate(pending) if now - order.created_at >= self.max_wait]
+        if overdue:
+            return overdue[0]
+        return min(range(len(pending)), key=lambda i: (pending[i].estimate, pending[i].order_id))
+
+class PriorityPolicy:
+    """Serves the highest operator priority first and breaks ties with another policy"""
+    name = 'priority'
+
+    def __init__(self, tiebreak=None):
+        self.tiebreak = tiebreak or FifoPolicy()
+
+    def select(self, pending, now):
+        top = max(order.priority for order in pending)
+        candidates = [i for i, order in enumerate(pending) if order.priority == top]
+        return candidates[self.tiebreak.select([pending[i] for i in candidates], now)]
+
+class DeferShortOrdersPolicy:
+    """Lets orders whose bottles can cover them go ahead of ones that would run a bottle dry.
+
+    pourable(pending) returns one bool per pending order. Short orders wait
+    until they are the only ones left (or a bottle is refilled), then they
+    are poured anyway so the bottle swap prompt reaches the operator. An
+    order that has waited max_defer seconds or that staff gave a raised
+    priority is never held back, so steady traffic cannot starve it.
+    """
+    def __init__(self, inner, pourable, max_defer=120.0):
+        self.inner = inner
+        self.pourable = pourable
+        self.max_defer = max_defer
+        self.name = f"{inner.name}+defer"
+
+    def select(self, pending, now):
+        ok = [i for i, fits in enumerate(self.pourable(pending))
+              if fits or pending[i].priority > 0 or now - pending[i].created_at >= self.max_defer]
+        if not ok or len(ok) == len(pending):
+            return self.inner.select(pending, now)
+        return ok[self.inner.select([pending[i] for i in ok], now)]
+
+def make_policy(name):
+    """Returns the scheduling policy called name ('fifo', 'sjf' or 'priority')"""
+    if name == 'sjf':
+        return ShortestJobFirstPolicy()
+    if name == 'priority':
+        return PriorityPolicy(ShortestJobFirstPolicy())
+    if name != 'fifo':
+        logging.warning(f"Unknown order scheduling policy '{name}', using FIFO")
+    return FifoPolicy()
+
+class OrderQueue:
+    """Pending drink orders, drained by a single dispatcher in the order chosen by policy.
+
+    Pending orders are written to queue_file so they survive a restart.
+    estimate_duration(order) returns the predicted pour time in seconds and
+    is used both for scheduling and for ETA reporting.
+    """
+    def __init__(self, queue_file, estimate_duration=None, policy=None, history=500):
+        self.queue_file = queue_file
+        self.estimate_duration = estimate_duration or (lambda order: 0.0)
+        self.policy = policy or FifoPolicy()
+        self._cond = Condition()
+        self._pending = []
+        self._current = None
+        self._next_id = 1
+        self._waits = deque(maxlen=history)
+        self._load()
+
+    def _load(self):
+        data = load_json(self.queue_file, {})
+        self._next_id = int(data.get('next_id', 1))
+        for entry in data.get('pending', []):
+            try:
+                order = Order.from_dict(entry)
+                order.estimate = self.estimate_duration(order)
+                self._pending.append(order)
+            except Exception as e:
+                logging.error(f"Dropping unreadable queued order {entry}: {e}")
+        if self._pending:
+            logging.info(f"Restored {len(self._pending)} queued orders")
+
+    def _save(self):
+        """Caller holds self._cond"""
+        save_json({'next_id': self._next_id, 'pending': [o.to_dict() for o in self._pending]}, self.queue_file)
+
+    def submit(self, drink_id, size, drink_name='', priority=0, servings=1):
+        """Queues a new order and returns it"""
+        with self._cond:
+            order = Order(self._next_id, drink_id, size, drink_name, priority=priority, servings=servings)
+            self._next_id += 1
+            order.estimate = self.estimate_duration(order)
+            self._pending.append(order)
+            self._save()
+            self._cond.notify()
+        logging.info(f"Queued order {order.order_id} for drink {drink_id} ({servings} x {size} ml)")
+        return order
+
+    def get(self, timeout=None):
+        """Blocks until an order is pending, marks it as current and returns it (None on timeout)"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._pending, timeout):
+                return None
+            order = self._pending.pop(self.policy.select(self._pending, time.time()))
+            order.started_at = time.time()
+            self._waits.append(order.started_at - order.created_at)
+            self._current = order
+            self._save()
+            return order
+
+    def set_priority(self, order_id, priority):
+        """Changes a pending order's operator priority; returns False if it is not pending"""
+        with self._cond:
+            order = next((o for o in self._pending if o.order_id == order_id), None)
+            if order is None:
+                return False
+            order.priority = int(priority)
+            self._save()
+            return True
+
+    def cancel(self, order_id):
+        """Removes a pending order; returns False if it is not waiting"""
+        with self._cond:
+            order = next((o for o in self._pending if o.order_id == order_id), None)
+            if order is None:
+                return False
+            self._pending.remove(order)
+            self._save()
+        logging.info(f"Cancelled queued order {order_id}")
+        return True
+
+    def metrics(self):
+        """Wait time statistics (seconds from order to pour start) over recent orders"""
+        with self._cond:
+            waits = sorted(self._waits)
+        if not waits:
+            return {'policy': self.policy.name, 'orders': 0, 'mean_wait': 0.0, 'p95_wait': 0.0}
+        p95 = waits[max(0, math.ceil(0.95 * len(waits)) - 1)]
+        return {'policy': self.policy.name, 'orders': len(waits),
+                'mean_wait': round(sum(waits) / len(waits), 2), 'p95_wait': round(p95, 2)}
+
+    def current(self):
+        """The order taken by get() and not yet done(), or None"""
+        with self._cond:
+            return self._current
+
+    def done(self, order):
+        with self._cond:
+            if self._current is order:
+                self._current = None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    def status(self, order_id):
+        """Returns {'order_id', 'drink_name', 'position', 'eta'} or None if the order is not known.
+
+        Position 0 means the drink is being poured; eta is seconds until it is ready.
+        """
+        return next((entry for entry in self.snapshot() if entry['order_id'] == order_id), None)
+
+    def snapshot(self):
+        """Current order plus every pending one, in predicted dispatch order, with position and ETA"""
+        now = time.time()
+        with self._cond:
+            entries = []
+            eta = 0.0
+            if self._current is not None:
+                eta = max(0.0, self._current.started_at + self._current.estimate - now)
+                entries.append(self._entry(self._current, 0, eta))
+            # Replay the policy over a copy of the queue to predict the order drinks will be poured in
+            remaining = list(self._pending)
+            position = 0
+            while remaining:
+                order = remaining.pop(self.policy.select(remaining, now + eta))
+                position += 1
+                eta += order.estimate
+                entries.append(self._entry(order, position, eta))
+            return entries
+
+    @staticmethod
+    def _entry(order, position, eta):
+        return {'order_id': order.order_id, 'drink_id': order.drink_id, 'drink_name': order.drink_name,
+                'size': order.size, 'servings': order.servings, 'priority': order.priority, 'position': position, 'eta': round(eta, 1)}
@@ -0,0 +1,118 @@
+# power_budget.py
+from itertools import permutations
+
+# Up to this many pump runs, plan() tries every start order under a limited budget (6! = 720 replays)
+SEARCH_LIMIT = 6
+
+class PowerBudget:
+    """What the 12 V supply can feed: at most max_concurrent pumps drawing at most max_total_a amps.
+
+    Either limit may be None for no limit. pump_current_a maps pump ids to
+    their draw; pumps missing from it draw default_current_a.
+    """
+    def __init__(self, pump_current_a=None, max_concurrent=None, max_total_a=None, default_current_a=1.0):
+        self.pump_current_a = dict(pump_current_a or {})
+        self.max_concurrent = max_concurrent
+        self.max_total_a = max_total_a
+        self.default_current_a = default_current_a
+
+    @classmethod
+    def from_config(cls, config):
+        """Builds a budget from config_manager.pump_power_snapshot()"""
+        return cls(config.get('pump_current_a'), config.get('max_concurrent_pumps'),
+                   config.get('max_total_current_a'), config.get('default_current_a', 1.0))
+
+    def draw(self, pump_id):
+        return self.pump_current_a.get(pump_id, self.default_current_a)
+
+    def fits(self, active, pump_id):
+        """True if pump_id may start while the pumps in active are running.
+
+        A pump always fits on an idle supply, even one that alone exceeds the
+        budget, since it has to run at some point.
+        """
+        if not active:
+            return True
+        if pump_id in active:
+            return False
+        if self.max_concurrent is not None and len(active) >= self.max_concurrent:
+            return False
+        if self.max_total_a is not None:
+            load = sum(self.draw(p) for p in active) + self.draw(pump_id)
+            if load > self.max_total_a + 1e-9:
+                return False
+        return True
+
+    def limits(self, count):
+        """True if count pumps could not all run at once"""
+        return (self.max_total_a is not None or
+                self.max_concurrent is not None and count > self.max_concurrent)
+
+def released(job, finished):
+    """True once every job that job pours after (job.after) is in finished, a set of id()s.
+
+    A zero-length job never runs, so it holds nobody back.
+    """
+    return all(id(before) in finished or before.duration <= 0 for before in job.after)
+
+def critical_path_order(jobs):
+    """The order the scheduler tries to start jobs in: longest chain first.
+
+    A job's key is its own duration plus the longest run of jobs that pour
+    after it, so a layer that has to wait does not end up waiting on a
+    short job started late. Without pour order constraints this is plain
+    longest processing time first.
+    """
+    waiting_on = {id(job): [] for job in jobs}
+    for job in jobs:
+        for before in job.after:
+            if id(before) in waiting_on:
+                waiting_on[id(before)].append(job)
+    tails = {}
+
+    def tail(job):
+        if id(job) not in tails:
+            tails[id(job)] = job.duration + max((tail(after) for after in waiting_on[id(job)]), default=0.0)
+        return tails[id(job)]
+    return sorted(jobs, key=tail, reverse=True)
+
+def _replay(order, budget):
+    pending = list(order)
+    running = []
+    starts = []
+    finished = set()
+    now = 0.0
+    while pending or running:
+        for job in list(pending):
+            if released(job, finished) and budget.fits([j.pump_id for _, j in running], job.pump_id):
+                running.append((now + job.duration, job))
+                starts.append((now, job))
+                pending.remove(job)
+        if not running:
+            raise ValueError("Pour order constraints form a cycle")
+        end, job = min(running, key=lambda entry: entry[0])
+        running.remove((end, job))
+        finished.add(id(job))
+        now = end
+    return starts, now
+
+def plan(jobs, budget):
+    """Works out the shortest pour timeline; returns ([(start_offset, job), ...], makespan) in seconds.
+
+    Whenever a pump stops, every waiting job that is released (see
+    released()) and fits the budget starts, in priority order. This is the
+    same greedy rule dispense_concurrently applies at run time, so the
+    returned start order, used as the run-time priority, reproduces the
+    timeline. With no budget limit every job starts as soon as its
+    predecessors stop, which is optimal; otherwise the longest chain first
+    order is tried and, for up to SEARCH_LIMIT jobs, every other order too.
+    """
+    jobs = [job for job in jobs if job.duration > 0]
+    order = critical_path_order(jobs)
+    best = _replay(order, budget)
+    if budget.limits(len(jobs)) and len(jobs) <= SEARCH_LIMIT:
+        for candidate in permutations(order):
+            starts, makespan = _replay(candidate, budget)
+            if makespan < best[1] - 1e-9:
+                best = starts, makespan
+    return best
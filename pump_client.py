@@ -0,0 +1,246 @@
+# pump_client.py
+import os
+import json
+import socket
+import logging
+import itertools
+import threading
+from concurrent.futures import Future
+from config_manager import DATA_DIR
+
+PUMP_DAEMON_SOCKET = os.environ.get('PUMP_DAEMON_SOCKET') or os.path.join(DATA_DIR, 'pump_daemon.sock')
+CALL_TIMEOUT = 5.0
+
+class RemoteEngine:
+    """The pump daemon's dispense engine, reached over its Unix socket.
+
+    Offers the same calls as dispense_engine.DispenseEngine, so the kiosk and
+    the web app do not care whether the pumps are driven in-process or by
+    pump_daemon.py. Messages are JSON lines: requests carry an id and get a
+    reply with the same id, and the daemon pushes every engine event to
+    every client. Submitted commands resolve their Future when the daemon
+    sends the command's _done event.
+    """
+    def __init__(self, socket_path=PUMP_DAEMON_SOCKET):
+        self.socket_path = socket_path
+        self._request_ids = itertools.count(1)
+        self._replies = {}
+        self._commands = {}
+        self._early = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._sock = None
+        with self._send_lock:
+            status = self._connect()
+        self._sync_ready(status)
+
+    def _connect(self):
+        """Opens a connection and asks whether the engine is halted; returns the status reply's Future.
+
+        Caller holds self._send_lock, so the request goes straight onto the
+        new socket rather than back through _send.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        self._sock = sock
+        threading.Thread(target=self._read, args=(sock,), name='pump-client', daemon=True).start()
+        request_id, future = self._expect_reply()
+        try:
+            sock.sendall(self._encode({'id': request_id, 'method': 'status', 'params': {}}))
+        except OSError:
+            with self._lock:
+                self._replies.pop(request_id, None)
+            raise
+        logging.info(f"Connected to pump daemon at {self.socket_path}")
+        return future
+
+    def _sync_ready(self, status):
+        if status.result(CALL_TIMEOUT)['halted']:
+            self._ready.clear()
+        else:
+            self._ready.set()
+
+    def _expect_reply(self):
+        future = Future()
+        request_id = next(self._request_ids)
+        with self._lock:
+            self._replies[request_id] = future
+        return request_id, future
+
+    @staticmethod
+    def _encode(message):
+        return (json.dumps(message) + '\n').encode()
+
+    def _send(self, message):
+        status = None
+        with self._send_lock:
+            if self._sock is None:
+                status = self._connect()
+            self._sock.sendall(self._encode(message))
+        if status is not None:
+            self._sync_ready(status)
+
+    def _call(self, method, **params):
+        request_id, future = self._expect_reply()
+        try:
+            self._send({'id': request_id, 'method': method, 'params': params})
+        except OSError:
+            with self._lock:
+                self._replies.pop(request_id, None)
+            raise
+        return future.result(CALL_TIMEOUT)
+
+    def _read(self, sock):
+        try:
+            for line in sock.makefile('rb'):
+                self._handle(json.loads(line))
+        except (OSError, ValueError) as e:
+            logging.error(f"Pump daemon connection failed: {e}")
+        logging.error("Lost connection to the pump daemon")
+        # Under the send lock, so a reconnect cannot register its handshake in between
+        with self._send_lock, self._lock:
+            if self._sock is sock:
+                self._sock = None
+            pending = list(self._replies.values()) + list(self._commands.values())
+            self._replies.clear()
+            self._commands.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(ConnectionError("Lost connection to the pump daemon"))
+
+    def _handle(self, message):
+        if 'id' in message:
+            with self._lock:
+                future = self._replies.pop(message['id'], None)
+            if future is None:
+                return
+            if 'error' in message:
+                future.set_exception(RuntimeError(message['error']))
+            else:
+                future.set_result(message.get('result'))
+            return
+        event, data = message['event'], message.get('data', {})
+        if event == '_done':
+            with self._lock:
+                future = self._commands.pop(data['command_id'], None)
+                if future is None:
+                    # The command finished before its submit reply was read
+                    self._early[data['command_id']] = data
+                    return
+            self._resolve(future, data)
+            return
+        if event == 'emergency_stop':
+            self._ready.clear()
+        elif event == 'resumed':
+            self._ready.set()
+        self.publish(event, **data)
+
+    @staticmethod
+    def _resolve(future, outcome):
+        if outcome.get('cancelled'):
+            future.cancel()
+        elif 'error' in outcome:
+            future.set_exception(RuntimeError(outcome['error']))
+        else:
+            future.set_result(outcome.get('result'))
+
+    def _submit(self, kind, **params):
+        command_id = self._call(kind, **params)
+        future = Future()
+        future.command_id = command_id
+        with self._lock:
+            outcome = self._early.pop(command_id, None)
+            if outcome is None:
+                self._commands[command_id] = future
+        if outcome is not None:
+            self._resolve(future, outcome)
+        return future
+
+    @property
+    def halted(self):
+        return not self._ready.is_set()
+
+    def subscribe(self, callback):
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._subscribers_lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, event, **data):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event, data)
+            except Exception as e:
+                logging.error(f"Pump client subscriber failed on {event}: {e}")
+
+    def pour(self, drink_id, size_ml, order_id=None, allow_swap=False, servings=1):
+        return self._submit('pour', drink_id=drink_id, size_ml=size_ml, order_id=order_id, allow_swap=allow_swap,
+                            servings=servings)
+
+    def prime(self, pump_id, duration):
+        return self._submit('prime', pump_id=pump_id, duration=duration)
+
+    def switch(self, pump_id, on):
+        return self._submit('switch', pump_id=pump_id, on=on)
+
+    def clean(self, duration=30.0):
+        return self._submit('clean', duration=duration)
+
+    def cancel(self, command_id):
+        return self._call('cancel', command_id=command_id)
+
+    def confirm_swap(self, hose_id, volume_ml=None):
+        return self._call('confirm_swap', hose_id=hose_id, volume_ml=volume_ml)
+
+    def swap_stats(self):
+        return self._call('swap_stats')
+
+    def emergency_stop(self):
+        return self._call('emergency_stop')
+
+    def resume(self):
+        self._call('resume')
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def stop_stats(self):
+        return self._call('stop_stats')
+
+    def cleanup(self):
+        with self._send_lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """The pump daemon's engine if the daemon is running, otherwise the in-process one.
+
+    Start pump_daemon.py before the front-ends when running the kiosk and the
+    web app together; a front-end started without it drives the pumps itself.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            if os.path.exists(PUMP_DAEMON_SOCKET):
+                try:
+                    _engine = RemoteEngine(PUMP_DAEMON_SOCKET)
+                except OSError as e:
+                    logging.warning(f"Pump daemon at {PUMP_DAEMON_SOCKET} is not answering ({e}); "
+                                    "driving the pumps in-process")
+            if _engine is None:
+                from dispense_engine import engine
+                _engine = engine
+        return _engine
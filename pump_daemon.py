@@ -0,0 +1,132 @@
+# pump_daemon.py
+import os
+import json
+import logging
+import threading
+import socketserver
+from dispense_engine import engine
+from pump_client import PUMP_DAEMON_SOCKET
+
+class EngineConnection(socketserver.StreamRequestHandler):
+    """One front-end (kiosk or web app) talking to the engine over JSON lines"""
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.server.add_connection(self)
+
+    def finish(self):
+        self.server.remove_connection(self)
+        super().finish()
+
+    def send(self, message):
+        data = (json.dumps(message) + '\n').encode()
+        with self.write_lock:
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except (OSError, ValueError) as e:
+                logging.debug(f"Dropping message for a closed client: {e}")
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                logging.error(f"Ignoring malformed request {line!r}")
+                continue
+            reply = {'id': request.get('id')}
+            try:
+                reply['result'] = self.dispatch(request['method'], request.get('params') or {})
+            except Exception as e:
+                logging.error(f"Request {request.get('method')} failed: {e}")
+                reply['error'] = str(e)
+            self.send(reply)
+
+    def dispatch(self, method, params):
+        if method in ('pour', 'prime', 'switch', 'clean'):
+            future = getattr(engine, method)(**params)
+            future.add_done_callback(lambda f: self.send({'event': '_done', 'data': _outcome(f)}))
+            return future.command_id
+        if method == 'cancel':
+            return engine.cancel(params['command_id'])
+        if method == 'emergency_stop':
+            return engine.emergency_stop()
+        if method == 'resume':
+            return engine.resume()
+        if method == 'confirm_swap':
+            return engine.confirm_swap(params['hose_id'], params.get('volume_ml'))
+        if method == 'stop_stats':
+            return engine.stop_stats()
+        if method == 'swap_stats':
+            return engine.swap_stats()
+        if method == 'status':
+            return {'halted': engine.halted}
+        raise ValueError(f"Unknown method '{method}'")
+
+def _outcome(future):
+    outcome = {'command_id': future.command_id}
+    if future.cancelled():
+        outcome['cancelled'] = True
+    elif future.exception() is not None:
+        outcome['error'] = str(future.exception())
+    else:
+        outcome['result'] = future.result()
+    return outcome
+
+class PumpDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Owns the pumps for every front-end on this machine and relays engine events to all of them"""
+    daemon_threads = True
+
+    def __init__(self, socket_path=PUMP_DAEMON_SOCKET):
+        if os.path.exists(socket_path):
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(socket_path)
+        super().__init__(socket_path, EngineConnection)
+        self.socket_path = socket_path
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        engine.subscribe(self.broadcast)
+        engine.start()
+
+    def add_connection(self, connection):
+        with self._connections_lock:
+            self._connections.add(connection)
+        logging.info(f"Front-end connected ({len(self._connections)} total)")
+
+    def remove_connection(self, connection):
+        with self._connections_lock:
+            self._connections.discard(connection)
+
+    def broadcast(self, event, data):
+        with self._connections_lock:
+            connections = list(self._connections)
+        message = {'event': event, 'data': data}
+        for connection in connections:
+            connection.send(message)
+
+    def server_close(self):
+        super().server_close()
+        engine.unsubscribe(self.broadcast)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+def main():
+    os.makedirs("logs", exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.FileHandler("logs/pump_daemon.log"), logging.StreamHandler()]
+    )
+    server = PumpDaemon()
+    logging.info(f"Pump daemon listening on {server.socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.emergency_stop()
+        engine.cleanup()
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
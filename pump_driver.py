@@ -0,0 +1,219 @@
+# pump_driver.py
+import os
+import time
+import logging
+import threading
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None
+
+from pump_timing import sleep_until
+
+PUMP_GPIO_PINS = {1: 17, 2: 18, 3: 27, 4: 22, 5: 23, 6: 24, 7: 25, 8: 5}
+
+class RealClock:
+    """Wall-independent monotonic time with the precise sleep from pump_timing"""
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep_until(self, deadline, cancel=None):
+        return sleep_until(deadline, cancel=cancel)
+
+class VirtualClock:
+    """A clock that jumps straight to each deadline, so simulated pours take no real time"""
+    def __init__(self, start=0.0):
+        self._now = float(start)
+        self._lock = threading.Lock()
+
+    def monotonic(self):
+        with self._lock:
+            return self._now
+
+    def sleep_until(self, deadline, cancel=None):
+        if cancel is not None and cancel.is_set():
+            return False
+        with self._lock:
+            self._now = max(self._now, deadline)
+        return True
+
+    def advance(self, seconds):
+        with self._lock:
+            self._now += seconds
+
+class PumpDriver:
+    """Switches pumps on and off and tells time; subclasses talk to real or simulated hardware"""
+    pump_ids = tuple(PUMP_GPIO_PINS)
+    clock = RealClock()
+
+    def initialize(self):
+        pass
+
+    def set_pump(self, pump_id, on):
+        raise NotImplementedError
+
+    def monotonic(self):
+        return self.clock.monotonic()
+
+    def sleep_until(self, deadline, cancel=None):
+        """Waits on the driver's clock; returns False if cancel was set first"""
+        return self.clock.sleep_until(deadline, cancel)
+
+    def all_off(self):
+        for pump_id in self.pump_ids:
+            self.set_pump(pump_id, False)
+
+    def cleanup(self):
+        pass
+
+class GPIOPumpDriver(PumpDriver):
+    """Drives the pump relays through RPi.GPIO"""
+    def __init__(self, pins=None):
+        self.pins = dict(pins or PUMP_GPIO_PINS)
+        self.pump_ids = tuple(self.pins)
+        self.initialized = False
+        self._lock = threading.Lock()
+
+    def initialize(self):
+        with self._lock:
+            if self.initialized:
+                return
+            logging.debug("Initializing GPIO")
+            try:
+                GPIO.setwarnings(False)
+                GPIO.setmode(GPIO.BCM)
+                for pin in self.pins.values():
+                    GPIO.setup(pin, GPIO.OUT)
+                    GPIO.output(pin, GPIO.LOW)
+                self.initialized = True
+            except Exception as e:
+                logging.error(f"GPIO initialization failed: {e}")
+
+    def set_pump(self, pump_id, on):
+        self.initialize()
+        pin = self.pins.get(pump_id)
+        if pin is None:
+            logging.error(f"No GPIO pin assigned for pump {pump_id}")
+            return
+        try:
+            GPIO.output(pin, GPIO.HIGH if on else GPIO.LOW)
+        except Exception as e:
+            logging.error(f"GPIO error for pump {pump_id}: {e}")
+
+    def cleanup(self):
+        with self._lock:
+            if not self.initialized:
+                return
+            try:
+                GPIO.cleanup()
+                self.initialized = False
+            except Exception as e:
+                logging.error(f"GPIO cleanup failed: {e}")
+
+class SimulatedPumpDriver(PumpDriver):
+    """A pump bank that exists only in memory.
+
+    Each pump moves flow_rates[pump_id] ml/s while on. The first
+    dead_volume_ml of every run after the hose has drained only fills the
+    tubing, so it never reaches the glass. Every pin transition is recorded
+    as (time, pump_id, on) against the driver's clock, which is a
+    VirtualClock for load tests or the real clock when standing in for
+    missing hardware.
+    """
+    def __init__(self, flow_rates=None, dead_volume_ml=0.0, clock=None, pump_ids=None, primed=True):
+        self.pump_ids = tuple(pump_ids or PUMP_GPIO_PINS)
+        self.clock = clock or RealClock()
+        self.flow_rates = {p: float((flow_rates or {}).get(p, 10.0)) for p in self.pump_ids}
+        if isinstance(dead_volume_ml, dict):
+            self.dead_volume_ml = {p: float(dead_volume_ml.get(p, 0.0)) for p in self.pump_ids}
+        else:
+            self.dead_volume_ml = {p: float(dead_volume_ml) for p in self.pump_ids}
+        self.hose_fill_ml = {p: (self.dead_volume_ml[p] if primed else 0.0) for p in self.pump_ids}
+        self.dispensed_ml = {p: 0.0 for p in self.pump_ids}
+        self.on_time = {p: 0.0 for p in self.pump_ids}
+        self.transitions = []
+        self._on_since = {}
+        self._lock = threading.Lock()
+
+    def set_pump(self, pump_id, on):
+        with self._lock:
+            if pump_id not in self.flow_rates:
+                logging.error(f"No simulated pump {pump_id}")
+                return
+            now = self.clock.monotonic()
+            self.transitions.append((now, pump_id, bool(on)))
+            if on and pump_id not in self._on_since:
+                self._on_since[pump_id] = now
+            elif not on and pump_id in self._on_since:
+                self._account(pump_id, now - self._on_since.pop(pump_id))
+
+    def _account(self, pump_id, seconds):
+        pumped = self.flow_rates[pump_id] * seconds
+        fill = min(pumped, self.dead_volume_ml[pump_id] - self.hose_fill_ml[pump_id])
+        self.hose_fill_ml[pump_id] += fill
+        self.dispensed_ml[pump_id] += pumped - fill
+        self.on_time[pump_id] += seconds
+
+    def is_on(self, pump_id):
+        with self._lock:
+            return pump_id in self._on_since
+
+    def drain(self, pump_id=None):
+        """Empties the tubing, as after a long idle period or a bottle swap"""
+        with self._lock:
+            for p in ([pump_id] if pump_id is not None else self.pump_ids):
+                self.hose_fill_ml[p] = 0.0
+
+    def duty_cycle(self, start, end):
+        """Fraction of [start, end] each pump spent switched on"""
+        span = end - start
+        if span <= 0:
+            return {p: 0.0 for p in self.pump_ids}
+        busy = {p: 0.0 for p in self.pump_ids}
+        with self._lock:
+            on_since = {}
+            for t, pump_id, on in self.transitions:
+                if on and pump_id not in on_since:
+                    on_since[pump_id] = t
+                elif not on and pump_id in on_since:
+                    begin = on_since.pop(pump_id)
+                    busy[pump_id] += max(0.0, min(t, end) - max(begin, start))
+            for pump_id, begin in on_since.items():
+                busy[pump_id] += max(0.0, end - max(begin, start))
+        return {p: round(busy[p] / span, 4) for p in self.pump_ids}
+
+    def reset_stats(self):
+        with self._lock:
+            self.transitions = []
+            self.dispensed_ml = {p: 0.0 for p in self.pump_ids}
+            self.on_time = {p: 0.0 for p in self.pump_ids}
+
+_driver = None
+_driver_lock = threading.Lock()
+
+def create_pump_driver(kind=None):
+    """Builds a driver: 'gpio', 'simulated', or the PUMP_DRIVER environment default"""
+    kind = kind or os.environ.get('PUMP_DRIVER') or ('gpio' if GPIO else 'simulated')
+    if kind == 'gpio':
+        if GPIO is None:
+            raise RuntimeError("RPi.GPIO is not available")
+        return GPIOPumpDriver()
+    if kind == 'simulated':
+        from config_manager import pump_calibrations_snapshot
+        logging.warning("Using the simulated pump driver; no pumps will run")
+        return SimulatedPumpDriver(flow_rates=pump_calibrations_snapshot())
+    raise ValueError(f"Unknown pump driver '{kind}'")
+
+def get_pump_driver():
+    """Returns the process-wide pump driver, creating it on first use"""
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            _driver = create_pump_driver()
+        return _driver
+
+def set_pump_driver(driver):
+    """Replaces the process-wide driver, e.g. with a SimulatedPumpDriver on a VirtualClock for tests"""
+    global _driver
+    with _driver_lock:
+        _driver = driver
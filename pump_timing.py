@@ -0,0 +1,95 @@
+# pump_timing.py
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+# The last few milliseconds before a deadline are busy-waited instead of slept,
+# because time.sleep on a loaded Pi routinely overshoots by several ms.
+SPIN_WINDOW = 0.002
+
+# Set PUMP_REALTIME_PRIORITY=1 to run pump timing threads under SCHED_FIFO (needs root or CAP_SYS_NICE)
+REALTIME_PRIORITY = os.environ.get('PUMP_REALTIME_PRIORITY') == '1'
+
+_thread_state = threading.local()
+_activations = deque(maxlen=500)
+_activations_lock = threading.Lock()
+
+def sleep_until(deadline, spin=SPIN_WINDOW, cancel=None):
+    """Blocks until time.monotonic() reaches deadline: a coarse sleep, then a short spin.
+
+    If cancel (a threading.Event) is set first, returns False straight away;
+    otherwise returns True at the deadline.
+    """
+    while True:
+        if cancel is not None and cancel.is_set():
+            return False
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return True
+        if remaining > spin:
+            if cancel is None:
+                time.sleep(remaining - spin)
+            else:
+                cancel.wait(remaining - spin)
+
+def elevate_thread_priority():
+    """Best effort switch of the calling thread to real-time scheduling; returns True on success"""
+    if getattr(_thread_state, 'elevated', None) is not None:
+        return _thread_state.elevated
+    elevated = False
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(10))
+        elevated = True
+    except (AttributeError, OSError) as e:
+        try:
+            os.nice(-10)
+            elevated = True
+        except OSError:
+            logging.warning(f"Could not raise pump thread priority: {e}")
+    _thread_state.elevated = elevated
+    return elevated
+
+def prepare_thread():
+    """Applies the configured priority to the calling pump thread"""
+    if REALTIME_PRIORITY:
+        elevate_thread_priority()
+
+def record_activation(pump_id, requested, actual):
+    """Remembers how long a pump was really on compared to what was asked for"""
+    with _activations_lock:
+        _activations.append((pump_id, requested, actual))
+    error_ms = (actual - requested) * 1000
+    if abs(error_ms) > 20:
+        logging.warning(f"Pump {pump_id} ran {actual:.3f}s for a {requested:.3f}s request ({error_ms:+.1f} ms)")
+    else:
+        logging.debug(f"Pump {pump_id} on-time {actual:.4f}s (requested {requested:.4f}s, {error_ms:+.2f} ms)")
+
+def activation_stats():
+    """Summary of recent on-time errors in milliseconds"""
+    with _activations_lock:
+        errors = [(actual - requested) * 1000 for _, requested, actual in _activations]
+    if not errors:
+        return {'activations': 0, 'mean_error_ms': 0.0, 'max_abs_error_ms': 0.0}
+    return {'activations': len(errors),
+            'mean_error_ms': round(sum(errors) / len(errors), 3),
+            'max_abs_error_ms': round(max(abs(e) for e in errors), 3)}
+
+def run_pump(driver, pump_id, duration, cancel=None):
+    """Runs one pump for duration seconds against a deadline on the driver's clock; returns the achieved on-time.
+
+    Setting cancel switches the pump off early.
+    """
+    prepare_thread()
+    driver.set_pump(pump_id, True)
+    started = driver.monotonic()
+    try:
+        driver.sleep_until(started + duration, cancel)
+    finally:
+        driver.set_pump(pump_id, False)
+        actual = driver.monotonic() - started
+        # A cancelled run is short on purpose and says nothing about timing precision
+        if cancel is None or not cancel.is_set():
+            record_activation(pump_id, duration, actual)
+    return actual
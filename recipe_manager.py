@@ -1,47 +1,282 @@
 # recipe_manager.py
 import os
-import json
+import atexit
 import logging
-from config_manager import load_json, save_json
+from threading import RLock, Timer
+from types import MappingProxyType
+from config_manager import DATA_DIR, file_lock, save_json, store, normalize_ingredient
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 RECIPE_FILE = os.path.join(DATA_DIR, 'drink_recipes.json')
 
-def load_all_recipes():
-    """Returns a list of recipe dictionaries"""
-    recipes = load_json(RECIPE_FILE, [])
+def pour_precedence(recipe):
+    """{ingredient: (ingredients that must finish pouring first, ...)} from a recipe's pour order.
+
+    Recipes may order their ingredients two ways, both optional:
+    "layers": {"Grenadine": 1} puts ingredients in numbered layers (default
+    0), each poured only after every lower layer has finished, so the
+    highest layer floats on top; "after": {"Grenadine": ["Orange Juice"]}
+    names the ingredients one must follow. Raises ValueError for unknown
+    ingredients or constraints that contradict each other.
+    """
+    ingredients = recipe['ingredients']
+    layers = recipe.get('layers') or {}
+    after = recipe.get('after') or {}
+    for ingredient in list(layers) + list(after) + [i for before in after.values() for i in before]:
+        if ingredient not in ingredients:
+            raise ValueError(f"Pour order names {ingredient}, which is not in the recipe")
+    precedence = {}
+    for ingredient in ingredients:
+        layer = layers.get(ingredient, 0)
+        before = {other for other in ingredients if layers.get(other, 0) < layer}
+        before.update(after.get(ingredient, ()))
+        if before:
+            precedence[ingredient] = tuple(i for i in ingredients if i in before)
+    # Every ingredient must be reachable without going round in a circle
+    placed = set()
+    while len(placed) < len(ingredients):
+        ready = [i for i in ingredients if i not in placed and set(precedence.get(i, ())) <= placed]
+        if not ready:
+            raise ValueError("Pour order constraints form a cycle")
+        placed.update(ready)
+    return precedence
+
+def _freeze(recipe):
+    frozen = {
+        'drink_id': int(recipe['drink_id']),
+        'drink_name': str(recipe['drink_name']),
+        'ingredients': MappingProxyType({str(k): int(v) for k, v in recipe.get('ingredients', {}).items()}),
+        'notes': str(recipe.get('notes', '')),
+        'layers': MappingProxyType({str(k): int(v) for k, v in (recipe.get('layers') or {}).items()}),
+        'after': MappingProxyType({str(k): tuple(str(i) for i in v) for k, v in (recipe.get('after') or {}).items()})
+    }
+    pour_precedence(frozen)
+    return MappingProxyType(frozen)
+
+def _parse_recipes(recipes):
     processed = []
     for recipe in recipes:
         try:
-            processed.append({
-                'drink_id': int(recipe['drink_id']),
-                'drink_name': str(recipe['drink_name']),
-                'ingredients': {str(k): int(v) for k, v in recipe.get('ingredients', {}).items()},
-                'notes': str(recipe.get('notes', ''))
-            })
+            processed.append(_freeze(recipe))
         except Exception as e:
             logging.error(f"Error processing recipe {recipe}: {e}")
-    return processed
+    return tuple(processed)
+
+def _thaw(recipe):
+    thawed = dict(recipe, ingredients=dict(recipe['ingredients']), layers=dict(recipe['layers']),
+                  after={k: list(v) for k, v in recipe['after'].items()})
+    # Recipes without a pour order keep the plain format
+    for key in ('layers', 'after'):
+        if not thawed[key]:
+            del thawed[key]
+    return thawed
+
+class RecipeRepository:
+    """Parsed recipes indexed by id, name and ingredient.
+
+    Reads come from the in-memory indexes. Edits update them in place and
+    schedule a single write of the recipe file flush_delay seconds later, so a
+    burst of edits costs one rewrite. If the file changes on disk, e.g. an
+    edit saved by the other front-end, the indexes are rebuilt from it with
+    any pending edits applied on top; the flush re-reads the file under
+    file_lock first, so it never writes back over such an edit.
+    """
+    def __init__(self, recipe_file, flush_delay=2.0):
+        self.recipe_file = recipe_file
+        self.flush_delay = flush_delay
+        self._lock = RLock()
+        self._source = None
+        self._by_id = {}
+        self._by_name = {}
+        self._by_ingredient = {}
+        self._snapshot = ()
+        self._dirty = False
+        # drink_id -> recipe, or None if deleted, for edits not yet flushed
+        self._pending = {}
+        # A replace_all() not yet flushed: the whole catalog is ours
+        self._replaced = False
+        self._timer = None
+        self._generation = 0
+
+    def _refresh(self):
+        """Rebuilds the indexes if the file changed underneath us. Caller holds self._lock"""
+        if self._replaced:
+            return
+        source = store.get(self.recipe_file, [], _parse_recipes)
+        if source is self._source:
+            return
+        self._source = source
+        self._generation += 1
+        self._by_id = {}
+        self._by_name = {}
+        self._by_ingredient = {}
+        for recipe in source:
+            self._index(recipe)
+        for drink_id, recipe in self._pending.items():
+            old = self._by_id.pop(drink_id, None) if recipe is None else self._by_id.get(drink_id)
+            if old is not None:
+                self._unindex(old)
+            if recipe is not None:
+                self._index(recipe)
+        self._snapshot = tuple(self._by_id.values()) if self._pending else source
+
+    def _index(self, recipe):
+        drink_id = recipe['drink_id']
+        self._by_id[drink_id] = recipe
+        self._by_name[normalize_ingredient(recipe['drink_name'])] = drink_id
+        for ingredient in recipe['ingredients']:
+            self._by_ingredient.setdefault(normalize_ingredient(ingredient), set()).add(drink_id)
+
+    def _unindex(self, recipe):
+        name = normalize_ingredient(recipe['drink_name'])
+        if self._by_name.get(name) == recipe['drink_id']:
+            del self._by_name[name]
+        for ingredient in recipe['ingredients']:
+            self._by_ingredient.get(normalize_ingredient(ingredient), set()).discard(recipe['drink_id'])
+
+    def _mark_dirty(self):
+        self._snapshot = tuple(self._by_id.values())
+        self._generation += 1
+        self._dirty = True
+        if self._timer is None:
+            self._timer = Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @property
+    def generation(self):
+        """Goes up whenever any recipe changes, in memory or on disk"""
+        with self._lock:
+            self._refresh()
+            return self._generation
+
+    def snapshot(self):
+        """Read-only tuple of recipes in catalog order"""
+        with self._lock:
+            self._refresh()
+            return self._snapshot
+
+    def get(self, drink_id):
+        with self._lock:
+            self._refresh()
+            return self._by_id.get(drink_id)
+
+    def get_by_name(self, drink_name):
+        with self._lock:
+            self._refresh()
+            drink_id = self._by_name.get(normalize_ingredient(drink_name))
+            return self._by_id.get(drink_id)
+
+    def with_ingredient(self, ingredient):
+        """Returns the recipes that use ingredient, in catalog order"""
+        with self._lock:
+            self._refresh()
+            ids = self._by_ingredient.get(normalize_ingredient(ingredient), set())
+            return tuple(r for r in self._by_id.values() if r['drink_id'] in ids)
+
+    def next_id(self):
+        with self._lock:
+            self._refresh()
+            return max(self._by_id, default=0) + 1
+
+    def put(self, recipe):
+        """Adds a recipe or replaces the one with the same drink_id"""
+        recipe = _freeze(recipe)
+        with self._lock:
+            self._refresh()
+            old = self._by_id.get(recipe['drink_id'])
+            if old is not None:
+                self._unindex(old)
+            # Assigning an existing key keeps the recipe's position in the catalog
+            self._index(recipe)
+            self._pending[recipe['drink_id']] = recipe
+            self._mark_dirty()
+
+    def delete(self, drink_id):
+        with self._lock:
+            self._refresh()
+            recipe = self._by_id.get(drink_id)
+            if recipe is None:
+                return
+            self._unindex(recipe)
+            del self._by_id[drink_id]
+            self._pending[drink_id] = None
+            self._mark_dirty()
+
+    def replace_all(self, recipes):
+        with self._lock:
+            self._by_id = {}
+            self._by_name = {}
+            self._by_ingredient = {}
+            for recipe in _parse_recipes(recipes):
+                self._index(recipe)
+            self._pending = {}
+            self._replaced = True
+            self._mark_dirty()
+
+    def flush(self):
+        """Writes pending edits to the recipe file, merged with whatever it holds now"""
+        with self._lock, file_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            # Picks up edits another process saved since we last looked
+            self._refresh()
+            save_json([_thaw(r) for r in self._snapshot], self.recipe_file)
+            self._dirty = False
+            self._pending = {}
+            self._replaced = False
+            # Adopt the file we just wrote so the next read does not rebuild the indexes
+            self._source = store.get(self.recipe_file, [], _parse_recipes)
+            self._snapshot = self._source
+            logging.debug(f"Flushed {len(self._snapshot)} recipes to {self.recipe_file}")
+
+recipe_repository = RecipeRepository(RECIPE_FILE)
+atexit.register(recipe_repository.flush)
+
+def recipes_snapshot():
+    """Read-only tuple of recipes, shared between callers"""
+    return recipe_repository.snapshot()
+
+def load_all_recipes():
+    """Returns a list of recipe dictionaries"""
+    return [_thaw(recipe) for recipe in recipes_snapshot()]
 
 def get_recipe_by_id(drink_id):
-    all_recipes = load_all_recipes()
-    for recipe in all_recipes:
-        if recipe.get('drink_id') == drink_id:
-            return recipe
-    return None
-
-def save_recipe(drink_id, drink_name, ingredients, notes):
-    """Save or update a recipe"""
-    recipes = load_all_recipes()
-    recipe = next((r for r in recipes if r['drink_id'] == drink_id), None)
-    if recipe:
-        recipe.update({'drink_name': drink_name, 'ingredients': ingredients, 'notes': notes})
-    else:
-        recipes.append({'drink_id': drink_id, 'drink_name': drink_name, 'ingredients': ingredients, 'notes': notes})
-    save_json(recipes, RECIPE_FILE)
+    recipe = recipe_repository.get(drink_id)
+    return _thaw(recipe) if recipe is not None else None
+
+def get_recipe_by_name(drink_name):
+    recipe = recipe_repository.get_by_name(drink_name)
+    return _thaw(recipe) if recipe is not None else None
+
+def get_recipes_with_ingredient(ingredient):
+    return [_thaw(recipe) for recipe in recipe_repository.with_ingredient(ingredient)]
+
+def next_drink_id():
+    return recipe_repository.next_id()
+
+def save_recipe(drink_id, drink_name, ingredients, notes, layers=None, after=None):
+    """Save or update a recipe.
+
+    layers and after default to the recipe's current pour order (see
+    pour_precedence), less any ingredients it no longer has.
+    """
+    current = recipe_repository.get(drink_id)
+    if layers is None:
+        layers = current['layers'] if current is not None else {}
+    if after is None:
+        after = current['after'] if current is not None else {}
+    layers = {k: v for k, v in layers.items() if k in ingredients}
+    after = {k: [i for i in v if i in ingredients] for k, v in after.items() if k in ingredients}
+    recipe_repository.put({'drink_id': drink_id, 'drink_name': drink_name, 'ingredients': ingredients, 'notes': notes,
+                           'layers': layers, 'after': {k: v for k, v in after.items() if v}})
 
 def delete_recipe(drink_id):
     """Delete a recipe by ID"""
-    recipes = load_all_recipes()
-    recipes = [r for r in recipes if r['drink_id'] != drink_id]
-    save_json(recipes, RECIPE_FILE)
+    recipe_repository.delete(drink_id)
+
+def save_all_recipes(recipes):
+    """Replace the whole catalog"""
+    recipe_repository.replace_all(recipes)
@@ -0,0 +1,179 @@
+# state_store.py
+import os
+import json
+import logging
+from threading import Lock, RLock
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# DRINKMIXER_DATA_DIR points the app at another data directory, e.g. a scratch copy for benchmarks
+DATA_DIR = os.environ.get('DRINKMIXER_DATA_DIR') or os.path.join(os.path.dirname(__file__), 'data')
+os.makedirs(DATA_DIR, exist_ok=True)
+
+class FileLock:
+    """A reentrant lock shared by every thread and every process using the same lock file.
+
+    The kiosk, the web app and the pump daemon all write the data files, so a
+    thread lock alone is not enough; the outermost acquire also takes an
+    exclusive flock on lock_path (where fcntl is available).
+    """
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+        self._lock = RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except OSError as e:
+                logging.error(f"Could not lock {self.lock_path}: {e}")
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+file_lock = FileLock(os.path.join(DATA_DIR, '.state.lock'))
+
+def load_json(file_path, default):
+    with file_lock:
+        if not os.path.exists(file_path):
+            return default
+        try:
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+            return data
+        except Exception as e:
+            logging.error(f"Error loading {file_path}: {e}")
+            return default
+
+def save_json(data, file_path):
+    with file_lock:
+        # Write then rename, so a reader in another process never sees half a file
+        tmp_path = file_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp_path, file_path)
+        except Exception as e:
+            logging.error(f"Error saving {file_path}: {e}")
+    store.invalidate(file_path)
+
+def file_signature(file_path):
+    """Returns (mtime_ns, size) for file_path, or None if it does not exist"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+class AppendLog:
+    """An append-only text log that several processes write and each replays incrementally.
+
+    read() returns (restarted, lines): the complete lines appended since the
+    last read, leaving a partial tail for next time. restarted is True when
+    the caller has to rebuild its state from scratch and replay every line:
+    on the first read, after restart(), and whenever the log was compacted
+    or replaced, possibly by another process.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._inode = False  # never equal to a real inode or None
+        self._offset = 0
+
+    def read(self):
+        try:
+            st = os.stat(self.path)
+            inode, size = st.st_ino, st.st_size
+        except OSError:
+            inode, size = None, 0
+        restarted = inode != self._inode or size < self._offset
+        if restarted:
+            self._inode = inode
+            self._offset = 0
+        lines = []
+        if size > self._offset:
+            with file_lock:
+                with open(self.path, 'rb') as f:
+                    f.seek(self._offset)
+                    chunk = f.read(size - self._offset)
+            complete = chunk[:chunk.rfind(b'\n') + 1]
+            lines = [line for line in complete.decode('ascii').splitlines() if line.strip()]
+            self._offset += len(complete)
+        return restarted, lines
+
+    def restart(self):
+        """Makes the next read() replay the whole log"""
+        self._inode = False
+
+    def append(self, lines):
+        with file_lock:
+            with open(self.path, 'a') as f:
+                f.write(''.join(lines))
+
+    def truncate(self):
+        """Empties the log once its lines are folded in elsewhere. Caller holds file_lock"""
+        open(self.path, 'w').close()
+        self._offset = 0
+
+    def rewrite(self, lines):
+        """Replaces the log with lines, e.g. one per key after compaction. Caller holds file_lock"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(''.join(lines))
+        os.replace(tmp_path, self.path)
+        self.restart()
+
+class StateStore:
+    """Process-wide cache of parsed data files.
+
+    Each entry is keyed by (file_path, parser) and revalidated against the
+    file's mtime and size, so steady-state reads cost one stat() and no JSON
+    parsing. Parsers should return read-only structures; the cached value is
+    shared by every caller. generation goes up whenever a cached value is
+    reloaded or dropped, so derived caches can key on it.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = {}
+        self.generation = 0
+
+    def get(self, file_path, default, parser=None):
+        signature = file_signature(file_path)
+        key = (file_path, parser)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+        data = load_json(file_path, default) if signature is not None else default
+        value = parser(data) if parser else data
+        with self._lock:
+            self._entries[key] = (signature, value)
+            self.generation += 1
+        logging.debug(f"State store reloaded {os.path.basename(file_path)}")
+        return value
+
+    def invalidate(self, file_path=None):
+        """Drops cached entries for file_path, or everything if no path is given"""
+        with self._lock:
+            keys = [k for k in self._entries if file_path is None or k[0] == file_path]
+            for key in keys:
+                del self._entries[key]
+            if keys:
+                self.generation += 1
+
+store = StateStore()
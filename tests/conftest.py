@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import tempfile
+
+# Project modules resolve DATA_DIR on import, so point them at a scratch directory before any test imports one
+os.environ.setdefault('DRINKMIXER_DATA_DIR', tempfile.mkdtemp())
@@ -0,0 +1,79 @@
+# tests/test_availability_checker.py
+import unittest
+
+from availability_checker import AvailabilityEngine, get_available_drinks, get_drinks_missing_one, get_low_volume_drinks
+from config_manager import save_bottle_volumes, save_hose_assignments, save_hose_statuses
+from recipe_manager import recipe_repository
+
+class AvailabilityEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = AvailabilityEngine(low_threshold=0.1)
+        self.engine.set_recipe(1, ['Gin', 'Tonic Water'])
+        self.engine.set_recipe(2, ['Vodka', 'Cranberry Juice'])
+        self.engine.set_recipe(3, ['Gin', 'Vodka', 'Lime Juice'])
+        self.engine.set_hose(1, 'Gin', False, 700, 700)
+        self.engine.set_hose(2, 'tonic  water', False, 1000, 1000)
+        self.engine.set_hose(3, 'Vodka', False, 700, 700)
+
+    def test_available_and_missing_one(self):
+        self.assertEqual(self.engine.available(), {1})
+        self.assertEqual(self.engine.missing_one(), {2: 'cranberry juice', 3: 'lime juice'})
+        self.engine.set_hose(4, 'Lime Juice', False, 500, 1000)
+        self.assertEqual(self.engine.available(), {1, 3})
+        self.assertEqual(self.engine.missing_one(), {2: 'cranberry juice'})
+
+    def test_changing_a_hose_reevaluates_only_recipes_using_it(self):
+        evaluated = []
+        evaluate = self.engine._evaluate
+        self.engine._evaluate = lambda drink_id: (evaluated.append(drink_id), evaluate(drink_id))
+        self.engine.set_hose(2, 'Tonic Water', True)
+        self.assertEqual(evaluated, [1])
+        self.assertEqual(self.engine.available(), set())
+        evaluated.clear()
+        # Same state again: nothing to recompute
+        self.engine.set_hose(2, 'Tonic Water', True)
+        self.assertEqual(evaluated, [])
+
+    def test_reassigning_a_hose_moves_availability(self):
+        self.engine.set_hose(3, 'Cranberry Juice', False, 700, 700)
+        self.assertEqual(self.engine.available(), {1})
+        self.assertEqual(self.engine.missing_one(), {2: 'vodka'})
+
+    def test_dry_bottle_is_not_usable(self):
+        self.engine.set_hose(1, 'Gin', False, 0, 700)
+        self.assertEqual(self.engine.available(), set())
+        self.assertEqual(self.engine.missing_one()[1], 'gin')
+
+    def test_low_volume_needs_every_usable_hose_low(self):
+        self.engine.set_hose(1, 'Gin', False, 50, 700)
+        self.assertEqual(self.engine.low_volume(), {1})
+        self.engine.set_hose(5, 'Gin', False, 700, 700)
+        self.assertEqual(self.engine.low_volume(), set())
+        self.assertEqual(self.engine.available(), {1})
+
+    def test_removed_recipe_is_forgotten(self):
+        self.engine.remove_recipe(1)
+        self.assertEqual(self.engine.available(), set())
+        self.engine.set_hose(2, 'Tonic Water', True)
+        self.assertNotIn(1, self.engine.missing_one())
+
+class StoreSyncTest(unittest.TestCase):
+    def test_module_functions_follow_the_data_files(self):
+        recipe_repository.replace_all([
+            {'drink_id': 1, 'drink_name': 'Gin Tonic', 'ingredients': {'Gin': 50, 'Tonic Water': 150}},
+            {'drink_id': 2, 'drink_name': 'Screwdriver', 'ingredients': {'Vodka': 50, 'Orange Juice': 150}}])
+        recipe_repository.flush()
+        save_hose_assignments({1: 'Gin', 2: 'Tonic Water', 3: 'Vodka'})
+        save_hose_statuses({1: False, 2: False, 3: False})
+        save_bottle_volumes({1: {'total_volume_ml': 700, 'remaining_volume_ml': 40},
+                             2: {'total_volume_ml': 1000, 'remaining_volume_ml': 1000},
+                             3: {'total_volume_ml': 700, 'remaining_volume_ml': 700}})
+        self.assertEqual([drink['drink_id'] for drink in get_available_drinks()], [1])
+        self.assertEqual(get_drinks_missing_one(), {2: 'orange juice'})
+        self.assertEqual(get_low_volume_drinks(), {1})
+        save_hose_statuses({1: True, 2: False, 3: False})
+        self.assertEqual(get_drinks_missing_one(), {1: 'gin', 2: 'orange juice'})
+        self.assertEqual(get_low_volume_drinks(), set())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# tests/test_dispense_engine.py
+import threading
+import time
+import unittest
+
+from config_manager import (bottle_volumes_snapshot, refill_bottle, save_bottle_volumes, save_hose_assignments,
+                            save_pump_calibration, DEFAULT_BOTTLE_ML)
+from dispense_engine import DispenseEngine, dispense_concurrently
+from dispense_plan import PumpJob
+from pump_driver import SimulatedPumpDriver, VirtualClock
+from recipe_manager import recipe_repository
+
+class ParkedPumpTest(unittest.TestCase):
+    def test_virtual_clock_stands_still_while_waiting_for_a_swap(self):
+        driver = SimulatedPumpDriver(clock=VirtualClock(), pump_ids=(1, 2))
+        swapped = threading.Event()
+        threading.Timer(0.3, swapped.set).start()
+        jobs = [PumpJob(1, 2.0, 20.0), PumpJob(2, 3.0, 30.0)]
+        started = time.monotonic()
+        done = dispense_concurrently(jobs, driver, ready=lambda job: job.pump_id != 2 or swapped.is_set())
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual([job.pump_id for job in done], [1, 2])
+        # Pump 2 waited for the swap in real time, not by running the virtual clock ahead
+        self.assertLess(jobs[1].started_at, 2.5)
+        self.assertAlmostEqual(driver.monotonic(), jobs[1].started_at + 3.0, places=6)
+
+class BottleSwapTest(unittest.TestCase):
+    def setUp(self):
+        save_hose_assignments({7: 'Gin', 8: 'Tonic'})
+        save_pump_calibration(7, 10.0)
+        save_pump_calibration(8, 10.0)
+        save_bottle_volumes({7: {'total_volume_ml': 700, 'remaining_volume_ml': 5.0},
+                             8: {'total_volume_ml': 1000, 'remaining_volume_ml': 1000.0}})
+        recipe_repository.put({'drink_id': 90, 'drink_name': 'Swap Test', 'ingredients': {'Gin': 30, 'Tonic': 70}})
+        recipe_repository.flush()
+        driver = SimulatedPumpDriver(clock=VirtualClock(), pump_ids=(7, 8))
+        self.engine = DispenseEngine(driver=driver, progress_hz=0, swap_timeout=0.3)
+        self.events = []
+        self.engine.subscribe(lambda event, data: self.events.append((event, data)))
+
+    def test_unconfirmed_swap_abandons_the_pour(self):
+        started = time.monotonic()
+        poured = self.engine.pour(90, 100, allow_swap=True).result(10)
+        self.assertFalse(poured)
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        names = [event for event, _ in self.events]
+        self.assertIn('bottle_swap_timeout', names)
+        self.assertEqual(names[-1], 'pour_error')
+        self.assertNotIn('pour_cancelled', names)
+        self.assertEqual(self.engine.swap_stats()['pending'], [])
+        # The next order is not held up behind it
+        self.engine.confirm_swap(7)
+        self.assertTrue(self.engine.pour(90, 100, allow_swap=True).result(10))
+
+    def test_refill_books_a_bottle_on_a_hose_without_a_record(self):
+        self.assertNotIn(9, bottle_volumes_snapshot())
+        self.assertEqual(refill_bottle(9), DEFAULT_BOTTLE_ML)
+        self.assertEqual(bottle_volumes_snapshot()[9]['remaining_volume_ml'], DEFAULT_BOTTLE_ML)
+        self.assertEqual(refill_bottle(7), 700)
+        self.assertEqual(refill_bottle(8, 750), 750)
+
+if __name__ == '__main__':
+    unittest.main()
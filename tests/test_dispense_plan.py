@@ -0,0 +1,35 @@
+# tests/test_dispense_plan.py
+import unittest
+
+from config_manager import save_pump_calibration
+from dispense_plan import DEFAULT_FLOW_RATE, DispensePlan, flow_rate
+from power_budget import PowerBudget
+
+class FailoverTest(unittest.TestCase):
+    def test_only_hoses_with_a_sibling_fail_over(self):
+        # Gin is on hoses 1 and 2, Rum only on hose 3; hoses 1 and 3 are both low
+        demands = (('Gin', 60.0, ((1, 10.0), (2, 10.0))), ('Rum', 40.0, ((3, 10.0),)))
+        compiled = DispensePlan(1, 'Gin and Rum', 100.0, demands, (), PowerBudget(), 0)
+        bottles = {1: {'remaining_volume_ml': 10.0}, 2: {'remaining_volume_ml': 500.0},
+                   3: {'remaining_volume_ml': 5.0}}
+        rebalanced = compiled.with_failover(bottles)
+        self.assertEqual(compiled.failed_over(rebalanced), [1])
+        volumes = rebalanced.volumes()
+        self.assertAlmostEqual(volumes[1], 10.0, places=6)
+        self.assertAlmostEqual(volumes[2], 50.0, places=6)
+        self.assertEqual([pour.pump_id for pour, _ in rebalanced.shortfalls(bottles)], [3])
+
+class FlowRateTest(unittest.TestCase):
+    def test_zero_rate_is_refused_when_saved(self):
+        for rate in (0, -1.5):
+            with self.assertRaises(ValueError):
+                save_pump_calibration(1, rate)
+
+    def test_zero_rate_on_file_falls_back_to_the_default(self):
+        calibrations = {1: 0.0, 2: 12.5}
+        self.assertEqual(flow_rate(calibrations, 1), DEFAULT_FLOW_RATE)
+        self.assertEqual(flow_rate(calibrations, 2), 12.5)
+        self.assertEqual(flow_rate(calibrations, 3), DEFAULT_FLOW_RATE)
+
+if __name__ == '__main__':
+    unittest.main()
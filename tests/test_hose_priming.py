@@ -0,0 +1,78 @@
+# tests/test_hose_priming.py
+import os
+import tempfile
+import unittest
+
+from calibration_history import CalibrationHistory
+from config_manager import pump_calibrations_snapshot, pump_startup_snapshot
+from dispense_plan import DispensePlan
+from hose_priming import HosePriming
+from power_budget import PowerBudget
+from state_store import file_signature
+
+RATE = 12.0
+STARTUP_S = 0.4
+
+class StartupAndFillTest(unittest.TestCase):
+    def setUp(self):
+        workdir = tempfile.mkdtemp()
+        self.history = CalibrationHistory(os.path.join(workdir, 'calibration_history.json'))
+        self.priming = HosePriming(os.path.join(workdir, 'hose_priming.json'), os.path.join(workdir, 'hose_usage.log'))
+
+    def test_prime_after_fitted_startup_counts_startup_once(self):
+        for elapsed in (2.0, 4.0, 6.0, 8.0):
+            self.history.record(3, elapsed, RATE * (elapsed - STARTUP_S))
+        rate = pump_calibrations_snapshot()[3]
+        startup = pump_startup_snapshot()[3]
+        self.assertAlmostEqual(rate, RATE, places=6)
+        self.assertAlmostEqual(startup, STARTUP_S, places=6)
+
+        # A new bottle: the operator holds prime for start-up plus 2 s of filling 24 ml of tubing
+        self.priming.swapped(3)
+        filled = self.priming.record_prime(3, STARTUP_S + 2.0, rate, startup)
+        self.assertAlmostEqual(filled, 24.0, places=6)
+        self.assertAlmostEqual(self.priming.fill_ml(3, swapped=True), 24.0, places=6)
+
+        # 60 ml after a swap: start-up, then 2 s of filling, then 5 s into the glass
+        compiled = DispensePlan(1, 'Gin', 60.0, (('Gin', 60.0, ((3, rate),)),), (), PowerBudget(), 0,
+                                fill=self.priming.fill_volumes([3], swapped={3}), startup={3: startup})
+        job = compiled.jobs()[0]
+        self.assertAlmostEqual(job.duration, STARTUP_S + 2.0 + 5.0, places=6)
+        job.started_at, job.stopped_at = 0.0, job.duration
+        self.assertAlmostEqual(job.filled_ml, 24.0, places=6)
+        self.assertAlmostEqual(job.dispensed_ml, 60.0, places=6)
+
+    def test_prime_shorter_than_startup_is_not_a_measurement(self):
+        self.priming.swapped(4)
+        self.assertEqual(self.priming.record_prime(4, 0.3, RATE, STARTUP_S), 0.0)
+        self.assertEqual(self.priming.fill_ml(4, swapped=True), 0.0)
+
+class UsageLogTest(unittest.TestCase):
+    def setUp(self):
+        workdir = tempfile.mkdtemp()
+        self.path = os.path.join(workdir, 'hose_priming.json')
+        self.usage_file = os.path.join(workdir, 'hose_usage.log')
+        self.priming = HosePriming(self.path, self.usage_file, compact_every=10)
+        self.priming.swapped(5)
+        self.priming.record_prime(5, 2.0, RATE)
+
+    def test_pours_do_not_rewrite_learned_parameters(self):
+        learned = file_signature(self.path)
+        self.priming.used([5, 6])
+        self.priming.swapped(5)
+        self.assertEqual(file_signature(self.path), learned)
+        self.assertAlmostEqual(self.priming.fill_ml(5), 24.0, places=6)
+
+    def test_usage_survives_compaction_and_other_instances(self):
+        for _ in range(12):
+            self.priming.used([5])
+        with open(self.usage_file) as f:
+            self.assertLess(len(f.readlines()), 10)
+        self.priming.swapped(5)
+        other = HosePriming(self.path, self.usage_file)
+        self.assertAlmostEqual(other.fill_ml(5), 24.0, places=6)
+        other.used([5])
+        self.assertEqual(self.priming.fill_ml(5), 0.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# tests/test_order_queue.py
+import os
+import tempfile
+import unittest
+
+from order_queue import (DeferShortOrdersPolicy, FifoPolicy, Order, OrderQueue, PriorityPolicy, ShortestJobFirstPolicy,
+                         make_policy)
+
+class OrderQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.queue_file = os.path.join(tempfile.mkdtemp(), 'order_queue.json')
+        self.queue = OrderQueue(self.queue_file, estimate_duration=lambda order: order.total_volume / 10)
+
+    def test_orders_are_poured_first_come_first_served(self):
+        first = self.queue.submit(1, 200, 'Gin Tonic')
+        second = self.queue.submit(2, 100, 'Shot')
+        self.assertEqual(len(self.queue), 2)
+        self.assertIs(self.queue.get(timeout=0), first)
+        self.assertIs(self.queue.get(timeout=0), second)
+        self.assertIsNone(self.queue.get(timeout=0))
+
+    def test_snapshot_positions_and_eta(self):
+        self.queue.submit(1, 200)
+        self.queue.submit(2, 100, servings=3)
+        current = self.queue.get(timeout=0)
+        self.queue.submit(3, 50)
+        entries = self.queue.snapshot()
+        self.assertEqual([(e['order_id'], e['position']) for e in entries], [(1, 0), (2, 1), (3, 2)])
+        self.assertLessEqual(entries[0]['eta'], 20.0)
+        self.assertAlmostEqual(entries[2]['eta'] - entries[1]['eta'], 5.0, places=1)
+        self.queue.done(current)
+        self.assertEqual(self.queue.status(1), None)
+        self.assertEqual(self.queue.status(2)['position'], 1)
+
+    def test_cancel_only_removes_waiting_orders(self):
+        self.queue.submit(1, 200)
+        self.queue.submit(2, 100)
+        self.queue.get(timeout=0)
+        self.assertFalse(self.queue.cancel(1))
+        self.assertTrue(self.queue.cancel(2))
+        self.assertEqual(len(self.queue), 0)
+
+    def test_current_order_until_done(self):
+        self.assertIsNone(self.queue.current())
+        self.queue.submit(1, 200)
+        order = self.queue.get(timeout=0)
+        self.assertIs(self.queue.current(), order)
+        self.queue.done(order)
+        self.assertIsNone(self.queue.current())
+
+    def test_pending_orders_survive_a_restart(self):
+        self.queue.submit(1, 200, 'Gin Tonic')
+        self.queue.submit(2, 100, 'Shot', servings=2)
+        self.queue.get(timeout=0)
+        restored = OrderQueue(self.queue_file)
+        order = restored.get(timeout=0)
+        self.assertEqual((order.order_id, order.drink_name, order.servings), (2, 'Shot', 2))
+        self.assertEqual(restored.submit(3, 50).order_id, 3)
+
+    def test_wait_metrics(self):
+        self.queue.submit(1, 200)
+        self.queue.get(timeout=0)
+        metrics = self.queue.metrics()
+        self.assertEqual((metrics['policy'], metrics['orders']), ('fifo', 1))
+
+def orders(*specs):
+    """Orders from (estimate_s, created_at, priority) tuples, numbered from 1"""
+    pending = []
+    for order_id, (estimate, created_at, priority) in enumerate(specs, 1):
+        order = Order(order_id, order_id, 100, created_at=created_at, priority=priority)
+        order.estimate = estimate
+        pending.append(order)
+    return pending
+
+class PolicyTest(unittest.TestCase):
+    def test_fifo(self):
+        self.assertEqual(FifoPolicy().select(orders((30, 0, 0), (5, 1, 0)), 10), 0)
+
+    def test_shortest_job_first(self):
+        pending = orders((30, 0, 0), (5, 1, 0), (5, 2, 0))
+        self.assertEqual(ShortestJobFirstPolicy(max_wait=120).select(pending, 10), 1)
+
+    def test_overdue_order_is_served_before_shorter_ones(self):
+        pending = orders((30, 0, 0), (5, 50, 0))
+        self.assertEqual(ShortestJobFirstPolicy(max_wait=120).select(pending, 130), 0)
+
+    def test_priority_with_tiebreak(self):
+        pending = orders((30, 0, 0), (20, 1, 1), (10, 2, 1))
+        self.assertEqual(PriorityPolicy().select(pending, 10), 1)
+        self.assertEqual(PriorityPolicy(ShortestJobFirstPolicy()).select(pending, 10), 2)
+
+    def test_make_policy(self):
+        self.assertEqual(make_policy('sjf').name, 'sjf')
+        self.assertIsInstance(make_policy('priority').tiebreak, ShortestJobFirstPolicy)
+        self.assertEqual(make_policy('bogus').name, 'fifo')
+
+    def test_queue_dispatches_and_predicts_with_its_policy(self):
+        queue = OrderQueue(os.path.join(tempfile.mkdtemp(), 'order_queue.json'),
+                           estimate_duration=lambda order: order.total_volume / 10, policy=make_policy('priority'))
+        queue.submit(1, 300)
+        queue.submit(2, 50)
+        queue.submit(3, 100)
+        self.assertEqual([entry['order_id'] for entry in queue.snapshot()], [2, 3, 1])
+        self.assertTrue(queue.set_priority(1, 5))
+        self.assertEqual([entry['order_id'] for entry in queue.snapshot()], [1, 2, 3])
+        self.assertEqual(queue.get(timeout=0).order_id, 1)
+        self.assertFalse(queue.set_priority(1, 0))
+
+class DeferShortOrdersTest(unittest.TestCase):
+    def setUp(self):
+        # Order 1 would run a bottle dry; the others are covered
+        self.policy = DeferShortOrdersPolicy(FifoPolicy(), lambda pending: [o.order_id != 1 for o in pending],
+                                             max_defer=120)
+
+    def test_short_order_waits_behind_covered_ones(self):
+        self.assertEqual(self.policy.select(orders((10, 0, 0), (10, 5, 0)), 30), 1)
+        self.assertEqual(self.policy.select(orders((10, 0, 0)), 30), 0)
+
+    def test_short_order_is_not_deferred_past_max_defer(self):
+        self.assertEqual(self.policy.select(orders((10, 0, 0), (10, 100, 0)), 120), 0)
+
+    def test_raised_priority_skips_the_deferral(self):
+        policy = DeferShortOrdersPolicy(PriorityPolicy(), self.policy.pourable)
+        self.assertEqual(policy.select(orders((10, 0, 2), (10, 5, 0)), 30), 0)
+
+if __name__ == '__main__':
+    unittest.main()
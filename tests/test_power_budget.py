@@ -0,0 +1,54 @@
+# tests/test_power_budget.py
+import unittest
+
+from dispense_plan import PumpJob
+from power_budget import PowerBudget, plan
+
+class FitsTest(unittest.TestCase):
+    def test_concurrency_and_current_limits(self):
+        budget = PowerBudget({1: 2.0, 2: 2.0, 3: 3.0}, max_concurrent=2, max_total_a=4.5)
+        self.assertTrue(budget.fits([], 3))
+        self.assertTrue(budget.fits([1], 2))
+        self.assertFalse(budget.fits([1], 1))
+        self.assertFalse(budget.fits([1], 3))
+        self.assertFalse(budget.fits([1, 2], 4))
+
+    def test_pump_over_budget_still_runs_alone(self):
+        budget = PowerBudget({1: 6.0}, max_total_a=5.0)
+        self.assertTrue(budget.fits([], 1))
+        self.assertFalse(budget.fits([2], 1))
+
+class PlanTest(unittest.TestCase):
+    def test_unlimited_budget_runs_everything_at_once(self):
+        jobs = [PumpJob(1, 4.0), PumpJob(2, 1.0), PumpJob(3, 2.5)]
+        starts, makespan = plan(jobs, PowerBudget())
+        self.assertEqual([offset for offset, _ in starts], [0.0, 0.0, 0.0])
+        self.assertEqual(makespan, 4.0)
+
+    def test_packs_longest_first_within_concurrency(self):
+        jobs = [PumpJob(1, 1.0), PumpJob(2, 4.0), PumpJob(3, 2.0), PumpJob(4, 3.0)]
+        starts, makespan = plan(jobs, PowerBudget(max_concurrent=2))
+        self.assertEqual([(offset, job.pump_id) for offset, job in starts], [(0.0, 2), (0.0, 4), (3.0, 3), (4.0, 1)])
+        self.assertEqual(makespan, 5.0)
+
+    def test_search_beats_longest_first(self):
+        # Longest first leaves one slot running 3 + 2 + 2 s; 3 + 3 against 2 + 2 + 2 takes 6 s
+        jobs = [PumpJob(pump_id, duration) for pump_id, duration in enumerate((3.0, 3.0, 2.0, 2.0, 2.0), 1)]
+        _, makespan = plan(jobs, PowerBudget(max_concurrent=2))
+        self.assertEqual(makespan, 6.0)
+
+    def test_current_limit_serialises_heavy_pumps(self):
+        jobs = [PumpJob(1, 2.0), PumpJob(2, 2.0), PumpJob(3, 1.0)]
+        budget = PowerBudget({1: 3.0, 2: 3.0, 3: 1.0}, max_total_a=4.0)
+        starts, makespan = plan(jobs, budget)
+        self.assertEqual(makespan, 4.0)
+        offsets = {job.pump_id: offset for offset, job in starts}
+        self.assertEqual(sorted((offsets[1], offsets[2])), [0.0, 2.0])
+
+    def test_zero_length_jobs_are_left_out(self):
+        starts, makespan = plan([PumpJob(1, 0.0), PumpJob(2, 1.5)], PowerBudget(max_concurrent=1))
+        self.assertEqual([job.pump_id for _, job in starts], [2])
+        self.assertEqual(makespan, 1.5)
+
+if __name__ == '__main__':
+    unittest.main()
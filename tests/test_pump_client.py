@@ -0,0 +1,85 @@
+# tests/test_pump_client.py
+import os
+import json
+import socket
+import tempfile
+import threading
+import unittest
+
+from pump_client import RemoteEngine
+
+class FakeDaemon:
+    """Answers status and stop_stats like pump_daemon.py and can drop every client connection"""
+    def __init__(self, path):
+        self.path = path
+        self.connections = []
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            for line in conn.makefile('rb'):
+                request = json.loads(line)
+                result = {'halted': False} if request['method'] == 'status' else {'stops': 0}
+                conn.sendall((json.dumps({'id': request['id'], 'result': result}) + '\n').encode())
+        except OSError:
+            pass
+
+    def drop_connections(self):
+        for conn in self.connections:
+            conn.shutdown(socket.SHUT_RDWR)
+            conn.close()
+
+    def close(self):
+        self.server.close()
+
+class RemoteEngineReconnectTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.daemon = FakeDaemon(os.path.join(self.workdir, 'pump_daemon.sock'))
+        self.client = RemoteEngine(self.daemon.path)
+
+    def tearDown(self):
+        self.client.cleanup()
+        self.daemon.close()
+
+    def call_with_deadline(self, method, timeout=3.0):
+        outcome = {}
+
+        def run():
+            try:
+                outcome['result'] = method()
+            except Exception as e:
+                outcome['error'] = e
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        worker.join(timeout)
+        self.assertFalse(worker.is_alive(), "call hung after the connection dropped")
+        return outcome
+
+    def test_call_after_dropped_connection_reconnects(self):
+        self.assertEqual(self.client.stop_stats(), {'stops': 0})
+        self.daemon.drop_connections()
+        # Wait until the reader has seen the connection go
+        for _ in range(100):
+            if self.client._sock is None:
+                break
+            threading.Event().wait(0.01)
+        outcome = self.call_with_deadline(self.client.stop_stats)
+        self.assertEqual(outcome.get('result'), {'stops': 0}, outcome.get('error'))
+        self.assertEqual(len(self.daemon.connections), 2)
+        self.assertFalse(self.client.halted)
+
+if __name__ == '__main__':
+    unittest.main()
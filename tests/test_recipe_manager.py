@@ -0,0 +1,92 @@
+# tests/test_recipe_manager.py
+import os
+import tempfile
+import unittest
+
+from dispense_plan import DispensePlan, PumpJob
+from power_budget import PowerBudget, critical_path_order
+from recipe_manager import RecipeRepository, pour_precedence
+
+SUNRISE = {'ingredients': {'Tequila': 50, 'Orange Juice': 120, 'Grenadine': 15}}
+
+class PourPrecedenceTest(unittest.TestCase):
+    def test_no_pour_order(self):
+        self.assertEqual(pour_precedence(SUNRISE), {})
+
+    def test_layers_pour_after_every_lower_layer(self):
+        recipe = dict(SUNRISE, layers={'Orange Juice': 1, 'Grenadine': 2})
+        self.assertEqual(pour_precedence(recipe), {'Orange Juice': ('Tequila',),
+                                                   'Grenadine': ('Tequila', 'Orange Juice')})
+
+    def test_after_adds_to_layers(self):
+        recipe = dict(SUNRISE, layers={'Grenadine': 1}, after={'Orange Juice': ['Tequila']})
+        self.assertEqual(pour_precedence(recipe), {'Orange Juice': ('Tequila',),
+                                                   'Grenadine': ('Tequila', 'Orange Juice')})
+
+    def test_cycle_is_rejected(self):
+        recipe = dict(SUNRISE, after={'Tequila': ['Grenadine'], 'Grenadine': ['Orange Juice'],
+                                      'Orange Juice': ['Tequila']})
+        with self.assertRaises(ValueError):
+            pour_precedence(recipe)
+
+    def test_after_contradicting_layers_is_rejected(self):
+        recipe = dict(SUNRISE, layers={'Grenadine': 1}, after={'Tequila': ['Grenadine']})
+        with self.assertRaises(ValueError):
+            pour_precedence(recipe)
+
+    def test_unknown_ingredient_is_rejected(self):
+        with self.assertRaises(ValueError):
+            pour_precedence(dict(SUNRISE, layers={'Cola': 1}))
+
+class PourOrderScheduleTest(unittest.TestCase):
+    def test_chain_starts_ahead_of_a_longer_single_job(self):
+        base = PumpJob(1, 2.0)
+        topping = PumpJob(2, 3.0, after=[base])
+        single = PumpJob(3, 4.0)
+        self.assertEqual(critical_path_order([single, topping, base]), [base, single, topping])
+
+    def test_plan_keeps_layers_in_order(self):
+        demands = (('Tequila', 50.0, ((1, 10.0),)), ('Orange Juice', 120.0, ((2, 20.0),)),
+                   ('Grenadine', 15.0, ((3, 5.0),)))
+        precedence = pour_precedence(dict(SUNRISE, layers={'Grenadine': 1}))
+        compiled = DispensePlan(1, 'Tequila Sunrise', 185.0, demands, (), PowerBudget(), 0, precedence=precedence)
+        starts = {pour.ingredient: pour.start_s for pour in compiled.pours}
+        self.assertEqual(starts['Tequila'], 0.0)
+        self.assertEqual(starts['Orange Juice'], 0.0)
+        self.assertEqual(starts['Grenadine'], 6.0)
+        self.assertEqual(compiled.makespan, 9.0)
+
+def recipe(drink_id, name, **ingredients):
+    return {'drink_id': drink_id, 'drink_name': name, 'ingredients': ingredients or {'Gin': 1}}
+
+class TwoProcessEditTest(unittest.TestCase):
+    def setUp(self):
+        recipe_file = os.path.join(tempfile.mkdtemp(), 'drink_recipes.json')
+        self.kiosk = RecipeRepository(recipe_file, flush_delay=60)
+        self.web = RecipeRepository(recipe_file, flush_delay=60)
+        self.kiosk.replace_all([recipe(1, 'Gin Tonic'), recipe(2, 'Negroni'), recipe(3, 'Martini')])
+        self.kiosk.flush()
+
+    def names(self, repository):
+        return [r['drink_name'] for r in repository.snapshot()]
+
+    def test_flush_keeps_an_edit_saved_by_the_other_front_end(self):
+        self.kiosk.put(recipe(1, 'Gin and Tonic'))
+        self.web.put(recipe(4, 'Screwdriver', Vodka=1))
+        self.web.delete(3)
+        self.web.flush()
+        # The kiosk still has its own edit pending and sees the web's on top
+        self.assertEqual(self.names(self.kiosk), ['Gin and Tonic', 'Negroni', 'Screwdriver'])
+        self.kiosk.flush()
+        fresh = RecipeRepository(self.kiosk.recipe_file)
+        self.assertEqual(self.names(fresh), ['Gin and Tonic', 'Negroni', 'Screwdriver'])
+
+    def test_pending_delete_wins_over_the_file(self):
+        self.kiosk.delete(2)
+        self.web.put(recipe(2, 'Boulevardier'))
+        self.web.flush()
+        self.kiosk.flush()
+        self.assertEqual(self.names(RecipeRepository(self.kiosk.recipe_file)), ['Gin Tonic', 'Martini'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+# tests/test_volume_forecast.py
+import unittest
+
+from config_manager import save_hose_assignments, save_hose_statuses
+from recipe_manager import recipe_repository
+from volume_forecast import forecast_queue
+
+def entry(order_id, position, size=200.0):
+    return {'order_id': order_id, 'drink_id': 1, 'size': size, 'servings': 1, 'position': position}
+
+class ForecastTest(unittest.TestCase):
+    def setUp(self):
+        recipe_repository.replace_all([{'drink_id': 1, 'drink_name': 'Gin Tonic',
+                                        'ingredients': {'Gin': 1, 'Tonic Water': 3}}])
+        recipe_repository.flush()
+        save_hose_assignments({1: 'Gin', 2: 'Gin', 3: 'Tonic Water'})
+        save_hose_statuses({1: False, 2: False, 3: False})
+
+    def levels(self, gin_1, gin_2, tonic):
+        return {1: {'total_volume_ml': 700, 'remaining_volume_ml': gin_1},
+                2: {'total_volume_ml': 700, 'remaining_volume_ml': gin_2},
+                3: {'total_volume_ml': 1000, 'remaining_volume_ml': tonic}}
+
+    def test_low_hose_with_a_full_sibling_is_not_short(self):
+        forecast = forecast_queue([entry(1, 1), entry(2, 2), entry(3, 3)], self.levels(10, 500, 1000))
+        self.assertEqual(forecast.exhaustions, [])
+        self.assertEqual(forecast.pourable_now, [True, True, True])
+
+    def test_failover_follows_the_levels_earlier_orders_leave(self):
+        # Hose 1 pours its 25 ml share of the first order and its last 5 ml into the second, which hose 2 tops up
+        forecast = forecast_queue([entry(1, 1), entry(2, 2), entry(3, 3)], self.levels(30, 100, 1000))
+        self.assertEqual([(e['position'], e['hose_id']) for e in forecast.exhaustions], [(3, 1)])
+
+    def test_order_being_poured_counts_against_the_bottles(self):
+        orders = [entry(1, 0), entry(2, 1)]
+        forecast = forecast_queue(orders, self.levels(500, 500, 200))
+        self.assertEqual([(e['order_id'], e['position'], e['hose_id']) for e in forecast.exhaustions], [(2, 1, 3)])
+        self.assertEqual(forecast.short_orders(), {2: ['Tonic Water']})
+        self.assertEqual(forecast_queue(orders[1:], self.levels(500, 500, 200)).exhaustions, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+# tests/test_volume_ledger.py
+import os
+import tempfile
+import unittest
+
+from state_store import save_json
+from volume_ledger import VolumeLedger
+
+class RefillTest(unittest.TestCase):
+    def setUp(self):
+        workdir = tempfile.mkdtemp()
+        files = os.path.join(workdir, 'bottle_volumes.json'), os.path.join(workdir, 'bottle_ledger.log')
+        save_json({'1': {'total_volume_ml': 700, 'remaining_volume_ml': 100.0},
+                   '2': {'total_volume_ml': 1000, 'remaining_volume_ml': 500.0}}, files[0])
+        self.kiosk = VolumeLedger(*files)
+        self.web = VolumeLedger(*files)
+
+    def test_refill_keeps_consumption_booked_by_another_process(self):
+        self.kiosk.snapshot()
+        self.web.consume_many({1: 20.0, 2: 50.0})
+        self.kiosk.refill(1, 700)
+        self.web.consume(1, 30.0)
+        self.assertEqual(self.kiosk.remaining(1), 670.0)
+        self.assertEqual(self.kiosk.remaining(2), 450.0)
+        self.assertEqual(self.web.snapshot()[1]['total_volume_ml'], 700)
+
+    def test_refill_survives_compaction(self):
+        self.kiosk.refill(2, 1000)
+        self.kiosk.consume(2, 10.0)
+        self.kiosk.compact()
+        self.assertEqual(VolumeLedger(self.kiosk.snapshot_file, self.kiosk.ledger_file).remaining(2), 990.0)
+
+    def test_other_process_sees_levels_after_compaction(self):
+        self.web.consume(2, 100.0)
+        self.assertEqual(self.kiosk.remaining(2), 400.0)
+        self.web.compact()
+        self.web.consume(2, 25.0)
+        self.assertEqual(self.kiosk.remaining(2), 375.0)
+        self.assertEqual(os.path.getsize(self.web.ledger_file), len("2 25.000\n"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 # ui_main.py
 import tkinter as tk
 from tkinter import ttk, messagebox
+from config_manager import find_hoses
 
 class MainScreen(tk.Frame):
     def __init__(self, master, controller, on_settings=None):
@@ -43,12 +44,12 @@ class MainScreen(tk.Frame):
             widget.destroy()
         drinks = self.controller.get_available_drinks()
         low_volumes = self.controller.get_low_volume_hoses()
-        hose_assignments = self.controller.get_hose_assignments()
+        ingredient_index = self.controller.get_ingredient_index()
         for drink in drinks:
             container = tk.Frame(self.drinks_frame, bd=1, relief=tk.RAISED, padx=5, pady=5)
             container.pack(fill=tk.X, padx=5, pady=5)
             btn_text = drink['drink_name']
-            if any(hose_id in low_volumes for hose_id, bev in hose_assignments.items() if bev.lower() in [ing.lower() for ing in drink['ingredients']]):
+            if any(hose_id in low_volumes for ing in drink['ingredients'] for hose_id in find_hoses(ing, ingredient_index)):
                 btn_text += " ⚠️ (Low Volume)"
             btn = tk.Button(container, text=btn_text, font=("Helvetica", 12, "bold"),
                             command=lambda d=drink: self.on_drink_selected(d['drink_id']))
@@ -1,10 +1,12 @@
 # ui_main_qt.py
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
                              QStackedWidget, QProgressBar, QScrollArea, QMessageBox,
-                             QCheckBox, QLineEdit, QGridLayout, QTextEdit, QComboBox)
+                             QCheckBox, QLineEdit, QGridLayout, QTextEdit, QComboBox, QDialog, QSpinBox)
 from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve, QRect, QPoint
 from PyQt6.QtGui import QFont, QColor
 from density_info import DENSITY_INFO
+from config_manager import find_hoses
+from dispense_plan import MAX_VESSEL_ML
 import logging
 
 class MainWindow(QWidget):
@@ -162,6 +164,10 @@ class MainScreen(QWidget):
         self.refresh_drink_list()
 
         nav_layout = QHBoxLayout()
+        stop_btn = QPushButton("\u26D4 STOP")  # No entry sign
+        stop_btn.setStyleSheet("background-color: #D50000;")
+        stop_btn.clicked.connect(self.emergency_stop)
+        nav_layout.addWidget(stop_btn)
         settings_btn = QPushButton("\u2699 Settings")  # Gear icon
         settings_btn.clicked.connect(lambda: self.switch_callback(1))
         nav_layout.addStretch()
@@ -174,7 +180,13 @@ class MainScreen(QWidget):
         self.progress.setFixedHeight(40)
         layout.addWidget(self.progress)
 
+        self.cancel_btn = QPushButton("Cancel Drink")
+        self.cancel_btn.clicked.connect(self.cancel_dispensing)
+        self.cancel_btn.hide()
+        layout.addWidget(self.cancel_btn)
+
         self.is_dispensing = False
+        self.dispense_cancelled = False
         self.mixer_worker = None
 
     def refresh_drink_list(self):
@@ -184,10 +196,10 @@ class MainScreen(QWidget):
                 self.drinks_layout.itemAt(i).widget().deleteLater()
             drinks = self.controller.get_available_drinks()
             low_volumes = self.controller.get_low_volume_hoses()
-            hose_assignments = self.controller.get_hose_assignments()
+            ingredient_index = self.controller.get_ingredient_index()
             for drink in drinks:
                 btn_text = drink['drink_name']
-                if any(hose_id in low_volumes for hose_id, bev in hose_assignments.items() if bev.lower() in [ing.lower() for ing in drink['ingredients']]):
+                if any(hose_id in low_volumes for ing in drink['ingredients'] for hose_id in find_hoses(ing, ingredient_index)):
                     btn_text += " \u26A0"  # Warning sign
                 btn = QPushButton(btn_text)
                 btn.setFixedSize(300, 80)
@@ -211,30 +223,70 @@ class MainScreen(QWidget):
             title.setStyleSheet("font-size: 24px; font-weight: bold; color: #00D4FF;")
             title.setAlignment(Qt.AlignmentFlag.AlignCenter)
             layout.addWidget(title)
-            for size, label in [(40, "Shot (40 ml)"), (375, "Average (375 ml)"), (500, "Huge (500 ml)")]:
+            # More than one serving pours a pitcher in a single pass
+            sizes = [(40, "Shot (40 ml)"), (375, "Average (375 ml)"), (500, "Huge (500 ml)")]
+            servings = QSpinBox()
+            servings.setRange(1, max(1, min(12, int(MAX_VESSEL_ML // sizes[0][0]))))
+            servings.setPrefix("Servings: ")
+            servings.setFixedSize(200, 50)
+            layout.addWidget(servings)
+            size_buttons = []
+            for size, label in sizes:
                 btn = QPushButton(label)
                 btn.setFixedSize(200, 60)
-                btn.clicked.connect(lambda checked, s=size: [self.start_dispensing(drink_id, s), dialog.accept()])
+                btn.clicked.connect(lambda checked, s=size: [self.start_dispensing(drink_id, s, servings.value()),
+                                                             dialog.accept()])
                 layout.addWidget(btn)
+                size_buttons.append((size, btn))
+
+            # Sizes whose servings would not fit in the vessel cannot be picked
+            def limit_sizes(count):
+                for size, btn in size_buttons:
+                    btn.setEnabled(size * count <= MAX_VESSEL_ML)
+            servings.valueChanged.connect(limit_sizes)
+            limit_sizes(servings.value())
             layout.addStretch()
             dialog.exec()
         except Exception as e:
             logging.error("Error in on_drink_selected: %s", e)
 
-    def start_dispensing(self, drink_id, size):
-        logging.debug("Starting dispensing for drink_id=%s, size=%s", drink_id, size)
+    def start_dispensing(self, drink_id, size, servings=1):
+        logging.debug("Starting dispensing for drink_id=%s, size=%s, servings=%s", drink_id, size, servings)
         try:
             self.is_dispensing = True
             self.progress.setValue(0)
+            self.progress.setFormat("%p%")
             self.mixer_worker = self.controller.mix_drink(
                 drink_id, size,
                 self.update_progress,
-                self.on_dispense_finished
+                self.on_dispense_finished,
+                servings
             )
+            if self.mixer_worker is not None:
+                self.mixer_worker.cancelled.connect(self.on_dispense_cancelled)
+                self.mixer_worker.eta.connect(self.update_eta)
+                self.cancel_btn.show()
         except Exception as e:
             logging.error("Error in start_dispensing: %s", e)
             self.is_dispensing = False
 
+    def cancel_dispensing(self):
+        logging.debug("Cancel pressed")
+        if self.mixer_worker is not None:
+            self.controller.cancel(self.mixer_worker)
+
+    def on_dispense_cancelled(self):
+        # on_dispense_finished follows with success=False; remember not to report it as a fault
+        self.dispense_cancelled = True
+
+    def emergency_stop(self):
+        logging.warning("Emergency stop pressed")
+        self.controller.emergency_stop()
+        QMessageBox.warning(self, "Emergency Stop",
+                            "All pumps are off. Clear the spout, then press OK to resume.",
+                            QMessageBox.StandardButton.Ok)
+        self.controller.resume()
+
     def update_progress(self, fraction):
         logging.debug("Updating progress: %s", fraction)
         try:
@@ -242,16 +294,25 @@ class MainScreen(QWidget):
         except Exception as e:
             logging.error("Error in update_progress: %s", e)
 
+    def update_eta(self, seconds):
+        self.progress.setFormat("%%p%% \u00b7 %ds left" % round(seconds))
+
     def on_dispense_finished(self, success):
         logging.debug("Dispensing finished with success=%s", success)
         try:
             self.is_dispensing = False
+            self.progress.setFormat("%p%")
+            self.cancel_btn.hide()
             self.refresh_drink_list()
             if success:
                 QMessageBox.information(self, "Done", "Drink is ready!", QMessageBox.StandardButton.Ok)
+            elif self.dispense_cancelled:
+                QMessageBox.information(self, "Cancelled", "The drink was cancelled", QMessageBox.StandardButton.Ok)
             else:
-                QMessageBox.critical(self, "Error", "Error dispensing the drink", QMessageBox.StandardButton.Ok)
+                error = self.mixer_worker.error if self.mixer_worker is not None else None
+                QMessageBox.critical(self, "Error", error or "Error dispensing the drink", QMessageBox.StandardButton.Ok)
             self.mixer_worker = None
+            self.dispense_cancelled = False
         except Exception as e:
             logging.error("Error in on_dispense_finished: %s", e)
 
@@ -396,7 +457,7 @@ class BottleVolumesScreen(QWidget):
             new_volumes = {}
             for k, (t, r) in self.entries.items():
                 total_val = int(t.text())
-                remaining_val = int(r.text())
+                remaining_val = float(r.text())
                 if total_val < 0 or remaining_val < 0 or remaining_val > total_val:
                     raise ValueError(f"Invalid values for Hose {k}")
                 new_volumes[k] = {'total_volume_ml': total_val, 'remaining_volume_ml': remaining_val}
@@ -439,6 +500,12 @@ class CleanPumpsScreen(QWidget):
         clean_btn.clicked.connect(self.start_cleaning)
         layout.addWidget(clean_btn)
 
+        stop_btn = QPushButton("Stop Cleaning")
+        stop_btn.clicked.connect(self.stop_cleaning)
+        layout.addWidget(stop_btn)
+        self.worker = None
+        self.cleaning_stopped = False
+
         layout.addStretch()
         back_btn = QPushButton("\u2B05 Back")  # Left arrow
         back_btn.clicked.connect(lambda: self.switch_callback(1))
@@ -450,11 +517,17 @@ class CleanPumpsScreen(QWidget):
             return
         self.status_label.setText("Starting cleaning sequence...")
         self.progress.setValue(0)
+        self.cleaning_stopped = False
         self.worker = self.controller.clean_pumps(
             self.update_progress,
             self.on_clean_finished
         )
 
+    def stop_cleaning(self):
+        logging.debug("Stop cleaning pressed")
+        if self.worker is not None:
+            self.cleaning_stopped = self.controller.cancel(self.worker)
+
     def update_progress(self, message, fraction):
         logging.debug("Cleaning progress: %s, %s", message, fraction)
         try:
@@ -477,6 +550,8 @@ class CleanPumpsScreen(QWidget):
                     )
                 else:
                     self.status_label.setText("Cleaning complete")
+            elif self.cleaning_stopped:
+                self.status_label.setText("Cleaning stopped")
             else:
                 self.status_label.setText("Cleaning failed")
                 QMessageBox.critical(self, "Error", "Cleaning failed")
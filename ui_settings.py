@@ -57,7 +57,7 @@ class SettingsMenu(tk.Frame):
                 new_volumes = {}
                 for k, (t, r) in entries.items():
                     total_val = int(t.get())
-                    remaining_val = int(r.get())
+                    remaining_val = float(r.get())
                     if total_val < 0 or remaining_val < 0 or remaining_val > total_val:
                         raise ValueError(f"Invalid values for Hose {k}")
                     new_volumes[k] = {'total_volume_ml': total_val, 'remaining_volume_ml': remaining_val}
@@ -115,7 +115,7 @@ class SettingsWindow(QDialog):
             new_volumes = {}
             for k, (t, r) in entries.items():
                 total_val = int(t.text())
-                remaining_val = int(r.text())
+                remaining_val = float(r.text())
                 if total_val < 0 or remaining_val < 0 or remaining_val > total_val:
                     raise ValueError(f"Invalid values for Hose {k}")
                 new_volumes[k] = {'total_volume_ml': total_val, 'remaining_volume_ml': remaining_val}
@@ -0,0 +1,125 @@
+# volume_forecast.py
+import logging
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from config_manager import bottle_volumes_snapshot
+from dispense_plan import compile_plan
+
+# Rounding slack so a bottle holding exactly what the queue needs is not reported short
+EPSILON_ML = 1e-6
+
+class VolumeForecast:
+    """What a run of queued orders will take out of every bottle, before any of them is poured.
+
+    orders is [(order_id, drink_id, size_ml), ...] in the order they will
+    be poured, and positions their queue positions (default 1, 2, ...).
+    Each order's cached dispense plan becomes one row of an orders x hoses
+    consumption matrix, after the failover it will get from the levels the
+    orders before it leave behind. The running total down each column is
+    compared with the bottle's remaining volume, so one pass finds, for every
+    bottle, the first order that would run it dry. Uses NumPy when it is
+    installed and plain Python otherwise.
+    """
+    def __init__(self, orders, bottle_volumes=None, positions=None):
+        if bottle_volumes is None:
+            bottle_volumes = bottle_volumes_snapshot()
+        self.order_ids = [order_id for order_id, _, _ in orders]
+        self.positions = list(positions) if positions is not None else list(range(1, len(orders) + 1))
+        plans = self._with_failover([compile_plan(drink_id, size_ml) for _, drink_id, size_ml in orders],
+                                    bottle_volumes)
+        hose_ids = set(bottle_volumes)
+        self.ingredients = {}
+        for compiled in plans:
+            for pour in compiled.pours if compiled is not None else ():
+                hose_ids.add(pour.pump_id)
+                self.ingredients.setdefault(pour.pump_id, pour.ingredient)
+        self.hose_ids = sorted(hose_ids)
+        column = {hose_id: j for j, hose_id in enumerate(self.hose_ids)}
+        # A hose with no bottle record counts as empty, as it does when pouring
+        self.remaining = [float(bottle_volumes.get(hose_id, {}).get('remaining_volume_ml', 0))
+                          for hose_id in self.hose_ids]
+        self.rows = []
+        for compiled in plans:
+            row = [0.0] * len(self.hose_ids)
+            for pour in compiled.pours if compiled is not None else ():
+                row[column[pour.pump_id]] += pour.volume_ml
+            self.rows.append(row)
+        if np is not None:
+            self.pourable_now, first = self._solve_numpy()
+        else:
+            self.pourable_now, first = self._solve_python()
+        self.exhaustions = sorted(
+            ({'order_id': self.order_ids[i], 'position': self.positions[i], 'hose_id': self.hose_ids[j],
+              'ingredient': self.ingredients.get(self.hose_ids[j], ''),
+              'needed_ml': round(sum(row[j] for row in self.rows[:i + 1]), 1),
+              'remaining_ml': round(self.remaining[j], 1)}
+             for j, i in first.items()),
+            key=lambda e: (e['position'], e['hose_id']))
+
+    @staticmethod
+    def _with_failover(plans, bottle_volumes):
+        """plans with low bottles failed over to sibling hoses, as each will be poured after the ones before it"""
+        left = {hose_id: bottle.get('remaining_volume_ml', 0) for hose_id, bottle in bottle_volumes.items()}
+        adjusted = []
+        for compiled in plans:
+            if compiled is not None:
+                levels = {hose_id: {'remaining_volume_ml': ml} for hose_id, ml in left.items()}
+                compiled = compiled.with_failover(levels)
+                for pour in compiled.pours:
+                    left[pour.pump_id] = left.get(pour.pump_id, 0) - pour.volume_ml
+            adjusted.append(compiled)
+        return adjusted
+
+    def _solve_numpy(self):
+        """Returns ([order can be poured now], {column: first row that overdraws it})"""
+        if not self.rows:
+            return [], {}
+        consumption = np.array(self.rows, dtype=float)
+        remaining = np.array(self.remaining, dtype=float) + EPSILON_ML
+        pourable = (consumption <= remaining).all(axis=1)
+        overdrawn = np.cumsum(consumption, axis=0) > remaining
+        hit = overdrawn.any(axis=0)
+        first_row = overdrawn.argmax(axis=0)
+        return pourable.tolist(), {int(j): int(first_row[j]) for j in np.flatnonzero(hit)}
+
+    def _solve_python(self):
+        pourable = [all(v <= r + EPSILON_ML for v, r in zip(row, self.remaining)) for row in self.rows]
+        first = {}
+        totals = [0.0] * len(self.hose_ids)
+        for i, row in enumerate(self.rows):
+            for j, volume in enumerate(row):
+                totals[j] += volume
+                if j not in first and totals[j] > self.remaining[j] + EPSILON_ML:
+                    first[j] = i
+        return pourable, first
+
+    @property
+    def first_exhaustion(self):
+        """The earliest bottle to run dry as {'order_id', 'position', 'hose_id', ...}, or None"""
+        return self.exhaustions[0] if self.exhaustions else None
+
+    def short_orders(self):
+        """order_id -> ingredients whose bottle runs dry at or before that order"""
+        short = {}
+        for e in self.exhaustions:
+            for order_id in self.order_ids[self.order_ids.index(e['order_id']):]:
+                short.setdefault(order_id, []).append(e['ingredient'])
+        return short
+
+def forecast_queue(orders, bottle_volumes=None):
+    """VolumeForecast for queue entries or Order objects (anything with order_id, drink_id, size and servings).
+
+    Queue entries keep their own position, so the order being poured
+    (position 0, not yet booked against the bottles) can be included.
+    """
+    def field(order, name, default=None):
+        return order.get(name, default) if isinstance(order, dict) else getattr(order, name, default)
+    forecast = VolumeForecast([(field(o, 'order_id'), field(o, 'drink_id'), field(o, 'size') * field(o, 'servings', 1))
+                               for o in orders], bottle_volumes,
+                              [field(o, 'position', i + 1) for i, o in enumerate(orders)])
+    if forecast.first_exhaustion is not None:
+        e = forecast.first_exhaustion
+        logging.debug(f"Hose {e['hose_id']} ({e['ingredient']}) runs dry at order {e['order_id']}")
+    return forecast
@@ -0,0 +1,148 @@
+# volume_ledger.py
+import logging
+from threading import Lock
+from types import MappingProxyType
+from state_store import AppendLog, file_lock, load_json, save_json, file_signature
+
+class VolumeLedger:
+    """Bottle levels kept as a JSON snapshot plus an append-only consumption log.
+
+    Every pour appends one short "hose_id ml" line instead of rewriting the
+    snapshot, and every bottle swap a "hose_id refill ml" line. Current
+    levels are held in memory and brought up to date by replaying only the
+    bytes appended since the last read, so a level query is two stat() calls
+    and a dict lookup. Once compact_every entries have piled up, the levels
+    are written back into the snapshot and the log is truncated.
+    """
+    def __init__(self, snapshot_file, ledger_file, compact_every=200):
+        self.snapshot_file = snapshot_file
+        self.ledger_file = ledger_file
+        self.compact_every = compact_every
+        self._lock = Lock()
+        self._levels = {}
+        self._frozen = None
+        self._snapshot_sig = False  # never equal to a real signature or None
+        self._log = AppendLog(ledger_file)
+        self._entries = 0
+
+    def _load_snapshot(self):
+        levels = {}
+        for k, v in load_json(self.snapshot_file, {}).items():
+            try:
+                levels[int(k)] = {
+                    'total_volume_ml': int(v.get('total_volume_ml', 0)),
+                    'remaining_volume_ml': float(v.get('remaining_volume_ml', 0))
+                }
+            except Exception as e:
+                logging.error(f"Error processing bottle volume for hose {k}: {e}")
+        return levels
+
+    def _apply(self, line):
+        fields = line.split()
+        refill = len(fields) == 3 and fields[1] == 'refill'
+        try:
+            hose_id, amount = (fields[0], fields[2]) if refill else fields
+            hose_id, amount = int(hose_id), float(amount)
+        except ValueError:
+            logging.error(f"Skipping malformed ledger entry {line!r}")
+            return
+        if refill:
+            self._levels[hose_id] = {'total_volume_ml': int(amount), 'remaining_volume_ml': amount}
+        else:
+            bottle = self._levels.get(hose_id)
+            if bottle is not None:
+                bottle['remaining_volume_ml'] = round(max(0.0, bottle['remaining_volume_ml'] - amount), 3)
+        self._entries += 1
+
+    def _sync(self):
+        """Brings the in-memory levels up to date with the files. Caller holds self._lock"""
+        snapshot_sig = file_signature(self.snapshot_file)
+        if snapshot_sig != self._snapshot_sig:
+            # The log holds what was poured since this snapshot, so it is replayed from the start
+            self._snapshot_sig = snapshot_sig
+            self._log.restart()
+        restarted, lines = self._log.read()
+        if restarted:
+            # Snapshot rewritten or log compacted (possibly by another process)
+            self._levels = self._load_snapshot()
+            self._entries = 0
+            self._frozen = None
+        for line in lines:
+            self._apply(line)
+        if lines:
+            self._frozen = None
+
+    def _append(self, lines):
+        """Appends ledger lines and compacts if due. Caller holds neither lock"""
+        # file_lock spans the whole update so another process cannot append between sync and compaction
+        with self._lock, file_lock:
+            self._sync()
+            self._log.append(lines)
+            self._sync()
+            if self._entries >= self.compact_every:
+                logging.info(f"Compacting bottle ledger after {self._entries} entries")
+                self._write_snapshot()
+
+    def _write_snapshot(self):
+        """Folds the log into the snapshot and truncates it. Caller holds self._lock and file_lock"""
+        save_json({str(k): v for k, v in self._levels.items()}, self.snapshot_file)
+        self._log.truncate()
+        self._snapshot_sig = file_signature(self.snapshot_file)
+        self._entries = 0
+        self._frozen = None
+
+    def consume(self, hose_id, amount_ml):
+        """Books amount_ml as poured from hose_id"""
+        self.consume_many({hose_id: amount_ml})
+
+    def consume_many(self, amounts):
+        """Books {hose_id: amount_ml} with a single ledger write, e.g. everything one pour took"""
+        for amount_ml in amounts.values():
+            if not isinstance(amount_ml, (int, float)) or amount_ml < 0:
+                raise ValueError("Dispensed volume must be a non-negative number")
+        if not amounts:
+            return
+        self._append(f"{int(hose_id)} {amount_ml:.3f}\n" for hose_id, amount_ml in amounts.items())
+
+    def refill(self, hose_id, volume_ml):
+        """Books a full bottle of volume_ml on hose_id, e.g. after a bottle swap.
+
+        Appended to the log like a pour, so consumption booked concurrently by
+        another process is not lost the way it would be by a reset().
+        """
+        if not isinstance(volume_ml, (int, float)) or volume_ml < 0:
+            raise ValueError("Bottle volume must be a non-negative number")
+        self._append([f"{int(hose_id)} refill {volume_ml:.3f}\n"])
+
+    def remaining(self, hose_id):
+        """Returns the remaining millilitres in hose_id's bottle"""
+        with self._lock:
+            self._sync()
+            bottle = self._levels.get(hose_id)
+            return bottle['remaining_volume_ml'] if bottle else 0.0
+
+    def snapshot(self):
+        """Read-only {hose_id: {'total_volume_ml', 'remaining_volume_ml'}} view"""
+        with self._lock:
+            self._sync()
+            if self._frozen is None:
+                self._frozen = MappingProxyType({k: MappingProxyType(dict(v)) for k, v in self._levels.items()})
+            return self._frozen
+
+    def reset(self, volumes):
+        """Replaces all levels, e.g. after a bottle swap or manual edit"""
+        with self._lock, file_lock:
+            self._levels = {
+                int(k): {
+                    'total_volume_ml': int(v.get('total_volume_ml', 0)),
+                    'remaining_volume_ml': float(v.get('remaining_volume_ml', 0))
+                }
+                for k, v in volumes.items()
+            }
+            self._write_snapshot()
+
+    def compact(self):
+        with self._lock, file_lock:
+            self._sync()
+            if self._entries:
+                self._write_snapshot()